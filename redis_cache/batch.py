@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+from django.utils.datastructures import SortedDict
+
+from redis.exceptions import RedisError, ResponseError
+from .util import parallel_map
+
+_missing = object()
+
+
+class BatchResult(object):
+    """
+    Placeholder for the result of an operation queued in a ``Batch``,
+    available in ``value`` once the batch has been executed. Errors of
+    the operation (such as ``ValueError`` incrementing a missing key) are
+    raised when reading ``value``.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._value = None
+        self._error = None
+
+    def _resolve(self, resolve, raw):
+        try:
+            self._value = resolve(raw)
+        except Exception as e:
+            self._error = e
+        self.ready = True
+
+    @property
+    def value(self):
+        if not self.ready:
+            raise ValueError("The batch has not been executed yet")
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def __repr__(self):
+        if not self.ready:
+            return "<BatchResult: pending>"
+        return "<BatchResult: %r>" % (self._error or self._value,)
+
+
+def _raise_errors(raw):
+    if isinstance(raw, Exception):
+        raise raw
+    return raw
+
+
+def _to_bool(raw):
+    return bool(_raise_errors(raw))
+
+
+def _to_none(raw):
+    _raise_errors(raw)
+
+
+def _check_all(results):
+    for result in results:
+        result.value
+
+
+class Batch(object):
+    """
+    Queue of cache operations executed with a single pipeline per node,
+    all nodes concurrently, when leaving the ``with`` block (or calling
+    ``execute``)::
+
+        with cache.batch() as batch:
+            user = batch.get('user:1')
+            batch.set('seen:1', True)
+            hits = batch.incr('hits')
+
+        user.value, hits.value
+
+    Operations return a ``BatchResult``. If the block raises, nothing is
+    sent to redis.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._queues = SortedDict()
+        self._composites = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+        else:
+            self._queues = SortedDict()
+            self._composites = []
+
+    def _queue(self, key, command, resolve):
+        """
+        ``command(pipeline)`` queues the operation in the pipeline of the
+        node of ``key``, ``resolve(raw)`` turns the reply of its first
+        command (or the return value of ``command`` if it does not queue
+        any) into the result.
+        """
+        result = BatchResult()
+        name = self.cache.get_server_name(key)
+        if name not in self._queues:
+            self._queues[name] = (self.cache.get_server(key), [])
+        self._queues[name][1].append((command, resolve, result))
+        return result
+
+    def _composite(self, results, resolve):
+        result = BatchResult()
+        self._composites.append((result, results, resolve))
+        return result
+
+    def get(self, key, default=None, version=None):
+        cache = self.cache
+        key = cache.make_key(key, version=version)
+
+        def unpickle(raw):
+            if cache._unexpired(raw) is None:
+                return default
+            return cache.unpickle(raw)
+
+        local = cache.local_cache
+        if local is not None:
+            local.listen(cache.get_servers)
+            raw = local.get(str(key))
+            if raw is not None:
+                result = BatchResult()
+                result._resolve(unpickle, raw)
+                return result
+
+        def resolve(raw):
+            _raise_errors(raw)
+            if local is not None:
+                local.record_remote(raw is not None and 1 or 0, raw is None and 1 or 0)
+                if raw is not None:
+                    local.set(str(key), raw)
+            return unpickle(raw)
+
+        return self._queue(key, lambda pipeline: pipeline.get(key), resolve)
+
+    def get_many(self, keys, version=None):
+        results = [(key, self.get(key, _missing, version=version)) for key in keys]
+
+        def resolve(results):
+            return SortedDict((key, result.value) for key, result in results
+                                                if result.value is not _missing)
+        return self._composite(results, resolve)
+
+    def set(self, key, value, timeout=None, version=None, nx=False):
+        cache = self.cache
+        key = cache.make_key(key, version=version)
+        if timeout is None:
+            timeout = cache.default_timeout
+        return self._set_raw(key, cache.pickle(value), timeout, nx=nx)
+
+    def _set_raw(self, key, raw, timeout, nx=False):
+        cache = self.cache
+        return self._queue(key, lambda pipeline: cache._set(key, raw, int(timeout),
+                                            pipeline, nx=nx), _to_bool)
+
+    def add(self, key, value, timeout=None, version=None):
+        return self.set(key, value, timeout, version=version, nx=True)
+
+    def set_many(self, data, timeout=None, version=None):
+        results = [self.set(key, value, timeout, version=version)
+                        for key, value in data.iteritems()]
+        return self._composite(results, _check_all)
+
+    def _lock(self, key, token, timeout):
+        return self._queue(key, lambda pipeline: pipeline.set(key, token, nx=True,
+                                                px=int(timeout * 1000)), _to_bool)
+
+    def _unlock(self, key, token):
+        cache = self.cache
+        return self._queue(key, lambda pipeline: cache._unlock_script(keys=[key],
+                                                args=[token], client=pipeline), _to_bool)
+
+    def _rename(self, key, new_key):
+        cache = self.cache
+
+        def command(pipeline):
+            cache._rename_script(keys=[key, new_key], client=pipeline)
+            if cache.local_cache is not None:
+                cache.local_cache.invalidate(pipeline, [key, new_key])
+            cache._track_copies(pipeline, [key, new_key])
+
+        return self._queue(key, command, _to_bool)
+
+    def _dump(self, key):
+        cache = self.cache
+        return self._queue(key, lambda pipeline: cache._dump_script(keys=[key],
+                                                client=pipeline), _raise_errors)
+
+    def _restore(self, key, value, ttl):
+        cache = self.cache
+
+        def command(pipeline):
+            # PTTL is -1 for keys without expiration, 0 for RESTORE.
+            pipeline.restore(key, max(ttl, 0), value, replace=True)
+            if cache.local_cache is not None:
+                cache.local_cache.invalidate(pipeline, [key])
+            cache._track_copies(pipeline, [key])
+
+        return self._queue(key, command, _to_none)
+
+    def delete(self, key, version=None):
+        cache = self.cache
+        key = cache.make_key(key, version=version)
+
+        def command(pipeline):
+            pipeline.delete(key)
+            if cache.local_cache is not None:
+                cache.local_cache.invalidate(pipeline, [key])
+            cache._track_copies(pipeline, [key])
+
+        return self._queue(key, command, _to_none)
+
+    def delete_many(self, keys, version=None):
+        results = [self.delete(key, version=version) for key in keys]
+        return self._composite(results, _check_all)
+
+    def has_key(self, key, version=None):
+        cache = self.cache
+        key = cache.make_key(key, version=version)
+        return self._queue(key, lambda pipeline: cache._get_header(key, pipeline),
+                            lambda raw: cache._unexpired(_raise_errors(raw) or None) is not None)
+
+    def incr(self, key, delta=1, version=None):
+        cache = self.cache
+        key = cache.make_key(key, version=version)
+
+        def command(pipeline):
+            cache._incr_script(keys=[key], args=[delta], client=pipeline)
+            if cache.local_cache is not None:
+                cache.local_cache.invalidate(pipeline, [key])
+            cache._track_copies(pipeline, [key])
+
+        def resolve(raw):
+            if isinstance(raw, ResponseError):
+                # Not a native redis integer, fall back to get and set.
+                return cache.incr(key, delta)
+            if _raise_errors(raw) is None:
+                raise ValueError("Key '%s' not found" % key)
+            return raw
+
+        return self._queue(key, command, resolve)
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version=version)
+
+    def execute(self):
+        """
+        Send all queued operations and resolve their results.
+        """
+        queues, self._queues = self._queues, SortedDict()
+        composites, self._composites = self._composites, []
+
+        # Copies of hot keys (see ShardedRedisCache) written or dropped by
+        # the operations, sent once all nodes are done.
+        copies = []
+        parallel_map(self._execute_node, [(client, operations, copies)
+                                            for client, operations in queues.values()])
+        if copies:
+            self.cache._write_copies(copies)
+
+        for result, results, resolve in composites:
+            result._resolve(resolve, results)
+
+    def _execute_node(self, client, operations, copies):
+        pipeline = client.pipeline(transaction=False)
+        pipeline._copy_collector = copies
+
+        replies = []
+        for command, resolve, result in operations:
+            position = len(pipeline.command_stack)
+            returned = command(pipeline)
+            replies.append((len(pipeline.command_stack) > position, position, returned))
+
+        # execute() empties the command stack, even when it fails.
+        queued = len(pipeline.command_stack)
+        try:
+            results = pipeline.execute(raise_on_error=False)
+        except RedisError as e:
+            results = [e] * queued
+
+        for (command, resolve, result), (queued, position, returned) in zip(operations, replies):
+            if queued:
+                result._resolve(resolve, results[position])
+            else:
+                result._resolve(resolve, returned)
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Circuit breakers for the nodes of the cache, enabled with the
+``CIRCUIT_BREAKER`` option. Every node has a breaker, shared by all the
+caches of the process using it, that tracks the calls failing to reach
+the node (or taking too long). When too many fail, the circuit opens and
+calls fail immediately, without waiting for timeouts, until a cooldown
+passes and a single call probes the node again.
+
+With the breaker enabled the cache fails open: reads of an unreachable
+node are misses and writes are no-ops, instead of raising.
+"""
+
+from __future__ import absolute_import
+
+from collections import deque
+
+from redis.exceptions import ConnectionError, TimeoutError
+
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(ConnectionError):
+    """
+    Raised instead of calling a node while its circuit is open.
+    """
+
+
+class CircuitBreaker(object):
+    """
+    The circuit opens when, in the last ``window`` seconds, at least
+    ``min_calls`` calls were made and ``failure_rate`` of them failed to
+    connect, timed out or (if ``slow_call`` is given) took more than
+    ``slow_call`` seconds. After ``cooldown`` seconds it half-opens: one
+    call at a time goes through, closing the circuit if it succeeds and
+    opening it again if not.
+    """
+
+    def __init__(self, name, failure_rate=0.5, min_calls=5, window=10, slow_call=None,
+                    cooldown=5):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.slow_call = slow_call
+        self.cooldown = cooldown
+
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.opened_at = None
+        self.opened = 0
+        self.rejected = 0
+        self._probing = False
+        # [second, calls, failures], for the seconds of the window.
+        self._buckets = deque()
+
+    def allow(self):
+        """
+        Returns True if a call can go through, False if it must fail.
+        """
+        if self.state == CLOSED:
+            return True
+
+        with self._lock:
+            if self.state == OPEN:
+                if time.time() - self.opened_at < self.cooldown:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    self.rejected += 1
+                    return False
+                self._probing = True
+            return True
+
+    def record(self, duration, failed):
+        """
+        Record the outcome of a call allowed by ``allow``.
+        """
+        if self.slow_call is not None and duration > self.slow_call:
+            failed = True
+
+        now = time.time()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    self._probing = False
+                    if failed:
+                        self._open(now)
+                    else:
+                        self._close()
+                return
+
+            if self.state == OPEN:
+                # Calls started before the circuit opened.
+                return
+
+            second = int(now)
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append([second, 0, 0])
+            self._buckets[-1][1] += 1
+            self._buckets[-1][2] += failed and 1 or 0
+
+            calls, failures = self._counts(second)
+            if failures and calls >= self.min_calls and failures >= calls * self.failure_rate:
+                self._open(now)
+
+    def _counts(self, second):
+        while self._buckets and self._buckets[0][0] <= second - self.window:
+            self._buckets.popleft()
+        return (sum(bucket[1] for bucket in self._buckets),
+                sum(bucket[2] for bucket in self._buckets))
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.opened += 1
+
+    def _close(self):
+        self.state = CLOSED
+        self.opened_at = None
+        self._buckets.clear()
+
+    def snapshot(self):
+        with self._lock:
+            calls, failures = self._counts(int(time.time()))
+            return {
+                'state': self.state,
+                'opened_at': self.opened_at,
+                'calls': calls,
+                'failures': failures,
+                'opened': self.opened,
+                'rejected': self.rejected,
+            }
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name, **options):
+    """
+    Returns the breaker of the node ``name``, created with ``options`` on
+    first use.
+    """
+    breaker = _registry.get(name)
+    if breaker is None:
+        with _registry_lock:
+            breaker = _registry.setdefault(name, CircuitBreaker(name, **options))
+    return breaker
+
+
+def all_breakers():
+    return [_registry[name] for name in sorted(_registry)]
+
+
+def protect_client(client, breaker):
+    """
+    Pass every command and pipeline sent by ``client`` through
+    ``breaker``, wrapping its methods in place. Calls rejected by the
+    breaker raise ``CircuitOpenError``.
+    """
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    def call(func, *args, **kwargs):
+        if not breaker.allow():
+            raise CircuitOpenError("Circuit open for %s" % breaker.name)
+
+        start = time.time()
+        failed = False
+        try:
+            return func(*args, **kwargs)
+        except (ConnectionError, TimeoutError):
+            failed = True
+            raise
+        finally:
+            breaker.record(time.time() - start, failed)
+
+    def protected_execute_command(*args, **options):
+        return call(execute_command, *args, **options)
+
+    def protected_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+        pipe.execute = lambda *args, **kwargs: call(execute, *args, **kwargs)
+        return pipe
+
+    client.breaker = breaker
+    client.execute_command = protected_execute_command
+    client.pipeline = protected_pipeline
+    return client
+
+
+# Replies of the cache commands when the node is unreachable: misses for
+# reads, nothing done for writes.
+_FALLBACK_REPLIES = {
+    'GET': None,
+    'EXISTS': False,
+    'GETRANGE': '',
+    'TTL': -2,
+    'PTTL': -2,
+    'SCAN': (0, []),
+    'SET': None,
+    'DEL': 0,
+    'RESTORE': None,
+    'FLUSHDB': True,
+    'PUBLISH': 0,
+    # Scripts: increments of missing keys, nothing to rename or dump.
+    'EVALSHA': None,
+}
+
+
+def _fallback_replies(commands):
+    """
+    Returns the fallback replies of ``commands`` (lists of arguments),
+    None if some of them has no fallback.
+    """
+    replies = []
+    for args in commands:
+        command = str(args[0]).upper()
+        if command == 'MGET':
+            replies.append([None] * (len(args) - 1))
+        elif command in _FALLBACK_REPLIES:
+            replies.append(_FALLBACK_REPLIES[command])
+        else:
+            return None
+    return replies
+
+
+def fail_open(client):
+    """
+    Make the cache commands of ``client`` return the reply of a miss, or
+    of a write not done, when the node can not be reached (or its circuit
+    is open), wrapping its methods in place. Other commands (``INFO``,
+    ``PING``...) still raise.
+    """
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    def fail_open_execute_command(*args, **options):
+        try:
+            return execute_command(*args, **options)
+        except (ConnectionError, TimeoutError):
+            replies = _fallback_replies([args])
+            if replies is None:
+                raise
+            return replies[0]
+
+    def fail_open_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        def fail_open_execute(*args, **kwargs):
+            commands = [command_args for command_args, options in pipe.command_stack]
+            try:
+                return execute(*args, **kwargs)
+            except (ConnectionError, TimeoutError):
+                replies = _fallback_replies(commands)
+                if replies is None:
+                    raise
+                return replies
+
+        pipe.execute = fail_open_execute
+        return pipe
+
+    client.execute_command = fail_open_execute_command
+    client.pipeline = fail_open_pipeline
+    return client
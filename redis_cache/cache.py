@@ -6,24 +6,159 @@ from django.core.cache.backends.base import BaseCache, InvalidCacheBackendError
 from django.core.exceptions import ImproperlyConfigured
 from django.utils.encoding import smart_unicode, smart_str
 from django.utils.datastructures import SortedDict
-from django.utils import importlib
-
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
+from django.utils import six
 
 from collections import defaultdict
+from itertools import chain, islice
 
 from redis import Redis
 from redis.connection import DefaultParser
-from .util import CacheKey, ConnectionPoolHandler
-
+from redis.exceptions import ConnectionError, ResponseError
+from .util import CacheKey, ConnectionPoolHandler, load_class, parallel_map
+from .local import LocalCache
+from .batch import Batch
+from .metrics import get_metrics, instrument_client, instrument_serialization
+from .cluster import CLUSTER_SLOTS, ClusterNodeRedis, key_slot
+from .replicas import ReplicaRedis
+from .breaker import HALF_OPEN, OPEN, fail_open, get_breaker, protect_client
+from .hotkeys import get_hot_keys
+from .compressors import decompress
+
+import fnmatch
+import math
+import random
 import re
+import struct
+import time
+import uuid
+
+# Increment a counter only if it exists, in a single round trip. With a
+# channel and message (ARGV[2] and ARGV[3]) it publishes the invalidation
+# of the local caches too. With the copies marker of the key (KEYS[2], see
+# ShardedRedisCache) it deletes it, returning the value and whether it
+# existed.
+_incr_script = """
+if redis.call('exists', KEYS[1]) == 1 then
+    local value = redis.call('incrby', KEYS[1], ARGV[1])
+    if ARGV[2] then
+        redis.call('publish', ARGV[2], ARGV[3])
+    end
+    if KEYS[2] then
+        return {value, redis.call('del', KEYS[2])}
+    end
+    return value
+end
+return false
+"""
+
+# Release a lock only if it is still owned by the caller.
+_unlock_script = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Move a value to a key of the same node keeping its ttl, returns 0 if
+# the key does not exist (instead of the error of RENAME).
+_rename_script = """
+if redis.call('exists', KEYS[1]) == 1 then
+    redis.call('rename', KEYS[1], KEYS[2])
+    return 1
+end
+return 0
+"""
+
+# Serialized value and remaining ttl (milliseconds) of a key, to move it
+# to another node with RESTORE.
+_dump_script = """
+local value = redis.call('dump', KEYS[1])
+if value then
+    return {value, redis.call('pttl', KEYS[1])}
+end
+return false
+"""
+
+# Marker for values stored by the primitive types fast path. Integers
+# are stored as plain strings (so INCRBY works on them), floats and byte
+# strings are stored behind this marker, never passing by the serializer.
+# Compressed values are stored behind it too, followed by their codec.
+_FASTPATH_MARKER = '\x00'
+_FLOAT_PREFIX = _FASTPATH_MARKER + 'f'
+_BYTES_PREFIX = _FASTPATH_MARKER + 'b'
+_COMPRESSED_PREFIX = _FASTPATH_MARKER + 'z'
+
+# Values stored by get_or_set carry a header with the seconds they took
+# to compute and their logical expiration time (0 for never).
+_XFETCH_PREFIX = _FASTPATH_MARKER + 'x'
+_xfetch_header = struct.Struct('>dd')
+_XFETCH_HEADER_END = len(_XFETCH_PREFIX) + _xfetch_header.size
+
+# Seconds between reads while waiting for a value computed by others.
+_WAIT_INTERVAL = 0.05
+
+# Copies of hot keys (see ``HOT_KEY_PATTERNS``) are stored under their key
+# with this prefix, which keeps them out of ``keys`` and ``iter_keys``. In
+# the node of the key itself, that name is the marker of a key that may
+# have copies.
+_HOT_COPY_PREFIX = '_hot:'
+# Max seconds of the copies, and of their marker, so a copy missing a
+# write racing with it is not stale for longer.
+_HOT_COPY_TTL = 60
+
+# (pool argument, option, type) of the connection pool settings.
+def _boolean(value):
+    """
+    Parse a boolean option, also given as a string as in environment
+    based settings, where ``bool('False')`` would be true.
+    """
+    if isinstance(value, six.string_types):
+        try:
+            return _BOOLEANS[value.strip().lower()]
+        except KeyError:
+            raise ValueError(value)
+    if value not in (True, False):
+        raise ValueError(value)
+    return bool(value)
+
+_BOOLEANS = {'true': True, 'yes': True, 'on': True, '1': True,
+             'false': False, 'no': False, 'off': False, '0': False}
+
+_POOL_OPTIONS = (
+    ('max_connections', 'MAX_CONNECTIONS', int),
+    ('blocking', 'BLOCKING_POOL', _boolean),
+    ('blocking_timeout', 'BLOCKING_POOL_TIMEOUT', float),
+    ('socket_timeout', 'SOCKET_TIMEOUT', float),
+    ('socket_connect_timeout', 'SOCKET_CONNECT_TIMEOUT', float),
+    ('socket_keepalive', 'SOCKET_KEEPALIVE', _boolean),
+    ('health_check_interval', 'HEALTH_CHECK_INTERVAL', float),
+    ('prewarm', 'POOL_PREWARM', int),
+)
+
+# Options of the read routing to replicas, see ``replicas.ReplicaRedis``.
+_REPLICA_OPTIONS = (
+    ('max_lag', 'REPLICA_MAX_LAG', float),
+    ('check_interval', 'REPLICA_CHECK_INTERVAL', float),
+    ('retry_interval', 'REPLICA_RETRY_INTERVAL', float),
+)
+
+# Options of the circuit breakers, see ``breaker.CircuitBreaker``.
+_BREAKER_OPTIONS = (
+    ('failure_rate', 'CIRCUIT_BREAKER_FAILURE_RATE', float),
+    ('min_calls', 'CIRCUIT_BREAKER_MIN_CALLS', int),
+    ('window', 'CIRCUIT_BREAKER_WINDOW', int),
+    ('slow_call', 'CIRCUIT_BREAKER_SLOW_CALL', float),
+    ('cooldown', 'CIRCUIT_BREAKER_COOLDOWN', float),
+)
+
+# Options of the hot key detection, see ``hotkeys.HotKeys``.
+_HOT_KEYS_OPTIONS = (
+    ('sample_rate', 'HOT_KEYS_SAMPLE_RATE', float),
+    ('capacity', 'HOT_KEYS_CAPACITY', int),
+    ('window', 'HOT_KEYS_WINDOW', float),
+)
 
 class RedisCache(BaseCache):
-    _pickle_version = -1
-
     def __init__(self, server, params):
         """
         Connect to Redis, and set up cache backend.
@@ -31,9 +166,17 @@ class RedisCache(BaseCache):
         self._init(server, params)
 
     def _connect(self):
+        self._client = self._connect_node(self._server)
+        self._read_client = self._connect_replicas(self._server, self._client)
+        self._incr_script = self._client.register_script(_incr_script)
+        self._unlock_script = self._client.register_script(_unlock_script)
+        self._rename_script = self._client.register_script(_rename_script)
+        self._dump_script = self._client.register_script(_dump_script)
+
+    def _connect_location(self, location):
         unix_socket_path = None
-        if ':' in self._server:
-            host, port = self._server.split(':')
+        if ':' in location:
+            host, port = location.split(':')
             try:
                 port = int(port)
             except (ValueError, TypeError):
@@ -41,7 +184,7 @@ class RedisCache(BaseCache):
 
         else:
             host, port = None, None
-            unix_socket_path = self._server
+            unix_socket_path = location
 
         # parse database
         _db = self._params.get('db', self._options.get('DB', 1))
@@ -59,21 +202,84 @@ class RedisCache(BaseCache):
             'unix_socket_path': unix_socket_path,
         }
 
+        kwargs.update(self.pool_options)
         connection_pool = ConnectionPoolHandler()\
             .connection_pool(parser_class=self.parser_class, **kwargs)
-        self._client = Redis(connection_pool=connection_pool)
+        client = Redis(connection_pool=connection_pool)
+        return self._instrument(client, location)
+
+    def _instrument(self, client, location):
+        if self._metrics is not None:
+            instrument_client(client, self._metrics, location)
+        if self._options.get('CIRCUIT_BREAKER'):
+            protect_client(client, get_breaker(location,
+                                    **self._numeric_options(_BREAKER_OPTIONS)))
+        return client
+
+    def _connect_node(self, location):
+        """
+        Client of the primary server of a node. With the circuit breaker
+        enabled, the node being unreachable is a miss for reads, and a
+        no-op for writes.
+        """
+        client = self._connect_location(location)
+        if self._options.get('CIRCUIT_BREAKER'):
+            fail_open(client)
+        return client
+
+    def _bypassed(self, client):
+        """
+        Returns True if calls to the node of ``client`` are failing fast.
+        """
+        breaker = getattr(client, 'breaker', None)
+        return breaker is not None and breaker.state in (OPEN, HALF_OPEN)
+
+    def _replica_locations(self, location):
+        replicas = self._options.get('REPLICAS') or []
+        if isinstance(replicas, dict):
+            return replicas.get(location, [])
+        return replicas
+
+    def _connect_replicas(self, location, client):
+        """
+        Returns the client for the reads of the node ``location``, routed
+        to its replicas (``REPLICAS`` option) if it has any.
+        """
+        locations = self._replica_locations(location)
+        if not locations:
+            return client
+
+        replicas = [(name, self._connect_location(name)) for name in locations]
+        return ReplicaRedis(client, replicas, self.read_policy_class(),
+                            **self._numeric_options(_REPLICA_OPTIONS))
 
     def _init(self, server, params):
         super(RedisCache, self).__init__(params)
         self._server = server
         self._params = params
         self._options = params.get('OPTIONS', {})
+        self._serializer = self.serializer_class(self._options)
 
-        if "PICKLE_VERSION" in self._options:
-            try:
-                self._pickle_version = int(self._options['PICKLE_VERSION'])
-            except (ValueError, TypeError):
-                raise ImproperlyConfigured("PICKLE_VERSION value must be an integer")
+        compressor_class = self.compressor_class
+        self._compressor = compressor_class and compressor_class(self._options)
+        try:
+            self._compress_min_length = int(self._options.get('COMPRESS_MIN_LENGTH', 1024))
+        except (ValueError, TypeError):
+            raise ImproperlyConfigured("COMPRESS_MIN_LENGTH value must be an integer")
+
+        self._local = None
+        if 'LOCAL_CACHE' in self._options:
+            self._local = LocalCache(self._options['LOCAL_CACHE'])
+
+        self._metrics = None
+        if self._options.get('METRICS'):
+            self._metrics = get_metrics(self.metrics_name)
+            instrument_serialization(self, self._metrics)
+
+        self._hot_keys = None
+        if self._options.get('HOT_KEYS'):
+            self._hot_keys = get_hot_keys(self.hot_keys_name,
+                                    **self._numeric_options(_HOT_KEYS_OPTIONS))
 
         self._connect()
 
@@ -86,28 +292,71 @@ class RedisCache(BaseCache):
         """
         Adds delta to the cache version for the supplied key. Returns the
         new version.
-        """
-        if client is None:
-            client = self._client
 
+        The value is moved by the server keeping its ttl, never passing
+        by the client: renamed if both versions are in the same node (or
+        in ``client``, if given), dumped and restored if not.
+        """
         if version is None:
             version = self.version
 
-        old_key = self.make_key(key, version)
-        value = self.get(old_key, version=version, client=client)
-        ttl = client.ttl(old_key)
+        if client is None:
+            moved = self.incr_version_many([key], delta, version)
+        else:
+            old_key, new_key = self._version_keys(key, version, delta)
+            moved = self._rename_script(keys=[old_key, new_key], client=client)
+            if self._local is not None:
+                self._local.invalidate(client, [old_key, new_key])
+            self._drop_copies([old_key, new_key])
 
-        if value is None:
+        if not moved:
             raise ValueError("Key '%s' not found" % key)
+        return version + delta
+
+    def incr_version_many(self, keys, delta=1, version=None):
+        """
+        Same as ``incr_version`` for many keys, with a round trip per
+        node (three if some values move to another node). Returns the
+        list of keys that existed, and were moved.
+        """
+        if version is None:
+            version = self.version
 
+        pairs = [self._version_keys(key, version, delta) for key in keys]
+        map_keys = dict((old_key, key) for key, (old_key, new_key) in zip(keys, pairs))
+
+        renamed, dumped = [], []
+        with self.batch() as batch:
+            for old_key, new_key in pairs:
+                if self._same_node(old_key, new_key):
+                    renamed.append((old_key, batch._rename(old_key, new_key)))
+                else:
+                    dumped.append((old_key, new_key, batch._dump(old_key)))
+
+        moved = set(old_key for old_key, result in renamed if result.value)
+        dumped = [(old_key, new_key, result.value) for old_key, new_key, result in dumped
+                                                            if result.value is not None]
+        if dumped:
+            with self.batch() as batch:
+                restored = [batch._restore(new_key, value, ttl)
+                                for old_key, new_key, (value, ttl) in dumped]
+            for result in restored:
+                result.value
+
+            with self.batch() as batch:
+                for old_key, new_key, dump in dumped:
+                    batch.delete(old_key)
+            moved.update(old_key for old_key, new_key, dump in dumped)
+
+        return [map_keys[old_key] for old_key, new_key in pairs if old_key in moved]
+
+    def _version_keys(self, key, version, delta):
         if isinstance(key, CacheKey):
-            new_key = self.make_key(key.original_key(), version=version+delta)
-        else:
-            new_key = self.make_key(key, version=version+delta)
+            key = key.original_key()
+        return self.make_key(key, version), self.make_key(key, version + delta)
 
-        self.set(new_key, value, timeout=ttl)
-        self.delete(old_key, client=client)
-        return version + delta
+    def _same_node(self, key, other_key):
+        return True
 
     @property
     def password(self):
@@ -119,15 +368,44 @@ class RedisCache(BaseCache):
         if cls is None:
             return DefaultParser
 
-        mod_path, cls_name = cls.rsplit('.', 1)
-        try:
-            mod = importlib.import_module(mod_path)
-            parser_class = getattr(mod, cls_name)
-        except (AttributeError, ImportError):
-            raise ImproperlyConfigured("Could not find parser class '%s'" % parser_class)
-        except ImportError as e:
-            raise ImproperlyConfigured("Could not find module '%s'" % e)
-        return parser_class
+        return load_class(cls)
+
+    @property
+    def pool_options(self):
+        """
+        Connection pool and socket options, from ``OPTIONS``.
+        """
+        return self._numeric_options(_POOL_OPTIONS)
+
+    def _numeric_options(self, spec):
+        options = {}
+        for name, option, cast in spec:
+            value = self._options.get(option)
+            if value is not None:
+                try:
+                    options[name] = cast(value)
+                except (ValueError, TypeError):
+                    raise ImproperlyConfigured("%s value must be a %s" % (option,
+                                        cast is _boolean and 'boolean' or 'number'))
+        return options
+
+    @property
+    def read_policy_class(self):
+        cls = self._options.get('READ_POLICY', 'redis_cache.replicas.RoundRobinPolicy')
+        return load_class(cls)
+
+    @property
+    def serializer_class(self):
+        cls = self._options.get('SERIALIZER', 'redis_cache.serializers.PickleSerializer')
+        return load_class(cls)
+
+    @property
+    def compressor_class(self):
+        cls = self._options.get('COMPRESSOR', None)
+        if cls is None:
+            return None
+
+        return load_class(cls)
 
     def __getstate__(self):
         return {'params': self._params, 'server': self._server}
@@ -139,6 +417,135 @@ class RedisCache(BaseCache):
         for c in self._client.connection_pool._available_connections:
             c.disconnect()
 
+    def get_servers(self):
+        """
+        Returns the clients of all redis servers used by this cache.
+        """
+        return [self._client]
+
+    def get_servers_by_name(self):
+        """
+        Returns the clients of all redis servers, by server name.
+        """
+        return SortedDict([(self._server, self._client)])
+
+    def get_server_name(self, key):
+        return self._server
+
+    def get_server(self, key):
+        return self._client
+
+    def get_read_server(self, key):
+        """
+        Returns the client for reads of ``key``, which may be routed to
+        replicas.
+        """
+        return self._read_client
+
+    def pool_stats(self):
+        """
+        Returns the connection pool counters of every server (see
+        ``redis_cache.pool.ConnectionPool.stats``), by server name.
+        """
+        return {self._server: self._client.connection_pool.stats()}
+
+    def batch(self):
+        """
+        Returns a ``redis_cache.batch.Batch``, to send many operations
+        with one round trip per node.
+        """
+        return Batch(self)
+
+    @property
+    def metrics_name(self):
+        """
+        Name of the metrics of this cache: the ``METRICS`` option when it
+        is a string, or else the location of the cache.
+        """
+        name = self._options.get('METRICS')
+        if isinstance(name, basestring):
+            return name
+        return self._location_name()
+
+    def _location_name(self):
+        if isinstance(self._server, (tuple, list)):
+            return ",".join(isinstance(location, (tuple, list)) and location[0] or location
+                                for location in self._server)
+        return self._server
+
+    @property
+    def metrics(self):
+        """
+        The ``redis_cache.metrics.Metrics`` of this cache (see ``METRICS``
+        option), or None.
+        """
+        return self._metrics
+
+    @property
+    def hot_keys_name(self):
+        """
+        Name of the hot keys of this cache: the ``HOT_KEYS`` option when it
+        is a string, or else the location of the cache.
+        """
+        name = self._options.get('HOT_KEYS')
+        if isinstance(name, basestring):
+            return name
+        return self._location_name()
+
+    @property
+    def hot_keys(self):
+        """
+        The ``redis_cache.hotkeys.HotKeys`` of this cache (see ``HOT_KEYS``
+        option), or None.
+        """
+        return self._hot_keys
+
+    def _record_access(self, keys):
+        sampled = self._hot_keys.sample(keys)
+        if sampled:
+            self._hot_keys.record([(self.get_server_name(key), str(key)) for key in sampled])
+
+    # Copies of hot keys are only kept by ShardedRedisCache.
+    def _track_copies(self, pipeline, keys, value=None, timeout=0):
+        pass
+
+    def _write_copies(self, writes):
+        pass
+
+    def _drop_copies(self, keys):
+        pass
+
+    @property
+    def local_cache(self):
+        """
+        The in-process cache (see ``LOCAL_CACHE`` option), or None.
+        """
+        return self._local
+
+    def _get_raw_many(self, keys, fetch):
+        """
+        Returns the raw values of keys, looking up in the local cache first
+        and calling ``fetch(keys)`` for the ones not found there.
+        """
+        if self._local is None:
+            return fetch(keys)
+
+        self._local.listen(self.get_servers)
+        values = [self._local.get(str(key)) for key in keys]
+        missing = [index for index, value in enumerate(values) if value is None]
+        if not missing:
+            return values
+
+        fetched = fetch([keys[index] for index in missing])
+        for index, value in zip(missing, fetched):
+            if value is not None:
+                values[index] = value
+                self._local.set(str(keys[index]), value)
+
+        hits = len(fetched) - fetched.count(None)
+        self._local.record_remote(hits, len(fetched) - hits)
+        return values
+
     def add(self, key, value, timeout=None, version=None, client=None):
         """
         Add a value to the cache, failing if the key already exists.
@@ -150,11 +557,27 @@ class RedisCache(BaseCache):
             client = self._client
 
         key = self.make_key(key, version=version)
+        if timeout is None:
+            timeout = self.default_timeout
 
-        if client.exists(key):
-            return False
+        return bool(self._set(key, self.pickle(value), int(timeout), client, nx=True))
+
+    def _add_many(self, items, timeout, pipeline):
+        for key, value in items:
+            self.add(key, value, timeout, client=pipeline)
+        return pipeline.execute()
+
+    def add_many(self, data, timeout=None, version=None):
+        """
+        Add a bunch of values in the cache at once, skipping the keys
+        that already exist, using a single pipeline.
 
-        return self.set(key, value, timeout, client=client)
+        Returns the list of keys that were actually added.
+        """
+        keys = data.keys()
+        items = [(self.make_key(key, version=version), data[key]) for key in keys]
+        results = self._add_many(items, timeout, self._client.pipeline())
+        return [key for key, added in zip(keys, results) if added]
 
     def get(self, key, default=None, version=None, client=None):
         """
@@ -163,35 +586,225 @@ class RedisCache(BaseCache):
         Returns unpickled value if key is found, the default if not.
         """
         if client is None:
-            client = self._client
+            client = self._read_client
 
         key = self.make_key(key, version=version)
-        value = client.get(key)
+        if self._hot_keys is not None:
+            self._record_access([key])
 
-        if value is None:
+        if self._local is None:
+            value = client.get(key)
+        else:
+            value, = self._get_raw_many([key], lambda keys: [client.get(keys[0])])
+
+        if self._unexpired(value) is None:
             return default
 
         return self.unpickle(value)
 
-    def _set(self, key, value, timeout, client):
+    def get_or_set(self, key, default, timeout=None, version=None, lock_timeout=10,
+                                                    stale_timeout=60, beta=1.0):
+        """
+        Returns the value of ``key``. If it is missing, ``default`` (or its
+        result, when callable) is stored and returned.
+
+        Only one caller at a time computes a missing or expired value,
+        holding a lock for up to ``lock_timeout`` seconds. The rest get
+        the expired value, kept ``stale_timeout`` more seconds, or wait
+        for the new one. Values are also recomputed in advance, with a
+        probability growing as the expiration approaches and with the
+        time they took to compute (XFetch). A higher ``beta`` recomputes
+        earlier, 0 disables it.
+        """
+        if timeout is None:
+            timeout = self.default_timeout
+
+        key = self.make_key(key, version=version)
+        client = self.get_server(key)
+        raw, = self._get_raw_many([key], lambda keys: [client.get(keys[0])])
+        if not self._should_recompute(raw, beta):
+            return self.unpickle(raw)
+
+        lock_key = self._lock_key(key)
+        lock_client = self.get_server(lock_key)
+        token = uuid.uuid4().hex
+        if not lock_client.set(lock_key, token, nx=True,
+                                                px=int(lock_timeout * 1000)):
+            # Nobody computes it if the node is down.
+            if raw is None and not self._bypassed(lock_client):
+                raw, = self._wait_for(lambda keys: [client.get(keys[0])], [key], lock_timeout)
+            if raw is not None:
+                return self.unpickle(raw)
+            token = None
+
+        try:
+            start = time.time()
+            value = default() if callable(default) else default
+            self._set(key, self._pickle_xfetch(value, time.time() - start, timeout),
+                        self._xfetch_timeout(timeout, stale_timeout), client)
+            return value
+        finally:
+            if token is not None:
+                self._unlock_script(keys=[lock_key], args=[token], client=lock_client)
+
+    def get_or_set_many(self, keys, default, timeout=None, version=None, lock_timeout=10,
+                                                    stale_timeout=60, beta=1.0):
+        """
+        Same as ``get_or_set`` for many keys. ``default`` is called with
+        the list of keys to compute and returns a dict with their values.
+        Returns a dict with the values of all keys.
+        """
+        if timeout is None:
+            timeout = self.default_timeout
+
+        new_keys = [self.make_key(key, version=version) for key in keys]
+        map_keys = dict(zip(new_keys, keys))
+
+        values = SortedDict()
+        expired = []
+        for key, raw in zip(new_keys, self._get_raw_many(new_keys, self._get_many)):
+            if self._should_recompute(raw, beta):
+                expired.append((key, raw))
+            else:
+                values[map_keys[key]] = self.unpickle(raw)
+
+        if not expired:
+            return values
+
+        token = uuid.uuid4().hex
+        with self.batch() as batch:
+            locks = [batch._lock(self._lock_key(key), token, lock_timeout)
+                        for key, raw in expired]
+
+        # Keys not computed by others (in time, or at all if their node
+        # is down) are computed without lock.
+        locked, waiting, missing = [], [], []
+        for (key, raw), lock in zip(expired, locks):
+            if lock.value:
+                locked.append(key)
+            elif raw is not None:
+                values[map_keys[key]] = self.unpickle(raw)
+            elif self._bypassed(self.get_server(self._lock_key(key))):
+                missing.append(key)
+            else:
+                waiting.append(key)
+
+        if waiting:
+            raws = self._wait_for(self._get_many, waiting, lock_timeout)
+            for key, raw in zip(waiting, raws):
+                if raw is None:
+                    missing.append(key)
+                else:
+                    values[map_keys[key]] = self.unpickle(raw)
+
+        if not locked and not missing:
+            return values
+
+        try:
+            start = time.time()
+            computed = default([map_keys[key] for key in locked + missing])
+            delta = time.time() - start
+
+            with self.batch() as batch:
+                for key in locked + missing:
+                    if map_keys[key] in computed:
+                        value = values[map_keys[key]] = computed[map_keys[key]]
+                        batch._set_raw(key, self._pickle_xfetch(value, delta, timeout),
+                                        self._xfetch_timeout(timeout, stale_timeout))
+        finally:
+            with self.batch() as batch:
+                for key in locked:
+                    batch._unlock(self._lock_key(key), token)
+        return values
+
+    def _lock_key(self, key):
+        return CacheKey(str(key) + ':lock')
+
+    def _wait_for(self, fetch, keys, wait):
+        """
+        Read ``keys`` with ``fetch`` until all of them exist, for up to
+        ``wait`` seconds.
+        """
+        deadline = time.time() + wait
+        while True:
+            time.sleep(_WAIT_INTERVAL)
+            raws = fetch(keys)
+            if None not in raws or time.time() > deadline:
+                return raws
+
+    def _xfetch_timeout(self, timeout, stale_timeout):
+        # Expired values are kept stale_timeout more seconds.
+        return timeout > 0 and int(timeout) + int(stale_timeout) or timeout
+
+    def _pickle_xfetch(self, value, delta, timeout):
+        expiry = timeout and time.time() + timeout or 0
+        return _XFETCH_PREFIX + _xfetch_header.pack(delta, expiry) + str(self.pickle(value))
+
+    def _unexpired(self, raw):
+        """
+        Returns ``raw``, or None if it is a value of ``get_or_set`` past
+        its expiration, kept only for ``get_or_set`` to serve while it is
+        recomputed.
+        """
+        if raw is not None and raw[:2] == _XFETCH_PREFIX:
+            expiry = _xfetch_header.unpack(raw[2:_XFETCH_HEADER_END])[1]
+            if expiry and expiry <= time.time():
+                return None
+        return raw
+
+    def _should_recompute(self, raw, beta):
+        if raw is None:
+            return True
+        if raw[:2] != _XFETCH_PREFIX:
+            return False
+
+        delta, expiry = _xfetch_header.unpack(raw[2:_XFETCH_HEADER_END])
+        if not expiry:
+            return False
+        return time.time() - delta * beta * math.log(1.0 - random.random()) >= expiry
+
+    def _write(self, client, keys, command):
+        """
+        Returns ``command(client)``. With the local cache, the invalidation
+        of ``keys`` goes in the same round trip: queued in ``client`` if it
+        is a pipeline, or else sent with the command in a new one.
+        """
+        if self._local is None:
+            return command(client)
+
+        if hasattr(client, 'command_stack'):
+            result = command(client)
+            self._local.invalidate(client, keys)
+            return result
+
+        pipeline = client.pipeline(transaction=False)
+        command(pipeline)
+        self._local.invalidate(pipeline, keys)
+        return pipeline.execute()[0]
+
+    def _set(self, key, value, timeout, client, nx=False):
         if timeout == 0:
-            return client.set(key, value)
+            command = lambda client: client.set(key, value, nx=nx)
         elif timeout > 0:
-            return client.setex(key, value, int(timeout))
+            command = lambda client: client.set(key, value, ex=int(timeout), nx=nx)
         else:
             return False
 
+        return self._write(client, [key], command)
+
     def set(self, key, value, timeout=None, version=None, client=None):
         """
         Persist a value to the cache, and set an optional expiration time.
         """
 
-        if not client:
+        if client is None:
             client = self._client
 
         key = self.make_key(key, version=version)
         if timeout is None:
             timeout = self.default_timeout
+        if self._hot_keys is not None:
+            self._record_access([key])
 
         result = self._set(key, self.pickle(value), int(timeout), client)
         return result
@@ -203,9 +816,10 @@ class RedisCache(BaseCache):
         if client is None:
             client = self._client
 
-        client.delete(self.make_key(key, version=version))
+        key = self.make_key(key, version=version)
+        self._write(client, [key], lambda client: client.delete(key))
 
-    def delete_pattern(self, pattern, version=None, client=None):
+    def delete_pattern(self, pattern, version=None, client=None, itersize=100):
         """
         Remove all keys matching pattern.
         """
@@ -214,8 +828,14 @@ class RedisCache(BaseCache):
             client = self._client
 
         pattern = self.make_key(pattern, version=version)
-        keys = client.keys(pattern)
-        client.delete(*keys)
+        keys = client.scan_iter(match=pattern, count=itersize)
+
+        # Delete matching keys page by page instead of in one huge DEL.
+        while True:
+            chunk = list(islice(keys, itersize))
+            if not chunk:
+                break
+            self._write(client, chunk, lambda client: client.delete(*chunk))
 
     def delete_many(self, keys, version=None):
         """
@@ -223,26 +843,62 @@ class RedisCache(BaseCache):
         """
         if keys:
             keys = map(lambda key: self.make_key(key, version=version), keys)
-            self._client.delete(*keys)
+            self._write(self._client, keys, lambda client: client.delete(*keys))
 
     def clear(self):
         """
         Flush all cache keys.
         """
-        self._client.flushdb()
+        for client in self.get_servers():
+            client.flushdb()
+
+            if self._local is not None:
+                self._local.invalidate_all(client)
 
     def unpickle(self, value):
         """
         Unpickles the given value.
         """
-        value = smart_str(value)
-        return pickle.loads(value)
+        if value[:2] == _XFETCH_PREFIX:
+            value = value[_XFETCH_HEADER_END:]
+
+        if value[:2] == _COMPRESSED_PREFIX:
+            value = decompress(value[2:3], value[3:], self._compressor)
+
+        if value[:1] == _FASTPATH_MARKER:
+            if value[:2] == _FLOAT_PREFIX:
+                return float(value[2:])
+            return value[2:]
+
+        try:
+            return int(value)
+        except ValueError:
+            return self._serializer.loads(value)
 
     def pickle(self, value):
         """
         Pickle the given value.
+
+        Integers, floats and byte strings bypass the serializer. Integers
+        are stored as plain strings, so redis can operate on them
+        natively (INCRBY/DECRBY).
         """
-        return pickle.dumps(value, self._pickle_version)
+        cls = type(value)
+        if cls is int or cls is long:
+            return value
+        elif cls is float:
+            return _FLOAT_PREFIX + repr(value)
+        elif cls is bytes:
+            value = _BYTES_PREFIX + value
+        else:
+            value = self._serializer.dumps(value)
+
+        if self._compressor is not None and len(value) >= self._compress_min_length:
+            compressed = _COMPRESSED_PREFIX + self._compressor.codec \
+                                + self._compressor.compress(value)
+            if len(compressed) < len(value):
+                return compressed
+        return value
 
     def get_many(self, keys, version=None):
         """
@@ -254,15 +910,20 @@ class RedisCache(BaseCache):
 
         new_keys = map(lambda key: self.make_key(key, version=version), keys)
         map_keys = dict(zip(new_keys, keys))
+        if self._hot_keys is not None:
+            self._record_access(new_keys)
 
-        results = self._client.mget(new_keys)
+        results = self._get_raw_many(new_keys, self._get_many)
         for key, value in zip(new_keys, results):
-            if value is None:
+            if self._unexpired(value) is None:
                 continue
 
             recovered_data[map_keys[key]] = self.unpickle(value)
         return recovered_data
 
+    def _get_many(self, keys):
+        return self._read_client.mget(keys)
+
     def set_many(self, data, timeout=None, version=None):
         """
         Set a bunch of values in the cache at once from a dict of key/value
@@ -287,132 +948,542 @@ class RedisCache(BaseCache):
 
         key = self.make_key(key, version=version)
 
-        if not client.exists(key):
-            raise ValueError("Key '%s' not found" % key)
+        args = [delta]
+        if self._local is not None:
+            # Published by the script, in the same round trip.
+            args.extend([self._local.channel, self._local.invalidation([key])])
+
+        try:
+            value = self._incr(key, args, client)
+        except ResponseError:
+            # Value is not stored as a native redis integer (for example,
+            # it does not fit in 64 bits): fall back to get and set,
+            # keeping the remaining ttl of the key.
+            value = self.get(key, version=version, client=client)
+            if value is None:
+                raise ValueError("Key '%s' not found" % key)
+
+            value += delta
+            timeout = client.ttl(key) or 0
+            self.set(key, value, timeout=timeout, version=version, client=client)
+            return value
 
-        value = self.get(key, version=version, client=client) + delta
-        self.set(key, value, version=version, client=client)
+        if value is None:
+            raise ValueError("Key '%s' not found" % key)
         return value
 
+    def _incr(self, key, args, client):
+        return self._incr_script(keys=[key], args=args, client=client)
+
     def decr(self, key, delta=1, version=None, client=None):
         """
         Decreace delta to value in the cache. If the key does not exist, raise a
         ValueError exception.
         """
-        if client is None:
-            client = self._client
+        return self.incr(key, -delta, version=version, client=client)
 
-        key = self.make_key(key, version=version)
-
-        if not client.exists(key):
-            raise ValueError("Key '%s' not found" % key)
-
-        value = self.get(key, version=version, client=client) - delta
-        self.set(key, value, version=version, client=client)
-        return value
-
-    def has_key(self, key, version=None):
+    def has_key(self, key, version=None, client=None):
         """
         Test if key exists.
         """
+        if client is None:
+            client = self._read_client
 
         key = self.make_key(key, version=version)
-        return self._client.exists(key)
+        return self._unexpired(self._get_header(key, client) or None) is not None
+
+    def _get_header(self, key, client):
+        # Enough to tell expired values of get_or_set, without reading them.
+        return client.getrange(key, 0, _XFETCH_HEADER_END - 1)
 
     # Other not default and not standar methods.
     def keys(self, search):
-        pattern = self.make_key(search)
-        return list(set(map(lambda x: x.split(":", 2)[2], self._client.keys(pattern))))
+        return list(set(self.iter_keys(search)))
+
+    def iter_keys(self, search, itersize=100, version=None, client=None):
+        """
+        Same as keys, but uses SCAN instead of KEYS and returns a generator,
+        so the server is never blocked walking the whole keyspace.
+        """
+        if client is None:
+            client = self._read_client
+
+        pattern = self.make_key(search, version=version)
+        for key in client.scan_iter(match=pattern, count=itersize):
+            yield key.split(":", 2)[2]
 
 
 from .hash_ring import HashRing
 _findhash = re.compile('.*\{(.*)\}.*', re.I)
 
+class _NodeClients(dict):
+    """
+    Clients by node name. The clients of removed nodes are not listed,
+    but still returned for their name, to the lookups that got it from
+    the ring just before the node was removed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(_NodeClients, self).__init__(*args, **kwargs)
+        self.removed = {}
+
+    def __missing__(self, name):
+        return self.removed[name]
+
+    def remove(self, name):
+        self.removed[name] = self.pop(name)
+
+
 class ShardedRedisCache(RedisCache):
-    connections = {}
-    nodes = []
+    # Nodes holding each hot key (see ``HOT_KEY_PATTERNS``), 0 if disabled.
+    _hot_copies = 0
+    _hot_patterns = ()
+    _hot_min_rate = None
+    # Seconds between updates of the keys hot by HOT_KEY_MIN_RATE.
+    hot_keys_refresh = 1
 
     def _connect(self):
         if not isinstance(self._server, (tuple, list)):
             raise ImproperlyConfigured("LOCATION must be a list or tuple")
 
+        self.connections = _NodeClients()
+        self.read_connections = {}
+        self.nodes = []
+        self.weights = {}
+
+        # Every location can be a string or a (location, weight) pair.
         for location in self._server:
+            if isinstance(location, (tuple, list)):
+                location, weight = location
+                self.weights[location] = weight
+
+            self.connections[location] = self._connect_node(location)
+            self.read_connections[location] = self._connect_replicas(location,
+                                                    self.connections[location])
+            self.nodes.append(location)
+
+        self.ring = self._make_ring()
+        self._incr_script = self.connections[self.nodes[0]]\
+                                    .register_script(_incr_script)
+        self._unlock_script = self.connections[self.nodes[0]]\
+                                    .register_script(_unlock_script)
+        self._rename_script = self.connections[self.nodes[0]]\
+                                    .register_script(_rename_script)
+        self._dump_script = self.connections[self.nodes[0]]\
+                                    .register_script(_dump_script)
+        self._setup_hot_copies()
+
+    def _setup_hot_copies(self):
+        patterns = self._options.get('HOT_KEY_PATTERNS') or ()
+        min_rate = self._options.get('HOT_KEY_MIN_RATE')
+        if not patterns and min_rate is None:
+            return
+
+        if min_rate is not None and self._hot_keys is None:
+            raise ImproperlyConfigured("HOT_KEY_MIN_RATE requires the HOT_KEYS option")
+        try:
+            self._hot_copies = int(self._options.get('HOT_KEY_COPIES', 3))
+            if min_rate is not None:
+                self._hot_min_rate = float(min_rate)
+        except (ValueError, TypeError):
+            raise ImproperlyConfigured("HOT_KEY_COPIES and HOT_KEY_MIN_RATE must be numbers")
+
+        if isinstance(patterns, basestring):
+            patterns = [patterns]
+        self._hot_patterns = [re.compile(fnmatch.translate(pattern)) for pattern in patterns]
+        self._measured_hot = (0, frozenset())
+
+    @property
+    def sharding_class(self):
+        cls = self._options.get('SHARDING_STRATEGY', 'redis_cache.hash_ring.HashRing')
+        return load_class(cls)
+
+    def _make_ring(self):
+        cls = self.sharding_class
+        try:
+            if issubclass(cls, HashRing):
+                return cls(self.nodes, weights=self.weights,
+                            compat=self._options.get('HASH_RING_COMPAT', True))
+            return cls(self.nodes, weights=self.weights)
+        except ValueError as e:
+            raise ImproperlyConfigured("Invalid LOCATION weights: %s" % e)
+
+    def _connect_location(self, location):
+        try:
+            host, port, db = location.split(":")
+        except ValueError:
             try:
-                host, port, db = location.split(":")
+                host, port = location.split(":")
+                db = 1
             except ValueError:
-                try:
-                    host, port = location.split(":")
-                    db = 1
-                except ValueError:
-                    raise ImproperlyConfigured("invalid location string, this must be <host>:<port>:<db>")
-
-            params = {
-                'db': db,
-                'password': self.password,
-            }
-            if host == "unix":
-                params['unix_socket_path'] = port
-            else:
-                params['unix_socket_path'] = None
-                params['host'], params['port'] = host, int(port)
+                raise ImproperlyConfigured("invalid location string, this must be <host>:<port>:<db>")
 
-            connection_pool = ConnectionPoolHandler()\
-                .connection_pool(parser_class=self.parser_class, **params)
+        params = {
+            'db': db,
+            'password': self.password,
+        }
+        if host == "unix":
+            params['unix_socket_path'] = port
+        else:
+            params['unix_socket_path'] = None
+            params['host'], params['port'] = host, int(port)
 
-            self.connections[location] = Redis(connection_pool=connection_pool)
-            self.nodes.append(location)
+        params.update(self.pool_options)
+        connection_pool = ConnectionPoolHandler()\
+            .connection_pool(parser_class=self.parser_class, **params)
+        client = Redis(connection_pool=connection_pool)
+        return self._instrument(client, location)
 
-        self.ring = HashRing(self.nodes)
+    def add_node(self, location, weight=1):
+        """
+        Add a node to the running cache. Keys that move to the new node
+        are lost unless migrated (see the ``redis_cache_migrate`` command).
+        """
+        if location in self.connections:
+            return
+        weight = self.ring.check_weight(weight)
+
+        # Connected before the ring can return it. Lists are replaced
+        # instead of changed, for the threads iterating them.
+        self.connections[location] = self._connect_node(location)
+        self.connections.removed.pop(location, None)
+        self.read_connections[location] = self._connect_replicas(location,
+                                                    self.connections[location])
+        if self._local is not None:
+            self._local.add_listener(self.connections[location])
+        self.nodes = self.nodes + [location]
+        self.weights[location] = weight
+        self.ring.add_node(location, weight)
+
+    def remove_node(self, location):
+        """
+        Remove a node from the running cache, its keys are routed to the
+        rest of nodes from now on.
+        """
+        # Out of the ring first: the client is removed once no new lookup
+        # returns the node, and kept for the ones that already did.
+        self.ring.remove_node(location)
+        self.nodes = [node for node in self.nodes if node != location]
+        self.weights.pop(location, None)
+        self.read_connections.pop(location, None)
+        self.connections.remove(location)
+
+    def _ring_key(self, _key):
+        key = str(_key)
+        if '{' in key:
+            g = _findhash.match(key)
+            if g != None and len(g.groups()) > 0:
+                key = g.groups()[0]
+        return key
 
     def get_server_name(self, _key):
-        key = str(_key)
-        g = _findhash.match(key)
-        if g != None and len(g.groups()) > 0:
-            key = g.groups()[0]
-        name = self.ring.get_node(key)
+        name = self.ring.get_node(self._ring_key(_key))
         return name
 
+    def _is_hot(self, key):
+        key = str(key)
+        name = key.split(':', 2)[-1]
+        for pattern in self._hot_patterns:
+            if pattern.match(name):
+                return True
+        return self._hot_min_rate is not None and key in self._measured_hot_keys()
+
+    def _measured_hot_keys(self):
+        updated, keys = self._measured_hot
+        now = time.time()
+        if now - updated >= self.hot_keys_refresh:
+            top = self._hot_keys.top(self._hot_keys.capacity * len(self.nodes))
+            keys = frozenset(item['key'] for item in top
+                                if item['rate'] >= self._hot_min_rate)
+            self._measured_hot = (now, keys)
+        return keys
+
+    def _hot_nodes(self, key):
+        """
+        Returns the nodes holding ``key`` if it is hot, its own node first
+        and then the ones holding a copy along the ring. None if it is not.
+        """
+        if not self._hot_copies or not self._is_hot(key):
+            return None
+
+        nodes = self.ring.get_nodes(self._ring_key(key), self._hot_copies)
+        return len(nodes) > 1 and nodes or None
+
+    def _copy_key(self, key):
+        return CacheKey(_HOT_COPY_PREFIX + str(key))
+
+    def _pipeline(self, name, copies, transaction=True):
+        """
+        Returns a pipeline of the node ``name`` whose copy writes (see
+        ``_track_copies``) are added to the list ``copies`` instead of
+        sent, to send those of all nodes together with ``_write_copies``.
+        """
+        pipeline = self.connections[name].pipeline(transaction=transaction)
+        pipeline._copy_collector = copies
+        return pipeline
+
+    def _track_copies(self, pipeline, keys, value=None, timeout=0):
+        """
+        Keep the copies of ``keys``, written in ``pipeline`` (of their
+        node), in sync: set to ``value`` for a hot key, or else dropped.
+
+        The node of a key holds a marker while it may have copies, even
+        made by other processes (with ``HOT_KEY_MIN_RATE`` any key can be
+        hot for them). It is set or deleted in the pipeline, and the
+        copies are only dropped from the rest of nodes if it existed.
+        """
+        if not self._hot_copies:
+            return
+
+        writes = getattr(pipeline, '_copy_writes', None)
+        if writes is None:
+            writes = pipeline._copy_writes = SortedDict()
+            execute = pipeline.execute
+
+            def copying_execute(*args, **kwargs):
+                writes = pipeline._copy_writes
+                if not writes:
+                    return execute(*args, **kwargs)
+
+                pipeline._copy_writes = SortedDict()
+                for key, (value, timeout) in writes.items():
+                    if value is None:
+                        pipeline.delete(self._copy_key(key))
+                    else:
+                        pipeline.set(self._copy_key(key), '', ex=_HOT_COPY_TTL)
+                results = execute(*args, **kwargs)
+
+                # The marker replies are not ones the caller expects.
+                replies, results = results[-len(writes):], results[:-len(writes)]
+                copies = [(key, value, timeout) for (key, (value, timeout)), reply
+                                    in zip(writes.items(), replies) if value is not None or reply]
+                collector = getattr(pipeline, '_copy_collector', None)
+                if collector is None:
+                    self._write_copies(copies)
+                else:
+                    collector.extend(copies)
+                return results
+
+            pipeline.execute = copying_execute
+
+        for key in keys:
+            if value is not None or self._hot_min_rate is not None or self._is_hot(key):
+                writes[key] = (value, timeout)
+
+    def _write_copies(self, writes):
+        """
+        Set the copies of the ``(key, value, timeout)`` of ``writes`` in
+        the rest of nodes holding them, or drop them if ``value`` is None,
+        with a pipeline per node, all nodes concurrently.
+        """
+        groups = SortedDict()
+        for key, value, timeout in writes:
+            copy_key = self._copy_key(key)
+            for name in self.ring.get_nodes(self._ring_key(key), self._hot_copies)[1:]:
+                groups.setdefault(name, []).append((copy_key, value, timeout))
+
+        def write(name, copies):
+            pipeline = self.connections[name].pipeline(transaction=False)
+            for copy_key, value, timeout in copies:
+                if value is None:
+                    pipeline.delete(copy_key)
+                else:
+                    pipeline.set(copy_key, value,
+                                    ex=min(timeout or _HOT_COPY_TTL, _HOT_COPY_TTL))
+            pipeline.execute()
+
+        parallel_map(write, groups.items())
+
+    def _drop_copies(self, keys):
+        """
+        Drop the copies of ``keys``, written with no tracking of them.
+        """
+        if not self._hot_copies:
+            return
+
+        copies = []
+        def drop(name, _keys):
+            pipeline = self._pipeline(name, copies, transaction=False)
+            self._track_copies(pipeline, _keys)
+            pipeline.execute()
+
+        parallel_map(drop, self.get_servers_for_keys(keys).items())
+        self._write_copies(copies)
+
+    def _repair_copy(self, key, name):
+        """
+        Copy the value of the hot ``key`` to the node ``name``, where its
+        copy is missing. Returns the value.
+        """
+        pipeline = self.get_server(key).pipeline(transaction=False)
+        pipeline.get(key)
+        pipeline.pttl(key)
+        # The marker goes first, so a write after this drops the copy.
+        pipeline.set(self._copy_key(key), '', ex=_HOT_COPY_TTL)
+        value, ttl, marked = pipeline.execute()
+
+        if value is not None:
+            ttl = min(ttl > 0 and ttl or _HOT_COPY_TTL * 1000, _HOT_COPY_TTL * 1000)
+            self.connections[name].set(self._copy_key(key), value, px=ttl, nx=True)
+        return value
+
     def close(self):
         for cli in self.connections.values():
             for c in cli.connection_pool._available_connections:
                 c.disconnect()
 
+    def get_servers(self):
+        return self.connections.values()
+
+    def get_servers_by_name(self):
+        return SortedDict((name, self.connections[name]) for name in self.nodes)
+
+    def pool_stats(self):
+        return dict((name, client.connection_pool.stats())
+                        for name, client in self.connections.items())
+
     def get_server(self,key):
         name = self.get_server_name(key)
         return self.connections[name]
 
+    def get_read_server(self, key):
+        return self._read_connection(self.get_server_name(key))
+
+    def _read_connection(self, name):
+        client = self.read_connections.get(name)
+        if client is None:
+            client = self.connections[name]
+        return client
+
+    def _replica_locations(self, location):
+        replicas = self._options.get('REPLICAS') or {}
+        if not isinstance(replicas, dict):
+            raise ImproperlyConfigured("REPLICAS must be a dict of node location "
+                                        "to a list of replica locations")
+        return replicas.get(location, [])
+
+    def _same_node(self, key, other_key):
+        return self.get_server_name(key) == self.get_server_name(other_key)
+
+    def get_servers_for_keys(self, keys):
+        """
+        Group already made keys by the name of the node that owns them.
+        Returns a sorted dict of ``{server_name: [key, ...]}``.
+        """
+        groups = SortedDict()
+        for key in keys:
+            groups.setdefault(self.get_server_name(key), []).append(key)
+        return groups
+
     def add(self,  key, value, timeout=None, version=None, client=None):
         if client is None:
             key = self.make_key(key, version=version)
             client = self.get_server(key)
 
-        return super(ShardedRedisCache, self).add(key=key, value=value,
-                                        version=version, client=client)
+        return super(ShardedRedisCache, self).add(key=key, value=value, timeout=timeout,
+                                                    version=version, client=client)
+
+    def add_many(self, data, timeout=None, version=None):
+        keys = data.keys()
+        new_keys = map(lambda key: self.make_key(key, version=version), keys)
+        map_keys = dict(zip(new_keys, keys))
+
+        copies = []
+        def _add_many(name, _keys):
+            items = [(key, data[map_keys[key]]) for key in _keys]
+            return self._add_many(items, timeout, self._pipeline(name, copies))
+
+        groups = self.get_servers_for_keys(new_keys)
+        results = parallel_map(_add_many, groups.items())
+        self._write_copies(copies)
+
+        added = set()
+        for _keys, _results in zip(groups.values(), results):
+            added.update(map_keys[key] for key, result in zip(_keys, _results) if result)
+        return [key for key in keys if key in added]
 
     def get(self,  key, default=None, version=None, client=None):
         if client is None:
             key = self.make_key(key, version=version)
-            client = self.get_server(key)
+            if self._hot_nodes(key) is not None:
+                # Spread over the copies of the key by _get_many.
+                if self._hot_keys is not None:
+                    self._record_access([key])
+                value, = self._get_raw_many([key], self._get_many)
+                if self._unexpired(value) is None:
+                    return default
+                return self.unpickle(value)
+
+            client = self.get_read_server(key)
         return super(ShardedRedisCache, self).get(key=key, default=default,
                                                 version=version, client=client)
 
-    def get_many(self, keys, version=None):
-        if not keys:
-            return {}
-
-        recovered_data = SortedDict()
-        new_keys = map(lambda key: self.make_key(key, version=version), keys)
-        map_keys = dict(zip(new_keys, keys))
+    def _get_many(self, keys):
+        if self._hot_copies:
+            return self._get_many_hot(keys)
+
+        # One MGET per node, all nodes queried concurrently.
+        groups = self.get_servers_for_keys(keys)
+        results = parallel_map(lambda name, _keys: self._read_connection(name).mget(_keys),
+                                                                groups.items())
+        values = {}
+        for _keys, _values in zip(groups.values(), results):
+            values.update(zip(_keys, _values))
+
+        return [values[key] for key in keys]
+
+    def _get_many_hot(self, keys):
+        # Same as _get_many, reading every hot key from a random node of
+        # the ones holding it.
+        groups = SortedDict()
+        for position, key in enumerate(keys):
+            nodes = self._hot_nodes(key)
+            if nodes is None:
+                name, read_key = self.get_server_name(key), key
+            else:
+                name = random.choice(nodes)
+                read_key = name == nodes[0] and key or self._copy_key(key)
+            groups.setdefault(name, []).append((position, read_key))
+
+        results = parallel_map(lambda name, reads: self._read_connection(name).mget(
+                                    [read_key for position, read_key in reads]), groups.items())
+        values = [None] * len(keys)
+        for (name, reads), _values in zip(groups.items(), results):
+            for (position, read_key), value in zip(reads, _values):
+                if value is None and read_key is not keys[position]:
+                    value = self._repair_copy(keys[position], name)
+                values[position] = value
+        return values
+
+    def _write(self, client, keys, command):
+        if not self._hot_copies:
+            return super(ShardedRedisCache, self)._write(client, keys, command)
+
+        # The markers of the copies go in the same round trip.
+        if not hasattr(client, 'command_stack'):
+            pipeline = client.pipeline(transaction=False)
+            self._write(pipeline, keys, command)
+            return pipeline.execute()[0]
+
+        result = super(ShardedRedisCache, self)._write(client, keys, command)
+        self._track_copies(client, keys)
+        return result
 
-        for key in new_keys:
-            client = self.get_server(key)
-            value = self.get(key=key, version=version, client=client)
+    def _set(self, key, value, timeout, client, nx=False):
+        if not self._hot_copies or timeout < 0:
+            return super(ShardedRedisCache, self)._set(key, value, timeout, client, nx=nx)
 
-            if value is None:
-                continue
+        if not hasattr(client, 'command_stack'):
+            pipeline = client.pipeline(transaction=False)
+            self._set(key, value, timeout, pipeline, nx=nx)
+            return pipeline.execute()[0]
 
-            recovered_data[map_keys[key]] = value
-        return recovered_data
+        # Dropped by _write. Added values are not known to be added yet,
+        # their copies are made again on reads.
+        result = super(ShardedRedisCache, self)._set(key, value, timeout, client, nx=nx)
+        if not nx and self._hot_nodes(key) is not None:
+            self._track_copies(client, [key], value, timeout)
+        return result
 
     def set(self, key, value, timeout=None, version=None, client=None):
         """
@@ -433,39 +1504,75 @@ class ShardedRedisCache(RedisCache):
         If timeout is given, that timeout will be used for the key; otherwise
         the default cache timeout will be used.
         """
-        for key, value in data.iteritems():
-            self.set(key, value, timeout, version=version)
+        new_keys = dict((self.make_key(key, version=version), value)
+                                    for key, value in data.iteritems())
+
+        copies = []
+        def _set_many(name, keys):
+            pipeline = self._pipeline(name, copies)
+            for key in keys:
+                self.set(key, new_keys[key], timeout, version=version, client=pipeline)
+            return pipeline.execute()
+
+        parallel_map(_set_many, self.get_servers_for_keys(new_keys).items())
+        self._write_copies(copies)
 
     def delete(self, key, version=None, client=None):
+        key = self.make_key(key, version=version)
         if client is None:
-            key = self.make_key(key, version=version)
             client = self.get_server(key)
 
-        return super(ShardedRedisCache, self).delete(key=key, version=version, client=client)
+        super(ShardedRedisCache, self).delete(key=key, version=version, client=client)
 
     def delete_many(self, keys, version=None):
         """
         Remove multiple keys at once.
         """
-        for key in map(lambda key: self.make_key(key, version=version), keys):
-            client = self.get_server(key)
-            self.delete(key, client=client)
+        if not keys:
+            return
 
-    def incr_version(self, key, delta=1, version=None, client=None):
+        new_keys = map(lambda key: self.make_key(key, version=version), keys)
+
+        copies = []
+        def _delete_many(name, _keys):
+            if not self._hot_copies:
+                # A client, as nodes of a cluster split the keys by slot.
+                self._write(self.connections[name], _keys, lambda client: client.delete(*_keys))
+                return
+            pipeline = self._pipeline(name, copies, transaction=False)
+            self._write(pipeline, _keys, lambda client: client.delete(*_keys))
+            pipeline.execute()
+
+        parallel_map(_delete_many, self.get_servers_for_keys(new_keys).items())
+        self._write_copies(copies)
+
+    def has_key(self, key, version=None, client=None):
         if client is None:
             key = self.make_key(key, version=version)
-            client = self.get_server(key)
+            client = self.get_read_server(key)
 
-        return super(ShardedRedisCache, self).incr_version(key=key, delta=delta,
-                                                    version=version, client=client)
+        return super(ShardedRedisCache, self).has_key(key, version=version, client=client)
 
     def incr(self, key, delta=1, version=None, client=None):
+        key = self.make_key(key, version=version)
         if client is None:
-            key = self.make_key(key, version=version)
             client = self.get_server(key)
 
         return super(ShardedRedisCache, self).incr(key=key, delta=delta,
-                                        version=version, client=client)
+                                            version=version, client=client)
+
+    def _incr(self, key, args, client):
+        if not self._hot_copies or (self._hot_min_rate is None and not self._is_hot(key)):
+            return super(ShardedRedisCache, self)._incr(key, args, client)
+
+        # The marker of the copies is deleted by the script.
+        reply = self._incr_script(keys=[key, self._copy_key(key)], args=args, client=client)
+        if reply is None:
+            return None
+        value, marked = reply
+        if marked:
+            self._write_copies([(key, None, 0)])
+        return value
 
     def decr(self, key, delta=1, version=None, client=None):
         if client is None:
@@ -476,8 +1583,149 @@ class ShardedRedisCache(RedisCache):
                                         version=version, client=client)
 
 
-    def delete_pattern(self, pattern, version=None, client=None):
+    def iter_keys(self, search, itersize=100, version=None, client=None):
+        if client is not None:
+            return super(ShardedRedisCache, self).iter_keys(search, itersize=itersize,
+                                                    version=version, client=client)
+
+        return chain.from_iterable(
+            super(ShardedRedisCache, self).iter_keys(search, itersize=itersize,
+                                                    version=version, client=client)
+            for client in map(self._read_connection, self.nodes))
+
+    def delete_pattern(self, pattern, version=None, client=None, itersize=100):
         """
-        Remove all keys matching pattern.
+        Remove all keys matching pattern, scanning all nodes concurrently.
         """
-        raise NotImplementedError
+        _delete_pattern = super(ShardedRedisCache, self).delete_pattern
+        if client is not None:
+            return _delete_pattern(pattern, version=version, client=client,
+                                                        itersize=itersize)
+
+        patterns = [self.make_key(pattern, version=version)]
+        if self._hot_copies:
+            patterns.append(self._copy_key(patterns[0]))
+
+        parallel_map(lambda client, pattern: _delete_pattern(pattern, version=version,
+                                            client=client, itersize=itersize),
+                            [(client, pattern) for client in self.get_servers()
+                                                for pattern in patterns])
+
+
+class ClusterRedisCache(ShardedRedisCache):
+    """
+    Cache backend for redis cluster. ``LOCATION`` is a list of
+    ``<host>:<port>`` of some cluster nodes, used to discover the rest of
+    them and which hash slots each one owns.
+    """
+    # Min seconds between full refreshes of the slots map.
+    refresh_interval = 1
+
+    def _connect(self):
+        if not isinstance(self._server, (tuple, list)):
+            self._server = [self._server]
+
+        if self._options.get('REPLICAS'):
+            raise ImproperlyConfigured("REPLICAS is not supported by ClusterRedisCache")
+        if self._options.get('HOT_KEY_PATTERNS') or 'HOT_KEY_MIN_RATE' in self._options:
+            raise ImproperlyConfigured("Hot key copies are not supported by ClusterRedisCache")
+
+        self.connections = {}
+        self.read_connections = {}
+        self.nodes = []
+        self.weights = {}
+        self._last_refresh = 0
+        self.refresh_slots()
+
+        self._incr_script = self.connections[self.nodes[0]]\
+                                    .register_script(_incr_script)
+        self._unlock_script = self.connections[self.nodes[0]]\
+                                    .register_script(_unlock_script)
+        self._rename_script = self.connections[self.nodes[0]]\
+                                    .register_script(_rename_script)
+        self._dump_script = self.connections[self.nodes[0]]\
+                                    .register_script(_dump_script)
+
+    def _connect_location(self, location):
+        try:
+            host, port = location.rsplit(":", 1)
+            port = int(port)
+        except ValueError:
+            raise ImproperlyConfigured("invalid location string, this must be <host>:<port>")
+
+        params = {
+            'db': 0,
+            'password': self.password,
+            'host': host,
+            'port': port,
+            'unix_socket_path': None,
+        }
+        params.update(self.pool_options)
+        connection_pool = ConnectionPoolHandler()\
+            .connection_pool(parser_class=self.parser_class, **params)
+        client = ClusterNodeRedis(self, connection_pool=connection_pool)
+        return self._instrument(client, location)
+
+    def get_node_client(self, name):
+        if name not in self.connections:
+            self.connections[name] = self._connect_node(name)
+        return self.connections[name]
+
+    def refresh_slots(self):
+        """
+        Load the map of hash slots to master nodes from the first
+        reachable known node.
+        """
+        error = None
+        for name in self.nodes + list(self._server):
+            try:
+                response = self.get_node_client(name).execute_command('CLUSTER', 'SLOTS')
+                break
+            except ConnectionError as e:
+                error = e
+        else:
+            raise error
+
+        slots = [None] * CLUSTER_SLOTS
+        nodes = []
+        for item in response:
+            start, end, master = item[:3]
+            # Older servers return an empty host for the queried node.
+            host = master[0] or name.rsplit(":", 1)[0]
+            node = "%s:%s" % (host, master[1])
+
+            self.get_node_client(node)
+            if node not in nodes:
+                nodes.append(node)
+            slots[start:end + 1] = [node] * (end - start + 1)
+
+        self._slots = slots
+        self.nodes = nodes
+        self._last_refresh = time.time()
+
+    def slot_moved(self, slot, node):
+        """
+        Called on ``MOVED`` redirections: updates the slot and, at most
+        every ``refresh_interval`` seconds, the whole map.
+        """
+        self.get_node_client(node)
+        self._slots[slot] = node
+
+        if time.time() - self._last_refresh > self.refresh_interval:
+            self.refresh_slots()
+
+    def get_server_name(self, _key):
+        return self._slots[key_slot(str(_key))]
+
+    def get_servers(self):
+        return [self.connections[node] for node in self.nodes]
+
+    def _same_node(self, key, other_key):
+        # Keys of different slots can not be renamed, even in one node.
+        return key_slot(str(key)) == key_slot(str(other_key))
+
+    def add_node(self, location, weight=1):
+        raise NotImplementedError("Nodes of a redis cluster are managed by the cluster")
+
+    def remove_node(self, location):
+        raise NotImplementedError("Nodes of a redis cluster are managed by the cluster")
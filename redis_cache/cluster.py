@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Redis Cluster support for ``ClusterRedisCache``: hash slot computation
+and node clients that follow ``MOVED``/``ASK`` redirections.
+"""
+
+from __future__ import absolute_import
+
+from redis import Redis
+from redis.client import Pipeline
+from redis.exceptions import ResponseError
+
+CLUSTER_SLOTS = 16384
+
+# Max redirections followed by a single command.
+MAX_REDIRECTIONS = 5
+
+
+def _make_crc16_table():
+    table = []
+    for byte in xrange(256):
+        crc = byte << 8
+        for x in xrange(8):
+            crc = crc & 0x8000 and (crc << 1) ^ 0x1021 or crc << 1
+        table.append(crc & 0xffff)
+    return table
+
+_crc16_table = _make_crc16_table()
+
+
+def crc16(data):
+    """
+    CRC16 (XMODEM), the checksum used by redis cluster for hash slots.
+    """
+    crc = 0
+    for char in data:
+        crc = ((crc << 8) & 0xffff) ^ _crc16_table[((crc >> 8) ^ ord(char)) & 0xff]
+    return crc
+
+
+def key_slot(key):
+    """
+    Returns the cluster hash slot of ``key``. As in redis cluster, when
+    the key contains a non empty ``{hash tag}`` (between the first ``{``
+    and the next ``}``) only the tag is hashed, so keys with the same tag
+    are stored in the same node.
+    """
+    start = key.find('{')
+    if start > -1:
+        end = key.find('}', start + 1)
+        if end > start + 1:
+            key = key[start + 1:end]
+    return crc16(key) % CLUSTER_SLOTS
+
+
+def parse_redirection(error):
+    """
+    Returns ``(kind, slot, node)`` for ``MOVED`` and ``ASK`` errors, or
+    None for any other error.
+    """
+    if not isinstance(error, ResponseError):
+        return None
+
+    parts = str(error.args[0]).split(' ')
+    if len(parts) != 3 or parts[0] not in ('MOVED', 'ASK'):
+        return None
+    return parts[0], int(parts[1]), parts[2]
+
+
+class ClusterNodeRedis(Redis):
+    """
+    Client of a cluster master node. Follows redirections to the node
+    that actually owns a key (updating the slots map of the cache on
+    ``MOVED``), and splits ``mget`` and ``delete`` by hash slot.
+    """
+
+    def __init__(self, cache, **kwargs):
+        super(ClusterNodeRedis, self).__init__(**kwargs)
+        self.cache = cache
+
+    def execute_command(self, *args, **options):
+        try:
+            return super(ClusterNodeRedis, self).execute_command(*args, **options)
+        except ResponseError as e:
+            if parse_redirection(e) is None:
+                raise
+            return self.redirect(e, args, options)
+
+    def redirect(self, error, args, options):
+        """
+        Execute again the command ``args`` that failed with the ``MOVED``
+        or ``ASK`` error in the node pointed by the error.
+        """
+        for x in xrange(MAX_REDIRECTIONS):
+            kind, slot, node = parse_redirection(error)
+            if kind == 'MOVED':
+                self.cache.slot_moved(slot, node)
+
+            client = self.cache.get_node_client(node)
+            try:
+                if kind == 'ASK':
+                    return client._execute_asking(*args, **options)
+                return Redis.execute_command(client, *args, **options)
+            except ResponseError as e:
+                if parse_redirection(e) is None:
+                    raise
+                error = e
+        raise error
+
+    def _execute_asking(self, *args, **options):
+        # ASKING only applies to the next command of the same connection.
+        pool = self.connection_pool
+        connection = pool.get_connection('ASKING')
+        try:
+            connection.send_command('ASKING')
+            connection.read_response()
+            connection.send_command(*args)
+            return self.parse_response(connection, args[0], **options)
+        finally:
+            pool.release(connection)
+
+    def pipeline(self, transaction=None, shard_hint=None):
+        # Transactions can not span several hash slots.
+        return ClusterPipeline(self, self.connection_pool, self.response_callbacks,
+                                                            False, shard_hint)
+
+    def _group_by_slot(self, keys):
+        groups = {}
+        for key in keys:
+            groups.setdefault(key_slot(str(key)), []).append(key)
+        return groups.values()
+
+    def mget(self, keys, *args):
+        keys = list(keys) + list(args)
+        groups = self._group_by_slot(keys)
+        if len(groups) == 1:
+            return super(ClusterNodeRedis, self).mget(keys)
+
+        pipeline = self.pipeline()
+        for _keys in groups:
+            pipeline.mget(_keys)
+
+        values = {}
+        for _keys, _values in zip(groups, pipeline.execute()):
+            values.update(zip(map(str, _keys), _values))
+        return [values[str(key)] for key in keys]
+
+    def delete(self, *names):
+        groups = self._group_by_slot(names)
+        if len(groups) == 1:
+            return super(ClusterNodeRedis, self).delete(*names)
+
+        pipeline = self.pipeline()
+        for _names in groups:
+            pipeline.delete(*_names)
+        return sum(pipeline.execute())
+
+
+class ClusterPipeline(Pipeline):
+    """
+    Non transactional pipeline that executes again, on the right node,
+    the commands failed with ``MOVED`` or ``ASK``.
+    """
+
+    def __init__(self, node_client, *args, **kwargs):
+        super(ClusterPipeline, self).__init__(*args, **kwargs)
+        self.node_client = node_client
+
+    def execute(self, raise_on_error=True):
+        stack = list(self.command_stack)
+        results = super(ClusterPipeline, self).execute(raise_on_error=False)
+
+        for index, ((args, options), result) in enumerate(zip(stack, results)):
+            if parse_redirection(result) is not None:
+                try:
+                    results[index] = self.node_client.redirect(result, args, options)
+                except ResponseError as e:
+                    results[index] = e
+
+        if raise_on_error:
+            self.raise_first_error(stack, results)
+        return results
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+import bz2
+import zlib
+
+
+def _level(options, default):
+    try:
+        return int(options.get('COMPRESS_LEVEL', default))
+    except (ValueError, TypeError):
+        raise ImproperlyConfigured("COMPRESS_LEVEL value must be an integer")
+
+
+class BaseCompressor(object):
+    """
+    Base class for value compressors, selected with the ``COMPRESSOR``
+    option and instantiated with the backend ``OPTIONS`` dict.
+
+    ``codec`` is a single character stored with every compressed value,
+    so values of the built-in codecs stay readable after changing or
+    disabling the compressor.
+    """
+    codec = None
+
+    def __init__(self, options):
+        if not isinstance(self.codec, str) or len(self.codec) != 1:
+            raise ImproperlyConfigured("%s.codec must be a single character"
+                                        % self.__class__.__name__)
+        self._options = options
+
+    def compress(self, value):
+        raise NotImplementedError
+
+    def decompress(self, value):
+        raise NotImplementedError
+
+
+class ZlibCompressor(BaseCompressor):
+    codec = 'z'
+
+    def __init__(self, options):
+        super(ZlibCompressor, self).__init__(options)
+        self._level = _level(options, 6)
+
+    def compress(self, value):
+        return zlib.compress(value, self._level)
+
+    def decompress(self, value):
+        return zlib.decompress(value)
+
+
+class Bz2Compressor(BaseCompressor):
+    codec = 'b'
+
+    def __init__(self, options):
+        super(Bz2Compressor, self).__init__(options)
+        self._level = _level(options, 9)
+
+    def compress(self, value):
+        return bz2.compress(value, self._level)
+
+    def decompress(self, value):
+        return bz2.decompress(value)
+
+
+class LzmaCompressor(BaseCompressor):
+    codec = 'x'
+
+    def __init__(self, options):
+        if lzma is None:
+            raise ImproperlyConfigured("LzmaCompressor requires the lzma module "
+                                       "(backports.lzma on python 2)")
+        super(LzmaCompressor, self).__init__(options)
+        self._level = _level(options, 6)
+
+    def compress(self, value):
+        return lzma.compress(value, preset=self._level)
+
+    def decompress(self, value):
+        return lzma.decompress(value)
+
+
+_DECOMPRESSORS = {
+    ZlibCompressor.codec: zlib.decompress,
+    Bz2Compressor.codec: bz2.decompress,
+    LzmaCompressor.codec: lzma and lzma.decompress,
+}
+
+
+def decompress(codec, value, compressor=None):
+    """
+    Decompress ``value``, compressed with ``codec``: with ``compressor``
+    if it is the one of that codec, else with the built-in codec.
+    """
+    if compressor is not None and compressor.codec == codec:
+        return compressor.decompress(value)
+    _decompress = _DECOMPRESSORS.get(codec)
+    if _decompress is None:
+        raise ValueError("Value compressed with an unknown or unavailable codec %r" % codec)
+    return _decompress(value)
@@ -1,54 +1,169 @@
 # -*- coding: utf-8 -*-
 
+from operator import itemgetter
+
+from hashlib import md5, sha256
+from zlib import crc32
+
 import bisect
-import hashlib
+import struct
+
+_unpack_point = struct.Struct('>I').unpack
+
+
+def _compat_hash(key):
+    return sha256(key).hexdigest()
+
+
+def _point_hash(key):
+    return _unpack_point(md5(key).digest()[:4])[0]
+
+
+def _key_hash(key):
+    return crc32(key) & 0xffffffff
+
+
+def integer_weight(weight):
+    """
+    Returns ``weight`` as an int, raising ValueError unless it is a
+    positive whole number (``2.0`` is accepted, ``0.5`` is not).
+    """
+    try:
+        value = int(weight)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid weight %r" % (weight,))
+    if value != float(weight) or value < 1:
+        raise ValueError("Weights must be positive integers, not %r" % (weight,))
+    return value
+
 
 class HashRing(object):
-    nodes = []
+    """
+    Consistent hash ring.
+
+    With ``compat=True`` (the default) keys are placed exactly as in
+    previous versions (sha256 based, keys past the last point of the ring
+    go to the last node), so upgrading does not move keys between nodes.
 
-    def __init__(self, nodes=[], replicas=128):
+    With ``compat=False`` the ring points are 32 bit integers and keys are
+    hashed with crc32, several times cheaper than sha256, and the ring
+    properly wraps around.
+
+    A node with weight ``n`` (``weights`` maps nodes to integer weights,
+    1 by default) gets ``n`` times more points in the ring.
+
+    The node of the last ``memo_size`` looked up keys is memoized.
+    """
+
+    def __init__(self, nodes=[], replicas=128, compat=True, memo_size=10000, weights=None):
+        self.weights = dict((node, self.check_weight(weight))
+                                for node, weight in (weights or {}).items())
         self.replicas = replicas
-        self.ring = {}
-        self.sorted_keys = []
+        self.compat = compat
+        self.memo_size = memo_size
+        self._hash = self.compat and _compat_hash or _key_hash
+        self._build(list(nodes))
+
+    def _build(self, nodes):
+        point_hash = self.compat and _compat_hash or _point_hash
+        points = [(point_hash("%s:%d" % (node, x)), node) for node in nodes
+                    for x in xrange(self.replicas * self.weights.get(node, 1))]
+        points.sort(key=itemgetter(0))
+
+        # Swapped in a single assignment, so lookups running meanwhile in
+        # other threads never mix the points and nodes of both rings.
+        self._ring = ([point for point, node in points], [node for point, node in points], {})
+        self.nodes = nodes
+
+    @property
+    def sorted_keys(self):
+        return self._ring[0]
 
-        for node in nodes:
-            self.add_node(node)
+    @property
+    def _point_nodes(self):
+        return self._ring[1]
 
-    def add_node(self, node):
-        self.nodes.append(node)
+    @property
+    def _memo(self):
+        return self._ring[2]
 
-        for x in xrange(self.replicas):
-            _hash = hashlib.sha256("%s:%d" % (node, x)).hexdigest()
-            self.ring[_hash] = node
-            self.sorted_keys.append(_hash)
+    @staticmethod
+    def check_weight(weight):
+        """
+        Returns the weight to use for ``weight``, raising ValueError if
+        not valid for this ring.
+        """
+        return integer_weight(weight)
 
-        self.sorted_keys.sort()
+    def add_node(self, node, weight=1):
+        self.weights[node] = self.check_weight(weight)
+        self._build(self.nodes + [node])
 
     def remove_node(self, node):
-        self.nodes.remove(node)
-        for x in xrange(self.replicas):
-            _hash = hashlib.sha256("%s:%d" % (node, x)).hexdigest()
-            self.ring.remove(_hash)
-            self.sorted_keys.remove(_hash)
+        nodes = list(self.nodes)
+        nodes.remove(node)
+        self._build(nodes)
+        self.weights.pop(node, None)
 
     def get_node(self, key):
-        n, i = self.get_node_pos(key)
-        return n
+        sorted_keys, point_nodes, memo = self._ring
+        node = memo.get(key)
+        if node is None and point_nodes:
+            # Same as get_node_pos, inlined because this is the hot path.
+            if self.compat:
+                idx = bisect.bisect(sorted_keys, sha256(key).hexdigest())
+            else:
+                idx = bisect.bisect(sorted_keys, crc32(key) & 0xffffffff)
+
+            if idx == len(point_nodes):
+                idx = self.compat and idx - 1 or 0
+            node = point_nodes[idx]
+
+            if len(memo) >= self.memo_size:
+                memo.clear()
+            memo[key] = node
+        return node
 
     def get_node_pos(self, key):
-        if len(self.ring) == 0:
+        return self._get_node_pos(key, self._ring)
+
+    def _get_node_pos(self, key, ring):
+        sorted_keys, point_nodes, memo = ring
+        if not point_nodes:
             return (None, None)
-        
-        _hash = hashlib.sha256(key).hexdigest()
-        idx = bisect.bisect(self.sorted_keys, _hash)
-        idx = min(idx, (self.replicas * len(self.nodes))-1)
-        return (self.ring[self.sorted_keys[idx]], idx)
+
+        idx = bisect.bisect(sorted_keys, self._hash(key))
+        if idx == len(point_nodes):
+            idx = self.compat and idx - 1 or 0
+        return (point_nodes[idx], idx)
 
     def iter_nodes(self, key):
-        if len(self.ring) == 0: yield None, None
-        node, pos = self.get_node_pos(key)
-        for k in self.sorted_keys[pos:]:
-            yield k, self.ring[k]
+        """
+        Walk the ring from the position of ``key``, yielding every
+        ``(point, node)`` once.
+        """
+        ring = self._ring
+        sorted_keys, point_nodes, memo = ring
+        node, pos = self._get_node_pos(key, ring)
+        if node is None:
+            return
+
+        for idx in xrange(pos, pos + len(point_nodes)):
+            idx %= len(point_nodes)
+            yield sorted_keys[idx], point_nodes[idx]
+
+    def get_nodes(self, key, count):
+        """
+        Returns up to ``count`` distinct nodes for ``key``: its node and
+        the next ones along the ring.
+        """
+        nodes = []
+        for point, node in self.iter_nodes(key):
+            if node not in nodes:
+                nodes.append(node)
+                if len(nodes) == count:
+                    break
+        return nodes
 
     def __call__(self, key):
         return self.get_node(key)
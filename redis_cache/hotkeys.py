@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Hot key detection, enabled with the ``HOT_KEYS`` option. A sample of the
+keys read and written is counted per node with the space-saving
+algorithm, which keeps the approximate top keys in bounded memory: a
+fixed number of counters per node, the least counted one being replaced
+by every new key once all are in use.
+"""
+
+from __future__ import absolute_import
+
+import random
+import threading
+import time
+
+
+class SpaceSaving(object):
+    """
+    Approximate counts of the most frequent items, using ``capacity``
+    counters. Counts are overestimated by at most ``error``, and every
+    item seen more than ``total / capacity`` times is kept.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.total = 0
+        # item: [count, error]
+        self.counters = {}
+
+    def add(self, item, count=1):
+        self.total += count
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += count
+            return
+
+        if len(self.counters) < self.capacity:
+            self.counters[item] = [count, 0]
+            return
+
+        # The new item takes the place of the least counted one, which
+        # it could have been before being replaced.
+        evicted = min(self.counters, key=lambda key: self.counters[key][0])
+        least = self.counters.pop(evicted)[0]
+        self.counters[item] = [least + count, least]
+
+    def top(self, count):
+        """
+        Returns the ``count`` most frequent items as ``[(item, count,
+        error), ...]``.
+        """
+        items = sorted(self.counters.iteritems(), key=lambda item: -item[1][0])
+        return [(item, counter[0], counter[1]) for item, counter in items[:count]]
+
+
+class HotKeys(object):
+    """
+    Hot keys of one cache, shared by every instance of the cache in the
+    process (see ``get_hot_keys``). Every access is counted with
+    probability ``sample_rate``, with ``capacity`` counters per node.
+    Counts cover the last ``window`` to ``2 * window`` seconds.
+    """
+
+    def __init__(self, name, sample_rate=0.01, capacity=100, window=60):
+        self.name = name
+        self.sample_rate = sample_rate
+        self.capacity = capacity
+        self.window = window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._current = (time.time(), {})
+            self._previous = None
+
+    def sample(self, keys):
+        """
+        Returns the keys to count, a random sample of ``keys``.
+        """
+        rate = self.sample_rate
+        if rate >= 1:
+            return keys
+        return [key for key in keys if random.random() < rate]
+
+    def record(self, accesses):
+        """
+        Count ``[(node, key), ...]``, sampled accesses.
+        """
+        with self._lock:
+            now = time.time()
+            started, nodes = self._current
+            if now - started >= self.window:
+                self._previous = self._current
+                started, nodes = self._current = (now, {})
+
+            for node, key in accesses:
+                counters = nodes.get(node)
+                if counters is None:
+                    counters = nodes[node] = SpaceSaving(self.capacity)
+                counters.add(key)
+
+    def top(self, count=10, node=None):
+        """
+        Returns the ``count`` hottest keys (of all nodes, or of ``node``),
+        hottest first, as dicts with ``key``, ``node``, ``accesses`` (the
+        estimated accesses, from the sample), ``error`` (the max
+        overestimation of ``accesses``) and ``rate`` (accesses per second).
+        """
+        with self._lock:
+            generations = [self._current]
+            if self._previous is not None:
+                generations.append(self._previous)
+
+            elapsed = max(time.time() - generations[-1][0], 1)
+            counts = {}
+            for started, nodes in generations:
+                for name, counters in nodes.iteritems():
+                    if node is not None and name != node:
+                        continue
+                    for key, (accesses, error) in counters.counters.iteritems():
+                        total = counts.setdefault((name, key), [0, 0])
+                        total[0] += accesses
+                        total[1] += error
+
+        scale = 1.0 / self.sample_rate
+        hottest = sorted(counts.iteritems(), key=lambda item: -item[1][0])[:count]
+        return [{
+            'key': key,
+            'node': name,
+            'accesses': int(accesses * scale),
+            'error': int(error * scale),
+            'rate': accesses * scale / elapsed,
+        } for (name, key), (accesses, error) in hottest]
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_hot_keys(name, **options):
+    """
+    Returns the hot keys named ``name``, created with ``options`` on
+    first use.
+    """
+    hot_keys = _registry.get(name)
+    if hot_keys is None:
+        with _registry_lock:
+            hot_keys = _registry.setdefault(name, HotKeys(name, **options))
+    return hot_keys
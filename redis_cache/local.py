@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+from collections import OrderedDict
+from redis.exceptions import ConnectionError
+
+import os
+import threading
+import time
+
+# Invalidation messages are the affected keys joined by this separator,
+# or the clear message to drop every local entry.
+_KEYS_SEPARATOR = '\x00'
+_CLEAR_MESSAGE = '*'
+
+
+class LocalCache(object):
+    """
+    In-process cache (L1) placed in front of redis, enabled with the
+    ``LOCAL_CACHE`` option. Stores the raw redis values in a LRU dict
+    bounded by number of entries and total bytes, every entry living at
+    most ``TIMEOUT`` seconds.
+
+    Writes done by any process publish the affected keys on a redis
+    channel; every process listens on it (on every node) and drops
+    those keys from its local cache.
+    """
+
+    def __init__(self, options):
+        self.max_entries = int(options.get('MAX_ENTRIES', 1000))
+        self.max_bytes = int(options.get('MAX_BYTES', 10 * 1024 * 1024))
+        self.timeout = float(options.get('TIMEOUT', 5))
+        self.channel = options.get('CHANNEL', 'redis_cache:invalidate')
+
+        self._lock = threading.RLock()
+        self._pid = None
+        self._listened = set()
+        self._reset()
+
+    def _reset(self):
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = self.misses = 0
+        self.remote_hits = self.remote_misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[1] < time.time():
+                if entry is not None:
+                    self._bytes -= len(entry[0])
+                self.misses += 1
+                return None
+
+            # Reinsert to mark the entry as the most recently used.
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+
+        with self._lock:
+            self._delete(key)
+            self._entries[key] = (value, time.time() + self.timeout)
+            self._bytes += len(value)
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (old_value, _) = self._entries.popitem(last=False)
+                self._bytes -= len(old_value)
+
+    def _delete(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def record_remote(self, hits, misses):
+        with self._lock:
+            self.remote_hits += hits
+            self.remote_misses += misses
+
+    def stats(self):
+        """
+        Returns hit/miss counters and ratios of both tiers: ``local`` is
+        the in-process cache, ``remote`` the redis lookups done on local
+        misses.
+        """
+        def ratio(hits, misses):
+            total = hits + misses
+            return total and float(hits) / total or 0.0
+
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'local_hits': self.hits,
+                'local_misses': self.misses,
+                'local_hit_ratio': ratio(self.hits, self.misses),
+                'remote_hits': self.remote_hits,
+                'remote_misses': self.remote_misses,
+                'remote_hit_ratio': ratio(self.remote_hits, self.remote_misses),
+            }
+
+    def invalidation(self, keys):
+        """
+        Drop keys from the local cache, and return the message that
+        invalidates them in the rest of processes.
+        """
+        keys = [str(key) for key in keys]
+        self.delete_many(keys)
+        return _KEYS_SEPARATOR.join(keys)
+
+    def invalidate(self, client, keys):
+        """
+        Drop keys from the local cache and publish them, through ``client``,
+        to the rest of processes. In pipelines the keys are gathered and
+        published with a single message when the pipeline is executed.
+        """
+        if not hasattr(client, 'command_stack'):
+            client.publish(self.channel, self.invalidation(keys))
+            return
+
+        pending = getattr(client, '_invalidated_keys', None)
+        if pending is None:
+            pending = client._invalidated_keys = []
+            execute = client.execute
+
+            def invalidating_execute(*args, **kwargs):
+                keys = client._invalidated_keys
+                if not keys:
+                    return execute(*args, **kwargs)
+
+                client._invalidated_keys = []
+                client.publish(self.channel, _KEYS_SEPARATOR.join(keys))
+                # The reply of PUBLISH is not one the caller expects.
+                return execute(*args, **kwargs)[:-1]
+
+            client.execute = invalidating_execute
+
+        keys = [str(key) for key in keys]
+        self.delete_many(keys)
+        pending.extend(keys)
+
+    def invalidate_all(self, client):
+        self.clear()
+        client.publish(self.channel, _CLEAR_MESSAGE)
+
+    def listen(self, get_clients):
+        """
+        Start the invalidation listeners for the clients returned by
+        ``get_clients``, once per process: threads do not survive a fork,
+        and the entries copied from the parent process can not be trusted.
+        """
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+
+            self._reset()
+            self._listened = set()
+            for client in get_clients():
+                self._start_listener(client)
+            self._pid = os.getpid()
+
+    def add_listener(self, client):
+        """
+        Start the invalidation listener of a node added to a running
+        cache, if this process is already listening to the rest.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                self._start_listener(client)
+
+    def _start_listener(self, client):
+        if client not in self._listened:
+            self._listened.add(client)
+            InvalidationListener(self, client).start()
+
+    def on_message(self, data):
+        if data == _CLEAR_MESSAGE:
+            self.clear()
+        else:
+            self.delete_many(data.split(_KEYS_SEPARATOR))
+
+
+class InvalidationListener(threading.Thread):
+    """
+    Daemon thread subscribed to the invalidation channel of one node.
+    """
+    retry_interval = 1
+
+    def __init__(self, local_cache, client):
+        super(InvalidationListener, self).__init__()
+        self.daemon = True
+        self.local_cache = local_cache
+        self.client = client
+
+    def run(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.local_cache.channel)
+
+                # Invalidations may have been lost while disconnected.
+                self.local_cache.clear()
+
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.local_cache.on_message(message['data'])
+            except ConnectionError:
+                time.sleep(self.retry_interval)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+from optparse import make_option
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from redis_cache.cache import ShardedRedisCache
+from redis_cache.migration import iter_moved_keys, migrate_keys
+
+
+class Command(BaseCommand):
+    help = ("Moves the keys of a sharded redis cache that change of node when "
+            "its LOCATION list becomes the given list of locations.")
+    args = "<location[=weight] location[=weight] ...>"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--cache', action='store', dest='cache', default='default',
+            help='Alias of the cache to migrate. Defaults to "default".'),
+        make_option('--pattern', action='store', dest='pattern', default='*',
+            help='Only migrate keys matching this pattern. Defaults to all keys.'),
+        make_option('--batch-size', action='store', type='int', dest='batch_size',
+            default=1000, help='Number of keys scanned and moved per batch.'),
+        make_option('--sleep', action='store', type='int', dest='sleep', default=0,
+            help='Milliseconds to wait between batches, to throttle the migration.'),
+        make_option('--keep', action='store_true', dest='keep', default=False,
+            help='Copy keys to their new node, without deleting them from the old one.'),
+        make_option('--dry-run', action='store_true', dest='dry_run', default=False,
+            help='Only count the keys that would be moved.'),
+    )
+
+    requires_model_validation = False
+
+    def _parse_locations(self, locations):
+        # A location can carry its weight, as in <host>:<port>:<db>=<weight>
+        parsed = []
+        for location in locations:
+            if '=' not in location:
+                parsed.append(location)
+                continue
+            location, weight = location.rsplit('=', 1)
+            try:
+                weight = float(weight)
+            except ValueError:
+                raise CommandError("Invalid weight '%s' of location '%s'." % (weight, location))
+            parsed.append((location, weight))
+        return parsed
+
+    def handle(self, *locations, **options):
+        if not locations:
+            raise CommandError("Enter the new list of locations.")
+
+        alias = options['cache']
+        if alias not in settings.CACHES:
+            raise CommandError("Cache '%s' is not configured." % alias)
+
+        cache = get_cache(alias)
+        if not isinstance(cache, ShardedRedisCache):
+            raise CommandError("Cache '%s' is not a ShardedRedisCache." % alias)
+
+        params = dict(settings.CACHES[alias], LOCATION=self._parse_locations(locations))
+        try:
+            new_cache = get_cache(params.pop('BACKEND'), **params)
+        except ImproperlyConfigured as e:
+            raise CommandError(e)
+
+        if options['dry_run']:
+            count = sum(len(keys) for source, target, keys in iter_moved_keys(cache,
+                                    new_cache, options['pattern'], options['batch_size']))
+            self.stdout.write("%s keys would be moved.\n" % count)
+            return
+
+        failed = []
+        count = migrate_keys(cache, new_cache, pattern=options['pattern'],
+                             itersize=options['batch_size'], sleep=options['sleep'] / 1000.0,
+                             keep=options['keep'], failed=failed)
+        self.stdout.write("%s keys moved.\n" % count)
+        if failed:
+            key, error = failed[0]
+            raise CommandError("%s keys could not be restored in their new node, and were "
+                                "kept in the old one (first: %s: %s)." % (len(failed), key, error))
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of the cache backends, enabled with the ``METRICS``
+option. Redis commands are timed on the clients of every node, and
+(de)serialization on the backend, so the time spent on the network and
+the time spent encoding values are measured separately.
+
+When disabled, nothing is wrapped and there is no cost at all.
+"""
+
+from __future__ import absolute_import
+
+from collections import defaultdict
+
+import bisect
+import threading
+import time
+
+# Upper bounds of the histogram buckets, in seconds and bytes.
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                    0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Returns ``[(upper_bound, count), ...]``, the last upper bound
+        being ``'+Inf'``.
+        """
+        result, total = [], 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def snapshot(self):
+        return {'buckets': self.cumulative(), 'sum': self.sum, 'count': self.count}
+
+
+class Metrics(object):
+    """
+    Counters and histograms of one cache, shared by every instance of
+    the cache in the process (see ``get_metrics``).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # By (shard, command).
+            self.commands = defaultdict(int)
+            self.latency = {}
+
+            # By shard.
+            self.hits = defaultdict(int)
+            self.misses = defaultdict(int)
+            self.sets = defaultdict(int)
+            self.deletes = defaultdict(int)
+
+            # By operation, "encode" or "decode".
+            self.serialization = {}
+            self.sizes = {}
+
+    def observe_command(self, shard, args, duration, result):
+        command = str(args[0]).upper()
+        with self._lock:
+            self.commands[shard, command] += 1
+            histogram = self.latency.get((shard, command))
+            if histogram is None:
+                histogram = self.latency[shard, command] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(duration)
+            self._count(shard, command, args, result)
+
+    def observe_pipeline(self, shard, stack, duration, results):
+        with self._lock:
+            self.commands[shard, 'PIPELINE'] += 1
+            histogram = self.latency.get((shard, 'PIPELINE'))
+            if histogram is None:
+                histogram = self.latency[shard, 'PIPELINE'] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(duration)
+
+            for (args, options), result in zip(stack, results):
+                self._count(shard, str(args[0]).upper(), args, result)
+
+    def _count(self, shard, command, args, result):
+        if isinstance(result, Exception):
+            return
+
+        if command == 'GET':
+            if result is None:
+                self.misses[shard] += 1
+            else:
+                self.hits[shard] += 1
+        elif command == 'MGET':
+            misses = result.count(None)
+            self.misses[shard] += misses
+            self.hits[shard] += len(result) - misses
+        elif command in ('SET', 'SETEX', 'SETNX'):
+            self.sets[shard] += 1
+        elif command == 'DEL':
+            self.deletes[shard] += len(args) - 1
+
+    def observe_serialization(self, operation, duration, size):
+        with self._lock:
+            histogram = self.serialization.get(operation)
+            if histogram is None:
+                histogram = self.serialization[operation] = Histogram(LATENCY_BUCKETS)
+                self.sizes[operation] = Histogram(SIZE_BUCKETS)
+            histogram.observe(duration)
+            self.sizes[operation].observe(size)
+
+    def snapshot(self):
+        """
+        Returns all metrics as a dict::
+
+            {
+                'shards': {shard: {'hits', 'misses', 'hit_ratio', 'sets',
+                                   'deletes', 'commands': {command: latency}}},
+                'serialization': {operation: latency},
+                'sizes': {operation: sizes},
+            }
+
+        Latencies and sizes are histograms, dicts with ``buckets`` (list of
+        cumulative ``(upper_bound, count)``), ``sum`` and ``count``.
+        """
+        with self._lock:
+            shards = {}
+            for shard in set(shard for shard, command in self.commands):
+                hits, misses = self.hits[shard], self.misses[shard]
+                shards[shard] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_ratio': hits + misses and float(hits) / (hits + misses) or 0.0,
+                    'sets': self.sets[shard],
+                    'deletes': self.deletes[shard],
+                    'commands': {},
+                }
+
+            for (shard, command), histogram in self.latency.items():
+                shards[shard]['commands'][command] = histogram.snapshot()
+
+            return {
+                'shards': shards,
+                'serialization': dict((operation, histogram.snapshot())
+                                        for operation, histogram in self.serialization.items()),
+                'sizes': dict((operation, histogram.snapshot())
+                                for operation, histogram in self.sizes.items()),
+            }
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_metrics(name):
+    """
+    Returns the metrics named ``name``, created on first use.
+    """
+    metrics = _registry.get(name)
+    if metrics is None:
+        with _registry_lock:
+            metrics = _registry.setdefault(name, Metrics(name))
+    return metrics
+
+
+def all_metrics():
+    return [_registry[name] for name in sorted(_registry)]
+
+
+def instrument_client(client, metrics, shard):
+    """
+    Time every command and pipeline sent by ``client`` (the client of
+    the node ``shard``), wrapping its methods in place.
+    """
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    def timed_execute_command(*args, **options):
+        start = time.time()
+        try:
+            result = execute_command(*args, **options)
+        except Exception as e:
+            metrics.observe_command(shard, args, time.time() - start, e)
+            raise
+
+        metrics.observe_command(shard, args, time.time() - start, result)
+        return result
+
+    def timed_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        def timed_execute(*args, **kwargs):
+            stack = list(pipe.command_stack)
+            start = time.time()
+            results = execute(*args, **kwargs)
+            metrics.observe_pipeline(shard, stack, time.time() - start, results)
+            return results
+
+        pipe.execute = timed_execute
+        return pipe
+
+    client.execute_command = timed_execute_command
+    client.pipeline = timed_pipeline
+    return client
+
+
+def instrument_serialization(cache, metrics):
+    """
+    Time the ``pickle`` and ``unpickle`` methods of ``cache``, and record
+    the size of the values stored and read.
+    """
+    pickle, unpickle = cache.pickle, cache.unpickle
+
+    def timed_pickle(value):
+        start = time.time()
+        result = pickle(value)
+        metrics.observe_serialization('encode', time.time() - start, len(str(result)))
+        return result
+
+    def timed_unpickle(value):
+        start = time.time()
+        result = unpickle(value)
+        metrics.observe_serialization('decode', time.time() - start, len(value))
+        return result
+
+    cache.pickle = timed_pickle
+    cache.unpickle = timed_unpickle
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ','.join('%s="%s"' % (name, _escape(value))
+                        for name, value in sorted(labels.items()))
+
+
+def _render_histogram(lines, name, histogram, **labels):
+    for bound, count in histogram['buckets']:
+        lines.append('%s_bucket{%s} %s' % (name, _labels(le=bound, **labels), count))
+    lines.append('%s_sum{%s} %r' % (name, _labels(**labels), float(histogram['sum'])))
+    lines.append('%s_count{%s} %s' % (name, _labels(**labels), histogram['count']))
+
+
+def render_prometheus(metrics_list=None):
+    """
+    Render metrics (by default, of every instrumented cache) in the
+    Prometheus text exposition format.
+    """
+    if metrics_list is None:
+        metrics_list = all_metrics()
+
+    snapshots = [(metrics.name, metrics.snapshot()) for metrics in metrics_list]
+    lines = []
+
+    for counter in ('hits', 'misses', 'sets', 'deletes'):
+        lines.append('# TYPE redis_cache_%s_total counter' % counter)
+        for name, snapshot in snapshots:
+            for shard, data in sorted(snapshot['shards'].items()):
+                lines.append('redis_cache_%s_total{%s} %s' % (counter,
+                                    _labels(cache=name, shard=shard), data[counter]))
+
+    lines.append('# TYPE redis_cache_command_duration_seconds histogram')
+    for name, snapshot in snapshots:
+        for shard, data in sorted(snapshot['shards'].items()):
+            for command, histogram in sorted(data['commands'].items()):
+                _render_histogram(lines, 'redis_cache_command_duration_seconds', histogram,
+                                                cache=name, shard=shard, command=command)
+
+    lines.append('# TYPE redis_cache_serialization_duration_seconds histogram')
+    for name, snapshot in snapshots:
+        for operation, histogram in sorted(snapshot['serialization'].items()):
+            _render_histogram(lines, 'redis_cache_serialization_duration_seconds', histogram,
+                                                        cache=name, operation=operation)
+
+    lines.append('# TYPE redis_cache_value_size_bytes histogram')
+    for name, snapshot in snapshots:
+        for operation, histogram in sorted(snapshot['sizes'].items()):
+            _render_histogram(lines, 'redis_cache_value_size_bytes', histogram,
+                                                cache=name, operation=operation)
+
+    return '\n'.join(lines) + '\n'
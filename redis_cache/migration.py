@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+from itertools import islice
+
+import time
+
+
+def iter_moved_keys(cache, new_cache, pattern="*", itersize=1000):
+    """
+    Scan every node of ``cache`` and yield ``(source, target, keys)``
+    batches with the keys that ``new_cache`` (the same cache with the new
+    list of locations) routes to a different node.
+    """
+    for source, client in cache.connections.items():
+        keys = client.scan_iter(match=pattern, count=itersize)
+
+        while True:
+            chunk = list(islice(keys, itersize))
+            if not chunk:
+                break
+
+            moved = {}
+            for key in chunk:
+                target = new_cache.get_server_name(key)
+                if target != source:
+                    moved.setdefault(target, []).append(key)
+
+            for target, _keys in moved.items():
+                yield source, target, _keys
+
+
+def migrate_keys(cache, new_cache, pattern="*", itersize=1000, sleep=0, keep=False,
+                    failed=None):
+    """
+    Move the keys of ``cache`` that change of node under ``new_cache``,
+    with pipelined DUMP/RESTORE, keeping their ttl. Keys already present
+    in the target node are not overwritten, as they have been written
+    with the new topology. Waits ``sleep`` seconds between batches.
+
+    Keys that fail to restore for any other reason (the target out of
+    memory, or running an older redis version) are kept in their old
+    node, and appended as ``(key, error)`` to ``failed`` if given.
+
+    Returns the number of keys moved.
+    """
+    moved = 0
+
+    for source, target, keys in iter_moved_keys(cache, new_cache, pattern, itersize):
+        source_client = cache.connections[source]
+        target_client = new_cache.connections[target]
+
+        # In a transaction, so a key can not expire between DUMP and PTTL.
+        pipeline = source_client.pipeline()
+        for key in keys:
+            pipeline.dump(key)
+            pipeline.pttl(key)
+        results = pipeline.execute()
+
+        # Expired or deleted while migrating, nothing to restore.
+        dumped = [(key, data, ttl) for key, data, ttl in zip(keys, results[::2], results[1::2])
+                                                                    if data is not None]
+        pipeline = target_client.pipeline(transaction=False)
+        for key, data, ttl in dumped:
+            # The ttl is None for keys without expiration.
+            pipeline.restore(key, ttl or 0, data)
+        results = pipeline.execute(raise_on_error=False)
+
+        done = set(keys)
+        for (key, data, ttl), result in zip(dumped, results):
+            if not isinstance(result, Exception):
+                moved += 1
+            elif not str(result).startswith('BUSYKEY'):
+                # Target keys with BUSYKEY errors are left untouched, and
+                # the source ones deleted. Other errors lose nothing.
+                done.discard(key)
+                if failed is not None:
+                    failed.append((key, result))
+
+        if not keep and done:
+            source_client.delete(*done)
+
+        if sleep:
+            time.sleep(sleep)
+
+    return moved
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+from itertools import chain
+
+from redis import ConnectionPool as RedisConnectionPool
+from redis.connection import Connection
+from redis.exceptions import ConnectionError, TimeoutError
+
+import os
+import socket
+import threading
+import time
+
+
+class ConnectionPool(RedisConnectionPool):
+    """
+    Connection pool used by all backends. Over the redis-py pool it adds:
+
+    * With ``blocking=True``, once ``max_connections`` are in use callers
+      wait up to ``blocking_timeout`` seconds (forever if None) for a
+      free connection instead of getting a ``ConnectionError``.
+    * Fork safety: a forked process drops the connections inherited from
+      its parent without shutting them down, which would break them in
+      the parent too, and opens its own ones.
+    * Connections idle for more than ``health_check_interval`` seconds
+      are checked with a ``PING`` before being reused, and reconnected if
+      broken.
+    * ``prewarm`` connections are opened in advance, when the pool is
+      created and again after a fork.
+    * Usage counters, see ``stats()``.
+    """
+
+    def __init__(self, connection_class=Connection, max_connections=None,
+                    blocking=False, blocking_timeout=20, health_check_interval=None,
+                    prewarm=0, **connection_kwargs):
+        self.blocking = blocking
+        self.blocking_timeout = blocking_timeout
+        self.health_check_interval = health_check_interval
+        self.prewarm_connections = prewarm
+
+        super(ConnectionPool, self).__init__(connection_class=connection_class,
+                        max_connections=max_connections, **connection_kwargs)
+        self.prewarm(prewarm)
+
+    def reset(self):
+        super(ConnectionPool, self).reset()
+        self._condition = threading.Condition(threading.Lock())
+        self.waits = 0
+        self.wait_time = 0.0
+        self.health_check_failures = 0
+
+    def _checkpid(self):
+        if self.pid == os.getpid():
+            return
+
+        with self._check_lock:
+            if self.pid == os.getpid():
+                return
+
+            for connection in chain(self._available_connections,
+                                    self._in_use_connections):
+                _forget(connection)
+            self.reset()
+
+        self.prewarm(self.prewarm_connections)
+
+    def get_connection(self, command_name, *keys, **options):
+        self._checkpid()
+
+        with self._condition:
+            started = None
+            while not self._available_connections \
+                    and self._created_connections >= self.max_connections:
+                if not self.blocking:
+                    raise ConnectionError("Too many connections")
+
+                if started is None:
+                    started = time.time()
+                    self.waits += 1
+
+                remaining = None
+                if self.blocking_timeout is not None:
+                    remaining = started + self.blocking_timeout - time.time()
+                    if remaining <= 0:
+                        self.wait_time += time.time() - started
+                        raise ConnectionError("No connection available")
+                self._condition.wait(remaining)
+
+            if started is not None:
+                self.wait_time += time.time() - started
+
+            if self._available_connections:
+                connection = self._available_connections.pop()
+            else:
+                connection = self.make_connection()
+            self._in_use_connections.add(connection)
+
+        if self.health_check_interval is not None:
+            self._check_health(connection)
+        return connection
+
+    def _check_health(self, connection):
+        released = getattr(connection, 'released_at', None)
+        if connection._sock is None or released is None \
+                or time.time() - released < self.health_check_interval:
+            return
+
+        try:
+            connection.send_command('PING')
+            if connection.read_response() != 'PONG':
+                raise ConnectionError("Unexpected PING response")
+        except (ConnectionError, TimeoutError, socket.error):
+            # Reconnected by the next command.
+            self.health_check_failures += 1
+            connection.disconnect()
+
+    def release(self, connection):
+        self._checkpid()
+        if connection.pid != self.pid:
+            return
+
+        connection.released_at = time.time()
+        with self._condition:
+            self._in_use_connections.discard(connection)
+            self._available_connections.append(connection)
+            self._condition.notify()
+
+    def prewarm(self, count):
+        """
+        Open up to ``count`` connections and leave them in the pool. The
+        server being unreachable is not an error, connections are opened
+        on demand later.
+        """
+        connections = []
+        try:
+            for x in xrange(min(count, self.max_connections)):
+                connection = self.get_connection('PING')
+                connections.append(connection)
+                connection.connect()
+        except ConnectionError:
+            pass
+        finally:
+            for connection in connections:
+                self.release(connection)
+
+    def stats(self):
+        """
+        Returns the counters of the pool, for the current process.
+        """
+        with self._condition:
+            return {
+                'in_use': len(self._in_use_connections),
+                'available': len(self._available_connections),
+                'created': self._created_connections,
+                'max_connections': self.max_connections,
+                'waits': self.waits,
+                'wait_time': self.wait_time,
+                'health_check_failures': self.health_check_failures,
+            }
+
+
+def _forget(connection):
+    """
+    Close the socket of a connection inherited from the parent process
+    without ``shutdown()``, so the parent can keep using it.
+    """
+    if connection._sock is not None:
+        try:
+            connection._sock.close()
+        except socket.error:
+            pass
+        connection._sock = None
+    connection._parser.on_disconnect()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Read routing to replicas, enabled with the ``REPLICAS`` option. Reads of
+a node go to one of its replicas, chosen by a policy (``READ_POLICY``),
+and to the node itself (the primary) when no replica is available.
+"""
+
+from __future__ import absolute_import
+
+from itertools import count
+
+from redis import Redis
+from redis.connection import UnixDomainSocketConnection
+from redis.exceptions import ConnectionError, TimeoutError
+
+import socket
+import threading
+import time
+
+_LOCAL_HOSTS = set(['localhost', '127.0.0.1', '::1'])
+
+
+def _is_local(client):
+    pool = client.connection_pool
+    if issubclass(pool.connection_class, UnixDomainSocketConnection):
+        return True
+
+    kwargs = pool.connection_kwargs
+
+    host = kwargs.get('host')
+    return host in _LOCAL_HOSTS or host in (socket.gethostname(), socket.getfqdn())
+
+
+def is_lagging(info, max_lag):
+    """
+    Returns True if the ``INFO replication`` section of a replica shows
+    it is not in sync with its primary, or has not heard from it for more
+    than ``max_lag`` seconds.
+    """
+    if info.get('role') != 'slave':
+        return False
+
+    return (info.get('master_link_status') != 'up'
+                or info.get('master_sync_in_progress')
+                or info.get('master_last_io_seconds_ago', 0) > max_lag)
+
+
+class Replica(object):
+    def __init__(self, name, client):
+        self.name = name
+        self.client = client
+        self.local = _is_local(client)
+        self.lagging = False
+        # Not used until then after failing to connect.
+        self.down_until = 0
+
+    def available(self, now):
+        return not self.lagging and self.down_until <= now
+
+    def __repr__(self):
+        return "<Replica: %s>" % self.name
+
+
+class RoundRobinPolicy(object):
+    """
+    Spread reads evenly over the replicas.
+    """
+
+    def __init__(self):
+        self._counter = count()
+
+    def choose(self, replicas):
+        return replicas[next(self._counter) % len(replicas)]
+
+
+class LeastOutstandingPolicy(object):
+    """
+    Send reads to the replica with fewer commands in progress (connections
+    in use) in this process.
+    """
+
+    def choose(self, replicas):
+        return min(replicas, key=lambda replica:
+                        len(replica.client.connection_pool._in_use_connections))
+
+
+class LocalFirstPolicy(RoundRobinPolicy):
+    """
+    Send reads to replicas in this host (loopback addresses, the name of
+    the host or unix sockets) if any is available, to the rest if not.
+    """
+
+    def choose(self, replicas):
+        local = [replica for replica in replicas if replica.local]
+        return super(LocalFirstPolicy, self).choose(local or replicas)
+
+
+class ReplicaRedis(Redis):
+    """
+    Client for the reads of a primary node and its replicas. Every command
+    is sent to a replica chosen by ``policy``, or to ``primary``:
+
+    * If the replica fails to connect. It is not used again for
+      ``retry_interval`` seconds.
+    * If no replica is available. Every ``check_interval`` seconds the
+      replication state of the replicas is checked (``INFO replication``)
+      in a background thread, and the ones lagging more than ``max_lag``
+      seconds behind their primary, or not in sync, are left out until
+      the next check.
+
+    Pipelines are sent to the primary.
+    """
+
+    def __init__(self, primary, replicas, policy, max_lag=15, check_interval=2,
+                    retry_interval=5):
+        super(ReplicaRedis, self).__init__(connection_pool=primary.connection_pool)
+        self.primary = primary
+        self.replicas = [Replica(name, client) for name, client in replicas]
+        self.policy = policy
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self._checked_at = 0
+        self._check_thread = None
+
+    def choose(self):
+        """
+        Returns the replica for the next read, None if none is available.
+        """
+        now = time.time()
+        if now - self._checked_at >= self.check_interval:
+            # Out of the request path: reads keep using the last state
+            # meanwhile. Two threads rarely starting a check each is harmless.
+            self._checked_at = now
+            self._check_thread = threading.Thread(target=self.check)
+            self._check_thread.daemon = True
+            self._check_thread.start()
+
+        available = [replica for replica in self.replicas if replica.available(now)]
+        if not available:
+            return None
+        return self.policy.choose(available)
+
+    def check(self):
+        """
+        Check the replication state of the replicas not known to be down.
+        """
+        now = time.time()
+        for replica in self.replicas:
+            if replica.down_until > now:
+                continue
+
+            try:
+                info = replica.client.info('replication')
+            except (ConnectionError, TimeoutError):
+                replica.down_until = now + self.retry_interval
+                continue
+            replica.lagging = is_lagging(info, self.max_lag)
+
+    def execute_command(self, *args, **options):
+        replica = self.choose()
+        if replica is not None:
+            try:
+                return replica.client.execute_command(*args, **options)
+            except (ConnectionError, TimeoutError):
+                replica.down_until = time.time() + self.retry_interval
+        return self.primary.execute_command(*args, **options)
+
+    def scan_iter(self, match=None, count=None):
+        # Cursors are only valid in the server that returned them.
+        replica = self.choose()
+        client = replica is not None and replica.client or self.primary
+        return client.scan_iter(match=match, count=count)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+import json
+import marshal
+
+
+class BaseSerializer(object):
+    """
+    Base class for value serializers. A serializer converts any python
+    object to a byte string (``dumps``) and back (``loads``).
+
+    Serializers are selected with the ``SERIALIZER`` option, and are
+    instantiated with the backend ``OPTIONS`` dict.
+    """
+
+    def __init__(self, options):
+        self._options = options
+
+    def dumps(self, value):
+        raise NotImplementedError
+
+    def loads(self, value):
+        raise NotImplementedError
+
+
+class PickleSerializer(BaseSerializer):
+    def __init__(self, options):
+        super(PickleSerializer, self).__init__(options)
+
+        try:
+            self._pickle_version = int(options.get('PICKLE_VERSION', -1))
+        except (ValueError, TypeError):
+            raise ImproperlyConfigured("PICKLE_VERSION value must be an integer")
+
+    def dumps(self, value):
+        return pickle.dumps(value, self._pickle_version)
+
+    def loads(self, value):
+        return pickle.loads(value)
+
+
+class JSONSerializer(BaseSerializer):
+    def dumps(self, value):
+        return json.dumps(value, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+    def loads(self, value):
+        return json.loads(value)
+
+
+class MarshalSerializer(BaseSerializer):
+    def dumps(self, value):
+        return marshal.dumps(value)
+
+    def loads(self, value):
+        return marshal.loads(value)
+
+
+class MsgPackSerializer(BaseSerializer):
+    def __init__(self, options):
+        if msgpack is None:
+            raise ImproperlyConfigured("MsgPackSerializer requires the msgpack package")
+        super(MsgPackSerializer, self).__init__(options)
+
+    def dumps(self, value):
+        return msgpack.dumps(value, use_bin_type=True)
+
+    def loads(self, value):
+        return msgpack.loads(value, raw=False)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Session engine storing every session in a redis hash, one field per
+session key, in one of the redis caches of the project::
+
+    SESSION_ENGINE = 'redis_cache.session'
+    SESSION_CACHE_ALIAS = 'default'
+
+Sessions are loaded with a single ``HGETALL``, and saved writing only the
+fields that changed since then, plus the refresh of the ttl, in a single
+pipeline.
+"""
+
+from __future__ import absolute_import
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import SessionBase, CreateError
+from django.core.cache import get_cache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.encoding import smart_str
+
+from .cache import RedisCache
+
+import threading
+
+KEY_PREFIX = "redis_cache.session"
+
+# Field present in every session, so empty sessions exist too.
+_CREATED_FIELD = '\x00'
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_session_cache():
+    """
+    Returns the cache of the sessions, the one named by the
+    ``SESSION_CACHE_ALIAS`` setting (``default`` if not set).
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                cache = get_cache(getattr(settings, 'SESSION_CACHE_ALIAS', 'default'))
+                if not isinstance(cache, RedisCache):
+                    raise ImproperlyConfigured("The session cache must be a redis_cache "
+                                                "backend")
+                _cache = cache
+    return _cache
+
+
+class SessionStore(SessionBase):
+    """
+    A redis hash based session store.
+    """
+    def __init__(self, session_key=None):
+        self._cache = get_session_cache()
+        # Raw values of the fields as loaded, to save only the changes.
+        self._loaded = {}
+        super(SessionStore, self).__init__(session_key)
+
+    def _key(self, session_key):
+        return self._cache.make_key(KEY_PREFIX + session_key)
+
+    @property
+    def cache_key(self):
+        return self._key(self._get_or_create_session_key())
+
+    def load(self):
+        try:
+            key = self.cache_key
+            fields = self._cache.get_server(key).hgetall(key)
+        except Exception:
+            # Unreachable server: an empty session, as the cache engine.
+            fields = {}
+
+        if _CREATED_FIELD not in fields:
+            # Missing, or only the fields saved after it expired.
+            self._session_key = None
+            self._loaded = {}
+            return {}
+
+        fields.pop(_CREATED_FIELD, None)
+        session = {}
+        for field, raw in fields.iteritems():
+            try:
+                session[field] = self._cache.unpickle(raw)
+            except Exception:
+                # Unreadable fields are left out, and deleted on save.
+                continue
+        self._loaded = fields
+        return session
+
+    def create(self):
+        # Keys can collide, even if unlikely: retry with another one, as
+        # the cache engine.
+        for i in xrange(10000):
+            self._session_key = self._get_new_session_key()
+            try:
+                self.save(must_create=True)
+            except CreateError:
+                continue
+            self.modified = True
+            return
+        raise RuntimeError("Unable to create a new session key.")
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+
+        key = self.cache_key
+        client = self._cache.get_server(key)
+        if must_create:
+            if not client.hsetnx(key, _CREATED_FIELD, 1):
+                raise CreateError
+            self._loaded = {}
+
+        session = self._get_session(no_load=must_create)
+        changed = {}
+        for field, value in session.iteritems():
+            field = smart_str(field)
+            raw = str(self._cache.pickle(value))
+            if self._loaded.get(field) != raw:
+                changed[field] = raw
+        removed = [field for field in self._loaded if field not in session]
+
+        pipeline = client.pipeline()
+        if changed:
+            pipeline.hmset(key, changed)
+        if removed:
+            pipeline.hdel(key, *removed)
+        # A session past its expiry date is deleted.
+        pipeline.expire(key, max(self.get_expiry_age(), 0))
+        pipeline.execute()
+
+        for field in removed:
+            del self._loaded[field]
+        self._loaded.update(changed)
+
+    def exists(self, session_key):
+        if not session_key:
+            return False
+        key = self._key(session_key)
+        return bool(self._cache.get_server(key).exists(key))
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        key = self._key(session_key)
+        self._cache.get_server(key).delete(key)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Alternative sharding strategies to ``HashRing``, selected with the
+``SHARDING_STRATEGY`` option. All of them place keys in nodes according
+to the node weights.
+"""
+
+from hashlib import md5
+from zlib import crc32
+
+import math
+import struct
+
+from .hash_ring import integer_weight
+
+_unpack_long = struct.Struct('>Q').unpack
+_52_BITS = float(2 ** 52)
+
+
+class BaseSharding(object):
+    """
+    Base class for sharding strategies. Subclasses implement ``_build``,
+    called every time the nodes change to return the lookup table of the
+    nodes, and ``_get_node``, the node of a key in that table.
+
+    The node of the last ``memo_size`` looked up keys is memoized.
+    """
+
+    def __init__(self, nodes=[], weights=None, memo_size=10000):
+        self.weights = dict((node, self.check_weight(weight))
+                                for node, weight in (weights or {}).items())
+        self.memo_size = memo_size
+        self._update(list(nodes))
+
+    def _update(self, nodes):
+        # Swapped in a single assignment, so lookups running meanwhile in
+        # other threads never mix the table or memo of both node lists.
+        self._state = (self._build(nodes), {})
+        self.nodes = nodes
+
+    @property
+    def _memo(self):
+        return self._state[1]
+
+    @staticmethod
+    def check_weight(weight):
+        """
+        Returns the weight to use for ``weight``, raising ValueError if
+        not valid for this strategy. Any positive number by default.
+        """
+        try:
+            value = float(weight)
+        except (ValueError, TypeError):
+            raise ValueError("Invalid weight %r" % (weight,))
+        if not value > 0:
+            raise ValueError("Weights must be positive, not %r" % (weight,))
+        return value
+
+    def add_node(self, node, weight=1):
+        self.weights[node] = self.check_weight(weight)
+        self._update(self.nodes + [node])
+
+    def remove_node(self, node):
+        nodes = list(self.nodes)
+        nodes.remove(node)
+        self._update(nodes)
+        self.weights.pop(node, None)
+
+    def get_node(self, key):
+        table, memo = self._state
+        node = memo.get(key)
+        if node is None and table:
+            node = self._get_node(key, table)
+            if len(memo) >= self.memo_size:
+                memo.clear()
+            memo[key] = node
+        return node
+
+    def __call__(self, key):
+        return self.get_node(key)
+
+    def get_nodes(self, key, count):
+        """
+        Returns up to ``count`` distinct nodes for ``key``, its own node
+        first. The rest are the nodes of salted versions of the key.
+        """
+        table = self._state[0]
+        if not table:
+            return []
+
+        nodes = [self._get_node(key, table)]
+        count = min(count, len(set(self.nodes)))
+        for x in xrange(1, count * 8):
+            if len(nodes) >= count:
+                break
+            node = self._get_node('%s:%d' % (key, x), table)
+            if node not in nodes:
+                nodes.append(node)
+        return nodes
+
+    def _build(self, nodes):
+        raise NotImplementedError
+
+    def _get_node(self, key, table):
+        raise NotImplementedError
+
+
+def jump_hash(key, num_buckets):
+    """
+    Jump consistent hash (Lamping and Veach, 2014): maps a 64 bit integer
+    key to one of ``num_buckets`` buckets, without any memory.
+    """
+    b, j = -1, 0
+    while j < num_buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xffffffffffffffff
+        j = int((b + 1) * (2147483648.0 / ((key >> 33) + 1)))
+    return b
+
+
+class JumpHash(BaseSharding):
+    """
+    Jump consistent hash. Uses no memory besides the list of buckets, and
+    moves the minimum number of keys when nodes are appended. Removing a
+    node other than the last one moves most keys. A node with weight
+    ``n`` gets ``n`` buckets, so weights must be integers.
+    """
+
+    check_weight = staticmethod(integer_weight)
+
+    def _build(self, nodes):
+        return [node for node in nodes for x in xrange(self.weights.get(node, 1))]
+
+    @property
+    def _buckets(self):
+        return self._state[0]
+
+    def _get_node(self, key, buckets):
+        return buckets[jump_hash(crc32(key) & 0xffffffff, len(buckets))]
+
+
+class RendezvousHash(BaseSharding):
+    """
+    Weighted rendezvous (highest random weight) hashing. Every node scores
+    every key, the highest score wins. Lookups are O(nodes), but adding or
+    removing any node only moves the keys of that node.
+    """
+
+    def _build(self, nodes):
+        return [(node, md5("%s:" % node), self.weights.get(node, 1)) for node in nodes]
+
+    def _score(self, key, node_hash, weight):
+        _hash = node_hash.copy()
+        _hash.update(key)
+
+        # Uniform value in (0, 1), (52 bits, so it is never rounded
+        # to 1.0), turned in a weighted score.
+        value = ((_unpack_long(_hash.digest()[:8])[0] >> 12) + 0.5) / _52_BITS
+        return -weight / math.log(value)
+
+    def _get_node(self, key, hashes):
+        best_node, best_score = None, None
+        for node, node_hash, weight in hashes:
+            score = self._score(key, node_hash, weight)
+            if best_score is None or score > best_score:
+                best_node, best_score = node, score
+        return best_node
+
+    def get_nodes(self, key, count):
+        """
+        Returns the ``count`` nodes with the highest scores for ``key``.
+        """
+        scores = sorted(((self._score(key, node_hash, weight), node)
+                            for node, node_hash, weight in self._state[0]), reverse=True)
+        return [node for score, node in scores[:count]]
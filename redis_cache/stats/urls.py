@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 
 from django.conf.urls.defaults import *
-from .views import RedisStatsView
+from .views import RedisStatsView, RedisStatsJSONView, metrics
 
 urlpatterns = patterns('',
     url(r'^$', RedisStatsView.as_view(), name='redis_cache_status'),
+    url(r'^json/$', RedisStatsJSONView.as_view(), name='redis_cache_status_json'),
+    url(r'^metrics/$', metrics, name='redis_cache_metrics'),
 )
 
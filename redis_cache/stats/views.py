@@ -4,23 +4,41 @@
 from django.views.generic import View
 from django.shortcuts import render_to_response, get_object_or_404
 from django.core.urlresolvers import reverse
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect
 from django.template import RequestContext
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 
-from redis.connection import UnixDomainSocketConnection, Connection
-from redis.connection import DefaultParser
-from ..util import ConnectionPoolHandler
+from django.core.cache import get_cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.datastructures import SortedDict
 
-import redis, re
+from redis.exceptions import RedisError
+from ..metrics import render_prometheus
+from ..util import parallel_map
+
+import json
+import re
+import threading
+import time
+
+# Last collected stats, shared by all views: (time, info).
+_snapshot = [0, None]
+_snapshot_lock = threading.Lock()
 
 class RedisStatsView(View):
     dbs_rx = re.compile(r'^db(\d+)$', flags=re.U)
     has_redis_cache = True
 
+    # Seconds the collected stats are reused, so polling dashboards do
+    # not add load to the servers.
+    snapshot_timeout = 5
+
+    # Hot keys shown per cache, for caches with the ``HOT_KEYS`` option.
+    hot_keys_count = 10
+
     def __init__(self, *args, **kwargs):
         if not hasattr(settings, "CACHES"):
             self.has_redis_cache = False
@@ -29,68 +47,127 @@ class RedisStatsView(View):
             self.__class__.caches = self.get_caches()
 
         super(RedisStatsView, self).__init__(*args, **kwargs)
-    
+
     def get_caches(self):
-        caches = {}
-        for name, options in getattr(settings, 'CACHES').iteritems():
+        """
+        Returns a backend instance of every redis cache, without metrics
+        nor local cache, by cache name.
+        """
+        caches = SortedDict()
+        for name, options in sorted(getattr(settings, 'CACHES', {}).iteritems()):
             if 'BACKEND' not in options or 'RedisCache' not in options['BACKEND']:
                 continue
 
-            cachedict = {'unix_socket_path': None}
-            server = options.get('LOCATION', 'localhost:6379')
+            _options = dict(options.get('OPTIONS', {}))
+            _options.pop('METRICS', None)
+            _options.pop('LOCAL_CACHE', None)
+            caches[name] = get_cache(name, OPTIONS=_options)
+        return caches
 
-            if isinstance(server, (list, tuple)):
-                # unsuported sharded connections
-                continue
+    def parse_dbs(self, infoobject):
+        dbs = {}
+        for key, value in infoobject.iteritems():
+            rx_match = self.dbs_rx.match(key)
+            if rx_match:
+                dbs[str(rx_match.group(1))] = value
 
-            try:
-                if ":" in server:
-                    host, port = server.split(':')
-                    cachedict['port'] = int(port)
-                    cachedict['host'] = host
-                else:
-                    cachedict['port'] = cachedict['host'] = None
-                    cachedict['unix_socket_path'] = server
-            except (ValueError, TypeError):
-                raise ImproperlyConfigured("port value must be an integer")
-
-            _options = options.get('OPTIONS', {})
-            try:
-                cachedict['db'] = int(_options.get('DB', 1))
-                cachedict['password'] = _options.get('PASSWORD', None)
-            except (ValueError, TypeError):
-                raise ImproperlyConfigured("db value must be an integer")
-
-            caches[name] = cachedict
-        return caches
+        return dbs
 
     def get_info(self):
+        """
+        Returns the stats of every cache, collected at most once every
+        ``snapshot_timeout`` seconds.
+        """
         if not self.has_redis_cache:
             return {}
 
-        def parse_dbs(infoobject):
-            dbs = {}
-            for key, value in infoobject.iteritems():
-                rx_match = self.dbs_rx.match(key)
-                if rx_match:
-                    dbs[str(rx_match.group(1))] = value
-
-            return dbs
-        
-        global pools
-
-        caches_info = {}
-        for name, options in self.caches.iteritems():
-            connection_pool = ConnectionPoolHandler()\
-                .connection_pool(parser_class=DefaultParser, **options)
-            rclient = redis.Redis(connection_pool=connection_pool)
-
-            caches_info[name] = rclient.info()
-            caches_info[name]['dbs'] = parse_dbs(caches_info[name])
-            caches_info[name]['options'] = options
-
+        with _snapshot_lock:
+            if _snapshot[1] is None or time.time() - _snapshot[0] > self.snapshot_timeout:
+                _snapshot[:] = [time.time(), self.collect_info()]
+            return _snapshot[1]
+
+    def collect_info(self):
+        """
+        Query all nodes of all caches concurrently. Returns, by cache
+        name, ``{'nodes': {node: info}, 'aggregate': {...}, 'hot_keys':
+        [...]}``, hot keys being None if not enabled.
+        """
+        nodes = [(name, node, client) for name, cache in self.caches.iteritems()
+                    for node, client in cache.get_servers_by_name().iteritems()]
+        results = parallel_map(self.get_node_info, [(client,) for name, node, client in nodes])
+
+        caches_info = SortedDict()
+        for (name, node, client), node_info in zip(nodes, results):
+            caches_info.setdefault(name, {'nodes': SortedDict()})['nodes'][node] = node_info
+
+        for name, cache_info in caches_info.iteritems():
+            cache_info['aggregate'] = self.aggregate(cache_info['nodes'])
+            hot_keys = self.caches[name].hot_keys
+            cache_info['hot_keys'] = hot_keys and hot_keys.top(self.hot_keys_count)
         return caches_info
 
+    def get_node_info(self, client):
+        """
+        ``INFO`` and ``INFO commandstats`` of a node, in one round trip,
+        and the state of its circuit breaker (None if not enabled).
+        """
+        breaker = getattr(client, 'breaker', None)
+        circuit = breaker is not None and breaker.snapshot() or None
+        try:
+            pipeline = client.pipeline(transaction=False)
+            pipeline.info()
+            pipeline.info('commandstats')
+            info, commandstats = pipeline.execute()
+        except RedisError as e:
+            return {'error': str(e), 'circuit': circuit}
+
+        db = str(client.connection_pool.connection_kwargs.get('db', 0))
+        info['dbs'] = self.parse_dbs(info)
+        info['keys'] = info['dbs'].get(db, {}).get('keys', 0)
+        info['commandstats'] = dict((command.split('_', 1)[-1], stats)
+                                        for command, stats in commandstats.iteritems())
+        info['circuit'] = circuit
+        return info
+
+    def aggregate(self, nodes):
+        """
+        Totals of a cache over all its nodes. Server wide figures are
+        counted once per redis server, even if several nodes are
+        databases of the same server. ``key_skew`` is the keys of the
+        fullest node over the mean. ``bypassed`` are the nodes with the
+        circuit breaker open (or half-open).
+        """
+        servers, keys, unreachable, bypassed = {}, {}, 0, 0
+        for node, info in nodes.iteritems():
+            if info.get('circuit') and info['circuit']['state'] != 'closed':
+                bypassed += 1
+            if 'error' in info:
+                unreachable += 1
+                continue
+            servers[info['run_id']] = info
+            keys[node] = info['keys']
+
+        def total(field):
+            return sum(info.get(field, 0) for info in servers.values())
+
+        hits, misses = total('keyspace_hits'), total('keyspace_misses')
+        mean_keys = keys and float(sum(keys.values())) / len(keys) or 0
+        return {
+            'servers': len(servers),
+            'unreachable': unreachable,
+            'bypassed': bypassed,
+            'used_memory': total('used_memory'),
+            'instantaneous_ops_per_sec': total('instantaneous_ops_per_sec'),
+            'connected_clients': total('connected_clients'),
+            'keyspace_hits': hits,
+            'keyspace_misses': misses,
+            'hit_rate': hits + misses and float(hits) / (hits + misses) or 0.0,
+            'evicted_keys': total('evicted_keys'),
+            'expired_keys': total('expired_keys'),
+            'keys': sum(keys.values()),
+            'key_skew': mean_keys and max(keys.values()) / mean_keys or 0.0,
+        }
+
     def get(self, request):
         return render_to_response("redis_cache/stats.html", {},
             context_instance=RequestContext(request))
@@ -103,3 +180,21 @@ class RedisStatsView(View):
     @method_decorator(login_required)
     def dispatch(self, *args, **kwargs):
         return super(RedisStatsView, self).dispatch(*args, **kwargs)
+
+
+class RedisStatsJSONView(RedisStatsView):
+    """
+    Same stats, as JSON, for dashboards.
+    """
+    def get(self, request):
+        return HttpResponse(json.dumps(self.get_info(), cls=DjangoJSONEncoder),
+                            content_type='application/json')
+
+
+def metrics(request):
+    """
+    Metrics of the caches with the ``METRICS`` option, in the Prometheus
+    text format. Not login protected, so it can be scraped.
+    """
+    return HttpResponse(render_prometheus(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
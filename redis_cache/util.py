@@ -1,6 +1,13 @@
 # -*- coding: utf-8 -*-
 
+from django.core.exceptions import ImproperlyConfigured
 from django.utils.encoding import smart_unicode, smart_str
+from django.utils import importlib
+from django.utils import six
+
+import os
+import sys
+import threading
 
 class CacheKey(object):
     """
@@ -26,6 +33,145 @@ class CacheKey(object):
         return key
 
 
+def load_class(path):
+    """
+    Import and return the class referenced by a dotted ``path``.
+    """
+    mod_path, cls_name = path.rsplit('.', 1)
+    try:
+        mod = importlib.import_module(mod_path)
+    except ImportError as e:
+        raise ImproperlyConfigured("Could not find module '%s': %s" % (mod_path, e))
+
+    try:
+        return getattr(mod, cls_name)
+    except AttributeError:
+        raise ImproperlyConfigured("Could not find class '%s'" % path)
+
+
+class _Worker(object):
+    def __init__(self, pool, pid):
+        self.task = None
+        # Released to hand a task to the worker, cheaper than a queue.
+        self.ready = threading.Lock()
+        self.ready.acquire()
+        thread = threading.Thread(target=self._run, args=(pool, pid))
+        thread.daemon = True
+        thread.start()
+
+    def _run(self, pool, pid):
+        while True:
+            self.ready.acquire()
+            task, self.task = self.task, None
+            task()
+            if not pool._release(self, pid):
+                return
+
+
+class _WorkerPool(object):
+    """
+    Long lived worker threads for ``parallel_map``, started on demand up
+    to ``max_workers`` and kept idle between calls. A forked process
+    starts its own workers, as threads do not survive ``fork``.
+    """
+
+    def __init__(self, max_workers=64):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = []
+        self._workers = 0
+
+    def submit(self, task):
+        """
+        Run ``task`` in an idle worker, returning False if every worker
+        is busy and no more can be started.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+
+            if self._idle:
+                worker = self._idle.pop()
+            elif self._workers < self.max_workers:
+                worker = _Worker(self, self._pid)
+                self._workers += 1
+            else:
+                return False
+
+        worker.task = task
+        worker.ready.release()
+        return True
+
+    def _release(self, worker, pid):
+        with self._lock:
+            if self._pid != pid:
+                return False
+            self._idle.append(worker)
+            return True
+
+
+_pool = _WorkerPool()
+
+
+def parallel_map(func, items):
+    """
+    Call ``func(*item)`` for every item, concurrently, and return the
+    results in the same order as ``items``.
+
+    Used for fan-out of per-node requests on sharded caches, so the
+    latency of a call is bounded by the slowest node instead of the sum
+    of all of them. Items run in a pool of long lived threads, except the
+    first one (and any other when all threads are busy, so nested calls
+    never wait for each other), which runs in the calling thread. With a
+    single item no thread is used.
+    """
+    items = list(items)
+    if len(items) < 2:
+        return [func(*item) for item in items]
+
+    results = [None] * len(items)
+    errors = []
+    pending = [len(items) - 1]
+    counter = threading.Lock()
+    # Released by the last item run by the pool.
+    finished = threading.Lock()
+    finished.acquire()
+
+    def call(index, item):
+        try:
+            results[index] = func(*item)
+        except BaseException:
+            # Also GreenletExit or KeyboardInterrupt, re-raised by the caller
+            # instead of killing the worker.
+            errors.append(sys.exc_info())
+
+    def task(index, item):
+        def run():
+            try:
+                call(index, item)
+            finally:
+                with counter:
+                    pending[0] -= 1
+                    if not pending[0]:
+                        finished.release()
+        return run
+
+    for index, item in enumerate(items[1:], 1):
+        if not _pool.submit(task(index, item)):
+            task(index, item)()
+
+    call(0, items[0])
+    finished.acquire()
+
+    if errors:
+        six.reraise(*errors[0])
+    return results
+
+
 class Singleton(type):
     """ Singleton metaclass. """
 
@@ -39,41 +185,54 @@ class Singleton(type):
         return cls.__instance
 
 
-from collections import defaultdict
-from redis import ConnectionPool as RedisConnectionPool
 from redis.connection import UnixDomainSocketConnection, Connection
 from redis.connection import DefaultParser
+from .pool import ConnectionPool
 
 
 class ConnectionPoolHandler(object):
+    """
+    Process wide registry of connection pools, so all caches using the
+    same server and pool options share their connections.
+    """
     __metaclass__ = Singleton
     pools = {}
+    _lock = threading.Lock()
 
     def key_for_kwargs(self, kwargs):
-        return ":".join([str(v) for v in kwargs.values()])
+        return repr(sorted(kwargs.items()))
 
     def connection_pool(self, parser_class=DefaultParser, **kwargs):
-        pool_key = self.key_for_kwargs(kwargs)
+        pool_key = self.key_for_kwargs(dict(kwargs, parser_class=parser_class))
 
         if pool_key in self.pools:
             return self.pools[pool_key]
 
-        connection_class = kwargs['unix_socket_path'] \
-            and UnixDomainSocketConnection or Connection
-        
+        with self._lock:
+            if pool_key not in self.pools:
+                self.pools[pool_key] = self.make_connection_pool(parser_class, **kwargs)
+        return self.pools[pool_key]
+
+    def make_connection_pool(self, parser_class, db, password, host=None, port=None,
+                                unix_socket_path=None, socket_timeout=None,
+                                socket_connect_timeout=None, socket_keepalive=False,
+                                **pool_options):
         params = {
-            'connection_class': connection_class,
             'parser_class': parser_class,
-            'db': kwargs['db'],
-            'password': kwargs['password']
+            'db': db,
+            'password': password,
+            'socket_timeout': socket_timeout,
         }
 
         # port 6379
-        if kwargs['unix_socket_path']:
-            params['path'] = kwargs['unix_socket_path']
+        if unix_socket_path:
+            params['connection_class'] = UnixDomainSocketConnection
+            params['path'] = unix_socket_path
         else:
-            params['host'], params['port'] = kwargs['host'], kwargs['port']
-        
-        connection_pool = RedisConnectionPool(**params)
-        self.pools[pool_key] = connection_pool
-        return connection_pool
+            params['connection_class'] = Connection
+            params['host'], params['port'] = host, port
+            params['socket_connect_timeout'] = socket_connect_timeout
+            params['socket_keepalive'] = socket_keepalive
+
+        params.update(pool_options)
+        return ConnectionPool(**params)
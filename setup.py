@@ -12,11 +12,13 @@ setup(
     version=':versiontools:redis_cache:',
     packages = [
         "redis_cache",
+        "redis_cache.management",
+        "redis_cache.management.commands",
         "redis_cache.stats"
     ],
     description = description.strip(),
     install_requires=[
-        'redis>=2.4.5',
+        'redis>=2.10.0',
     ],
     setup_requires = [
         'versiontools >= 1.8',
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Requests per second of many concurrent clients sharing one cache, with a
+thread per client and, when gevent is installed, a greenlet per client.
+Each mode runs in its own process, as gevent must patch the standard
+library before anything else is imported. Needs a redis server.
+
+    python concurrency.py [-c CONCURRENCY] [-n REQUESTS] [-l LOCATION ...]
+
+With several ``-l`` locations the sharded backend is used.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import subprocess
+
+MODES = ['threads', 'gevent']
+
+
+def run(mode, options):
+    if mode == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+
+    import threading
+    import time
+
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+    locations = options.locations or ['127.0.0.1:6379']
+    backend = len(locations) > 1 and 'ShardedRedisCache' or 'RedisCache'
+
+    from django.conf import settings
+    settings.configure(CACHES={
+        'default': {
+            'BACKEND': 'redis_cache.cache.%s' % backend,
+            'LOCATION': len(locations) > 1 and locations or locations[0],
+            'OPTIONS': {'DB': options.db},
+        }
+    })
+
+    from django.core.cache import get_cache
+    cache = get_cache('default')
+
+    keys = ['concurrency:%s' % x for x in xrange(100)]
+    cache.set_many(dict((key, 'x' * 100) for key in keys))
+
+    start_event = threading.Event()
+
+    def client(index):
+        start_event.wait()
+        for x in xrange(options.requests):
+            # One multi key request out of ten, the rest single gets.
+            if x % 10 == 0:
+                cache.get_many(keys[:10])
+            else:
+                cache.get(keys[(index + x) % len(keys)])
+
+    clients = [threading.Thread(target=client, args=(index,))
+                    for index in xrange(options.concurrency)]
+    for thread in clients:
+        thread.start()
+
+    start = time.time()
+    start_event.set()
+    for thread in clients:
+        thread.join()
+    elapsed = time.time() - start
+
+    cache.delete_many(keys)
+    return options.concurrency * options.requests / elapsed
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    parser = OptionParser()
+    parser.add_option('-c', '--concurrency', type='int', dest='concurrency', default=1000)
+    parser.add_option('-n', '--requests', type='int', dest='requests', default=50,
+                        help='requests done by every client')
+    parser.add_option('-l', '--location', action='append', dest='locations')
+    parser.add_option('--db', type='int', dest='db', default=15)
+    parser.add_option('--mode', dest='mode', choices=MODES, help='run only this mode')
+    options, args = parser.parse_args()
+
+    if options.mode:
+        print(run(options.mode, options))
+        sys.exit(0)
+
+    print("%-10s %12s" % ('mode', 'requests/s'))
+    for mode in MODES:
+        process = subprocess.Popen([sys.executable, __file__, '--mode', mode] + sys.argv[1:],
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = process.communicate()
+        if process.returncode:
+            print("%-10s %12s" % (mode, 'failed: %s' % err.strip().splitlines()[-1]))
+        else:
+            print("%-10s %12.0f" % (mode, float(out)))
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure HashRing lookups per second, in compat and fast modes, for
+distinct keys (memo misses) and for a small set of hot keys (memo hits).
+
+    python hash_ring.py [-n NODES] [-k KEYS]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from redis_cache.hash_ring import HashRing
+
+
+def bench(ring, keys, repeat=3):
+    best = None
+    for x in xrange(repeat):
+        ring._memo.clear()
+        get_node = ring.get_node
+
+        start = time.time()
+        for key in keys:
+            get_node(key)
+        elapsed = time.time() - start
+        best = best is None and elapsed or min(best, elapsed)
+
+    return len(keys) / best
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    parser = OptionParser()
+    parser.add_option('-n', '--nodes', type='int', dest='nodes', default=4)
+    parser.add_option('-k', '--keys', type='int', dest='keys', default=100000)
+    options, args = parser.parse_args()
+
+    nodes = ['127.0.0.1:6379:%s' % x for x in xrange(options.nodes)]
+    distinct = [':1:key%s' % x for x in xrange(options.keys)]
+    hot = distinct[:1000] * (options.keys // 1000)
+
+    print("%-10s %15s %15s" % ('mode', 'distinct/s', 'hot/s'))
+    for compat in (True, False):
+        ring = HashRing(nodes, compat=compat)
+        print("%-10s %15.0f %15.0f" % (compat and 'compat' or 'fast',
+                                bench(ring, distinct), bench(ring, hot)))
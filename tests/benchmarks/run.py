@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Throughput and latency of the cache backends. Starts its own redis-server
+instances (one per shard, on free ports, without persistence), runs every
+combination of the given parameters and reports ops/s (keys per second)
+and p50/p99 latency (per call) of each one.
+
+    python run.py [--workloads get,set,get_many,set_many] [--value-sizes 100,10000]
+                  [--batch-sizes 10,100] [--hit-ratios 0.9] [--threads 1,8]
+                  [--shards 1,3] [--keys 10000] [--calls 1000]
+                  [--redis-server PATH] [--json FILE] [--compare FILE]
+
+Parameters accept comma separated lists. ``--json`` saves the results,
+``--compare`` prints the change of every result against a saved file
+(for example, the results of the previous commit).
+"""
+
+from __future__ import print_function
+
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from django.conf import settings
+settings.configure()
+
+from django.core.cache import get_cache
+from redis import Redis
+from redis.exceptions import ConnectionError
+
+WORKLOADS = ['get', 'set', 'get_many', 'set_many']
+PARAMETERS = ['workload', 'value_size', 'batch_size', 'hit_ratio', 'threads', 'shards']
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def start_servers(count, redis_server):
+    """
+    Start ``count`` redis servers, returns ``[(process, port), ...]``.
+    """
+    servers = []
+    for x in xrange(count):
+        port = free_port()
+        process = subprocess.Popen([redis_server, '--port', str(port), '--bind', '127.0.0.1',
+                                    '--save', '', '--appendonly', 'no'],
+                                    stdout=open(os.devnull, 'w'))
+        servers.append((process, port))
+
+    for process, port in servers:
+        client = Redis(port=port)
+        for x in xrange(100):
+            try:
+                client.ping()
+                break
+            except ConnectionError:
+                time.sleep(0.05)
+        else:
+            raise RuntimeError("redis-server on port %s did not start" % port)
+    return servers
+
+
+def make_cache(ports, shards):
+    if shards == 1:
+        return get_cache('redis_cache.cache.RedisCache', LOCATION='127.0.0.1:%s' % ports[0],
+                            OPTIONS={'DB': 0})
+    return get_cache('redis_cache.cache.ShardedRedisCache',
+                        LOCATION=['127.0.0.1:%s:0' % port for port in ports[:shards]])
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(cache, workload, value_size, batch_size, hit_ratio, threads, keys, calls):
+    """
+    Run ``calls`` calls of ``workload`` in each of ``threads`` threads.
+    Reads go to a missing key with probability ``1 - hit_ratio``.
+    """
+    value = 'x' * value_size
+    cache.clear()
+    for start in xrange(0, keys, 1000):
+        cache.set_many(dict(('key:%s' % x, value)
+                        for x in xrange(start, min(keys, start + 1000))))
+
+    if not workload.endswith('_many'):
+        batch_size = 1
+
+    def make_keys(rand):
+        return [rand.random() < hit_ratio and 'key:%s' % rand.randrange(keys)
+                    or 'missing:%s' % rand.randrange(keys) for x in xrange(batch_size)]
+
+    operations = {
+        'get': lambda batch: cache.get(batch[0]),
+        'set': lambda batch: cache.set(batch[0], value),
+        'get_many': lambda batch: cache.get_many(batch),
+        'set_many': lambda batch: cache.set_many(dict((key, value) for key in batch)),
+    }
+    operation = operations[workload]
+    latencies = []
+    start_event = threading.Event()
+
+    def worker(seed):
+        rand = random.Random(seed)
+        batches = [make_keys(rand) for x in xrange(calls)]
+        _latencies = []
+
+        start_event.wait()
+        for batch in batches:
+            start = time.time()
+            operation(batch)
+            _latencies.append(time.time() - start)
+        latencies.extend(_latencies)
+
+    workers = [threading.Thread(target=worker, args=(x,)) for x in xrange(threads)]
+    for thread in workers:
+        thread.start()
+
+    start = time.time()
+    start_event.set()
+    for thread in workers:
+        thread.join()
+    elapsed = time.time() - start
+
+    latencies.sort()
+    return {
+        'ops_per_sec': threads * calls * batch_size / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def result_key(result):
+    return tuple(result[name] for name in PARAMETERS)
+
+
+def print_results(results, previous=None):
+    previous = dict((result_key(result), result) for result in previous or [])
+
+    print("%-9s %7s %6s %5s %7s %6s %12s %9s %9s%s" % ('workload', 'size', 'batch', 'hit',
+                'threads', 'shards', 'ops/s', 'p50 ms', 'p99 ms', previous and '   change' or ''))
+    for result in results:
+        change = ''
+        old = previous.get(result_key(result))
+        if old is not None:
+            change = ' %+8.1f%%' % ((result['ops_per_sec'] / old['ops_per_sec'] - 1) * 100)
+
+        print("%-9s %7d %6d %5.2f %7d %6d %12.0f %9.3f %9.3f%s" % (result['workload'],
+                result['value_size'], result['batch_size'], result['hit_ratio'],
+                result['threads'], result['shards'], result['ops_per_sec'],
+                result['p50_ms'], result['p99_ms'], change))
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                            cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def split(cast):
+    def callback(option, opt, value, parser):
+        setattr(parser.values, option.dest, [cast(item) for item in value.split(',')])
+    return callback
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    parser = OptionParser()
+    for name, cast, default in [('workloads', str, WORKLOADS),
+                                ('value-sizes', int, [100, 10000]),
+                                ('batch-sizes', int, [10, 100]),
+                                ('hit-ratios', float, [0.9]),
+                                ('threads', int, [1, 8]),
+                                ('shards', int, [1, 3])]:
+        parser.add_option('--' + name, dest=name.replace('-', '_'), type='string',
+                            action='callback', callback=split(cast), default=default)
+    parser.add_option('--keys', type='int', dest='keys', default=10000)
+    parser.add_option('--calls', type='int', dest='calls', default=1000,
+                        help='calls done by every thread')
+    parser.add_option('--redis-server', dest='redis_server', default='redis-server')
+    parser.add_option('--json', dest='json', help='save the results to this file')
+    parser.add_option('--compare', dest='compare', help='compare with results saved with --json')
+    options, args = parser.parse_args()
+
+    servers = start_servers(max(options.shards), options.redis_server)
+    ports = [port for process, port in servers]
+    results = []
+    try:
+        for shards in options.shards:
+            cache = make_cache(ports, shards)
+            for workload, value_size, batch_size, hit_ratio, threads in itertools.product(
+                    options.workloads, options.value_sizes, options.batch_sizes,
+                    options.hit_ratios, options.threads):
+                # Batch size only applies to multi key workloads.
+                if not workload.endswith('_many'):
+                    if batch_size != options.batch_sizes[0]:
+                        continue
+                    batch_size = 1
+
+                result = {'workload': workload, 'value_size': value_size,
+                            'batch_size': batch_size, 'hit_ratio': hit_ratio,
+                            'threads': threads, 'shards': shards}
+                result.update(run(cache, workload, value_size, batch_size, hit_ratio,
+                                    threads, options.keys, options.calls))
+                results.append(result)
+    finally:
+        for process, port in servers:
+            process.terminate()
+            process.wait()
+
+    previous = None
+    if options.compare:
+        with open(options.compare) as f:
+            previous = json.load(f)['results']
+    print_results(results, previous)
+
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump({'revision': git_revision(), 'python': sys.version.split()[0],
+                        'keys': options.keys, 'calls': options.calls,
+                        'results': results}, f, indent=2)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure encode/decode cost and payload size of every serializer over
+some representative django payloads. Does not need a redis server.
+
+    python serializers.py [-n ITERATIONS]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from django.conf import settings
+settings.configure()
+
+from redis_cache.cache import RedisCache
+from redis_cache.serializers import msgpack
+
+SERIALIZERS = [
+    'redis_cache.serializers.PickleSerializer',
+    'redis_cache.serializers.JSONSerializer',
+    'redis_cache.serializers.MarshalSerializer',
+]
+
+if msgpack is not None:
+    SERIALIZERS.append('redis_cache.serializers.MsgPackSerializer')
+
+
+def make_payloads():
+    now = datetime.datetime(2012, 8, 22, 12, 30)
+    rows = [{'id': x, 'title': u'Entry number %s' % x, 'score': x * 1.5,
+             'published': x % 2 == 0, 'tags': [u'django', u'redis']}
+                for x in xrange(100)]
+
+    fragment = u'<ul>%s</ul>' % u''.join(u'<li class="item">Entrý %s</li>' % x
+                                            for x in xrange(200))
+    return [
+        ('int', 123456),
+        ('float', 3.14159),
+        ('bytes', 'x' * 1024),
+        ('template fragment', fragment),
+        ('queryset values', rows),
+        ('dict with datetime', {'id': 1, 'name': u'Foo', 'date': now.isoformat()}),
+    ]
+
+
+def bench(serializer, payloads, iterations):
+    cache = RedisCache('127.0.0.1:6379', {'OPTIONS': {'SERIALIZER': serializer}})
+
+    for name, value in payloads:
+        start = time.time()
+        for x in xrange(iterations):
+            data = cache.pickle(value)
+        encode = (time.time() - start) / iterations
+
+        start = time.time()
+        for x in xrange(iterations):
+            cache.unpickle(str(data))
+        decode = (time.time() - start) / iterations
+
+        print("%-20s %-20s %10.2f %10.2f %10d" % (serializer.rsplit('.', 1)[1],
+                    name, encode * 1e6, decode * 1e6, len(str(data))))
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    parser = OptionParser()
+    parser.add_option('-n', '--iterations', type='int', dest='iterations', default=1000)
+    options, args = parser.parse_args()
+
+    payloads = make_payloads()
+    print("%-20s %-20s %10s %10s %10s" % ('serializer', 'payload', 'encode us',
+                                                    'decode us', 'bytes'))
+    for serializer in SERIALIZERS:
+        bench(serializer, payloads, options.iterations)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare sharding strategies: key distribution skew (with and without
+node weights), keys moved when a node is added, lookup cost and memory.
+
+    python sharding.py [-n NODES] [-k KEYS]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from redis_cache.hash_ring import HashRing
+from redis_cache.sharding import JumpHash, RendezvousHash
+
+STRATEGIES = [
+    ('ring (compat)', lambda nodes, weights: HashRing(nodes, weights=weights, memo_size=0)),
+    ('ring', lambda nodes, weights: HashRing(nodes, weights=weights, compat=False, memo_size=0)),
+    ('jump', lambda nodes, weights: JumpHash(nodes, weights=weights, memo_size=0)),
+    ('rendezvous', lambda nodes, weights: RendezvousHash(nodes, weights=weights, memo_size=0)),
+]
+
+
+def imbalance(sharding, nodes, weights, keys):
+    """
+    Returns the max ratio between the keys a node gets and the keys
+    it should get by its weight (1.0 is a perfect distribution).
+    """
+    counts = dict((node, 0) for node in nodes)
+    for key in keys:
+        counts[sharding.get_node(key)] += 1
+
+    total_weight = float(sum(weights.get(node, 1) for node in nodes))
+    return max(count / (len(keys) * weights.get(node, 1) / total_weight)
+                    for node, count in counts.items())
+
+
+def bench(factory, nodes, keys):
+    weights = dict((node, index % 2 + 1) for index, node in enumerate(nodes))
+    sharding = factory(nodes, {})
+
+    points = len(getattr(sharding, 'sorted_keys', getattr(sharding, '_buckets', nodes)))
+
+    start = time.time()
+    before = [sharding.get_node(key) for key in keys]
+    lookups = len(keys) / (time.time() - start)
+
+    sharding.add_node('new-node')
+    moved = sum(1 for key, node in zip(keys, before) if sharding.get_node(key) != node)
+    return (imbalance(factory(nodes, {}), nodes, {}, keys),
+            imbalance(factory(nodes, weights), nodes, weights, keys),
+            float(moved) / len(keys), lookups, points)
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    parser = OptionParser()
+    parser.add_option('-n', '--nodes', type='int', dest='nodes', default=8)
+    parser.add_option('-k', '--keys', type='int', dest='keys', default=100000)
+    options, args = parser.parse_args()
+
+    nodes = ['127.0.0.1:6379:%s' % x for x in xrange(options.nodes)]
+    keys = [':1:key%s' % x for x in xrange(options.keys)]
+
+    print("%-15s %10s %10s %10s %12s %8s" % ('strategy', 'skew', 'skew (w)',
+                                            'moved', 'lookups/s', 'points'))
+    for name, factory in STRATEGIES:
+        skew, weighted_skew, moved, lookups, points = bench(factory, nodes, keys)
+        print("%-15s %10.3f %10.3f %9.1f%% %12.0f %8d" % (name, skew, weighted_skew,
+                                                        moved * 100, lookups, points))
@@ -2,7 +2,10 @@
 
 from django.test import TestCase
 
+import threading
+
 from redis_cache.hash_ring import HashRing
+from redis_cache.sharding import JumpHash, RendezvousHash
 
 
 class Node(object):
@@ -29,3 +32,150 @@ class HashRingTest(TestCase):
             ids.append(node.id)
 
         self.assertEqual(ids, [0, 1, 2, 0, 2, 0, 2, 2, 0, 2])
+
+    def test_hashring_fast(self):
+        ring = HashRing(self.nodes, compat=False)
+        counts = dict((node.id, 0) for node in self.nodes)
+
+        for x in xrange(3000):
+            key = "test{0}".format(x)
+            node = ring.get_node(key)
+            self.assertEqual(node, ring.get_node_pos(key)[0])
+            counts[node.id] += 1
+
+        for count in counts.values():
+            self.assertTrue(700 < count < 1300)
+
+    def test_remove_node(self):
+        keys = ["test{0}".format(x) for x in xrange(100)]
+        before = dict((key, self.ring.get_node(key)) for key in keys)
+
+        self.ring.remove_node(self.node1)
+        for key in keys:
+            node = self.ring.get_node(key)
+            self.assertNotEqual(node, self.node1)
+            if before[key] is not self.node1:
+                self.assertEqual(node, before[key])
+
+        self.ring.add_node(self.node1)
+        self.assertEqual(before, dict((key, self.ring.get_node(key)) for key in keys))
+
+    def test_iter_nodes(self):
+        nodes = [node for point, node in self.ring.iter_nodes("test0")]
+        self.assertEqual(len(nodes), 3 * self.ring.replicas)
+        self.assertEqual(nodes[0], self.ring.get_node("test0"))
+
+    def test_get_nodes(self):
+        for ring in (self.ring, HashRing(self.nodes, compat=False)):
+            for key in ["test{0}".format(x) for x in xrange(10)]:
+                nodes = ring.get_nodes(key, 2)
+                self.assertEqual(nodes[0], ring.get_node(key))
+                self.assertEqual(len(set(nodes)), 2)
+            self.assertEqual(len(ring.get_nodes("test0", 5)), 3)
+
+    def test_memo(self):
+        ring = HashRing(self.nodes, memo_size=5)
+        for key in ["test{0}".format(x) for x in xrange(12)]:
+            self.assertEqual(ring.get_node(key), ring.get_node_pos(key)[0])
+            self.assertTrue(len(ring._memo) <= 5)
+
+    def test_concurrent_changes(self):
+        ring = HashRing(self.nodes, replicas=16)
+        keys = ["test{0}".format(x) for x in xrange(200)]
+        errors = []
+        stop = threading.Event()
+
+        def lookup():
+            while not stop.is_set():
+                try:
+                    for key in keys:
+                        assert ring.get_node(key) in self.nodes
+                        assert ring.get_nodes(key, 2)
+                except Exception as e:
+                    errors.append(e)
+                    return
+
+        threads = [threading.Thread(target=lookup) for x in xrange(2)]
+        for thread in threads:
+            thread.start()
+        for x in xrange(200):
+            ring.remove_node(self.node1)
+            ring.add_node(self.node1)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_weights(self):
+        ring = HashRing(self.nodes, compat=False, weights={self.node2: 2})
+        counts = dict((node.id, 0) for node in self.nodes)
+
+        for x in xrange(4000):
+            counts[ring.get_node("test{0}".format(x)).id] += 1
+        self.assertTrue(1600 < counts[2] < 2400)
+
+        self.assertEqual(HashRing(self.nodes, weights={self.node2: 2.0}).weights[self.node2], 2)
+        self.assertRaises(ValueError, HashRing, self.nodes, weights={self.node2: 0.5})
+        self.assertRaises(ValueError, ring.add_node, 'other', 1.5)
+        self.assertFalse('other' in ring.nodes)
+
+
+class ShardingTest(TestCase):
+    nodes = ['127.0.0.1:6379:%s' % x for x in xrange(4)]
+    keys = ["test{0}".format(x) for x in xrange(4000)]
+
+    def check_distribution(self, cls, weights=None):
+        sharding = cls(self.nodes, weights=weights)
+        counts = dict((node, 0) for node in self.nodes)
+
+        for key in self.keys:
+            counts[sharding.get_node(key)] += 1
+
+        total_weight = sum((weights or {}).get(node, 1) for node in self.nodes)
+        for node, count in counts.items():
+            expected = len(self.keys) * (weights or {}).get(node, 1) / float(total_weight)
+            self.assertTrue(0.8 < count / expected < 1.2)
+
+    def check_add_node(self, cls):
+        sharding = cls(self.nodes)
+        before = dict((key, sharding.get_node(key)) for key in self.keys)
+
+        sharding.add_node('127.0.0.1:6379:4')
+        moved = [key for key in self.keys if sharding.get_node(key) != before[key]]
+        self.assertTrue(len(moved) < len(self.keys) / 4)
+        for key in moved:
+            self.assertEqual(sharding.get_node(key), '127.0.0.1:6379:4')
+
+    def test_jump(self):
+        self.check_distribution(JumpHash)
+        self.check_distribution(JumpHash, {self.nodes[0]: 3})
+        self.check_add_node(JumpHash)
+
+    def test_rendezvous(self):
+        self.check_distribution(RendezvousHash)
+        self.check_distribution(RendezvousHash, {self.nodes[0]: 3})
+        self.check_add_node(RendezvousHash)
+
+    def test_weight_values(self):
+        self.assertRaises(ValueError, JumpHash, self.nodes, weights={self.nodes[0]: 1.5})
+        self.assertRaises(ValueError, RendezvousHash, self.nodes, weights={self.nodes[0]: 0})
+        self.assertRaises(ValueError, RendezvousHash(self.nodes).add_node, 'other', 'heavy')
+        self.check_distribution(RendezvousHash, {self.nodes[0]: 0.5})
+
+    def test_rendezvous_remove_node(self):
+        sharding = RendezvousHash(self.nodes)
+        before = dict((key, sharding.get_node(key)) for key in self.keys)
+
+        sharding.remove_node(self.nodes[1])
+        for key in self.keys:
+            if before[key] != self.nodes[1]:
+                self.assertEqual(sharding.get_node(key), before[key])
+
+    def test_get_nodes(self):
+        for cls in (JumpHash, RendezvousHash):
+            sharding = cls(self.nodes)
+            for key in self.keys[:100]:
+                nodes = sharding.get_nodes(key, 3)
+                self.assertEqual(nodes[0], sharding.get_node(key))
+                self.assertEqual(len(set(nodes)), 3)
+            self.assertEqual(len(sharding.get_nodes('test0', 10)), 4)
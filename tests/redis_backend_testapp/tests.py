@@ -2,6 +2,41 @@
 
 from django.test import TestCase
 from django.core.cache import cache, get_cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import CommandError
+
+from redis_cache.serializers import msgpack
+from redis_cache.compressors import lzma
+from redis_cache.local import LocalCache, InvalidationListener
+from redis_cache.migration import migrate_keys
+from redis_cache.management.commands.redis_cache_migrate import Command as MigrateCommand
+from redis_cache.cache import ClusterRedisCache, _XFETCH_PREFIX, _xfetch_header
+from redis_cache.cluster import key_slot
+from redis_cache.pool import ConnectionPool
+from redis_cache.breaker import CircuitBreaker, CircuitOpenError
+from redis_cache.hotkeys import HotKeys, SpaceSaving
+from redis_cache.session import SessionStore
+from redis_cache.util import parallel_map
+from redis_cache import util
+from redis_cache.replicas import (ReplicaRedis, Replica, RoundRobinPolicy, LocalFirstPolicy,
+                                  LeastOutstandingPolicy, is_lagging)
+from redis_cache.metrics import render_prometheus
+from redis_cache.stats.views import metrics as metrics_view
+from redis_cache.stats.views import RedisStatsView, RedisStatsJSONView
+from redis_cache import stats as stats_app
+from django.template import Template, Context
+from django.utils.datastructures import SortedDict
+
+import json
+from redis import Redis
+from redis.exceptions import ConnectionError
+
+import os
+import random
+import sys
+import traceback
+import threading
+
 import time
 import datetime
 
@@ -30,6 +65,13 @@ class DjangoRedisCacheTests(TestCase):
         self.assertIsInstance(res, unicode)
         self.assertEqual(res, u"heló")
 
+    def test_save_bytes_with_marker(self):
+        self.cache.set("test_key", "\x00f1.5")
+        res = self.cache.get("test_key")
+
+        self.assertIsInstance(res, str)
+        self.assertEqual(res, "\x00f1.5")
+
     def test_save_dict(self):
         now_dt = datetime.datetime.now()
         test_dict = {'id':1, 'date': now_dt, 'name': u'Foo'}
@@ -65,6 +107,24 @@ class DjangoRedisCacheTests(TestCase):
 
         self.assertEqual(res, 'Initial value')
 
+    def test_add(self):
+        self.cache.delete('add_key')
+        self.assertTrue(self.cache.add('add_key', 'Initial value', timeout=3))
+        self.assertFalse(self.cache.add('add_key', 'New value'))
+        self.assertEqual(self.cache.get('add_key'), 'Initial value')
+
+        time.sleep(4)
+        self.assertEqual(self.cache.get('add_key'), None)
+
+    def test_add_many(self):
+        self.cache.delete_many(['a', 'b', 'c'])
+        self.cache.set('b', 'old')
+
+        res = self.cache.add_many({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(set(res), set(['a', 'c']))
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']),
+                                    {'a': 1, 'b': 'old', 'c': 3})
+
     def test_get_many(self):
         self.cache.set('a', 1)
         self.cache.set('b', 2)
@@ -81,6 +141,20 @@ class DjangoRedisCacheTests(TestCase):
         res = self.cache.get_many(['a','b','c'])
         self.assertEqual(res, {'a': '1', 'b': '2', 'c': '3'})
 
+    def test_get_many_order(self):
+        keys = ['key%s' % x for x in xrange(50)]
+        for index, key in enumerate(keys):
+            self.cache.set(key, index)
+
+        self.cache.set('{tag}a', 'a')
+        self.cache.set('{tag}b', 'b')
+        keys.extend(['missing', '{tag}a', '{tag}b'])
+
+        res = self.cache.get_many(keys)
+        self.assertEqual(res.keys(), keys[:50] + ['{tag}a', '{tag}b'])
+        self.assertEqual(res['key10'], 10)
+        self.assertEqual(res['{tag}b'], 'b')
+
     def test_set_many(self):
         self.cache.set_many({'a': 1, 'b': 2, 'c': 3})
         res = self.cache.get_many(['a', 'b', 'c'])
@@ -99,6 +173,14 @@ class DjangoRedisCacheTests(TestCase):
         res = self.cache.get_many(['a', 'b', 'c'])
         self.assertEqual(res, {'c': 3})
 
+    def test_set_many_delete_many_bulk(self):
+        data = dict(('bulk%s' % x, x) for x in xrange(100))
+        self.cache.set_many(data, timeout=30)
+        self.assertEqual(self.cache.get_many(data.keys()), data)
+
+        self.cache.delete_many(data.keys())
+        self.assertEqual(self.cache.get_many(data.keys()), {})
+
     def test_incr(self):
         self.cache.set("num", 1)
 
@@ -121,6 +203,31 @@ class DjangoRedisCacheTests(TestCase):
         res = self.cache.get("num")
         self.assertEqual(res, -1)
 
+    def test_incr_keeps_timeout(self):
+        self.cache.set("num", 1, timeout=3)
+        self.assertEqual(self.cache.incr("num", 5), 6)
+        time.sleep(4)
+
+        self.assertEqual(self.cache.get("num"), None)
+
+    def test_incr_missing_key(self):
+        self.cache.delete("missing_num")
+        self.assertRaises(ValueError, self.cache.incr, "missing_num")
+        self.assertEqual(self.cache.get("missing_num"), None)
+
+    def test_incr_big_numbers(self):
+        self.cache.set("num", 2 ** 63 - 1)
+        res = self.cache.incr("num")
+        self.assertEqual(res, 2 ** 63)
+        self.assertEqual(self.cache.get("num"), 2 ** 63)
+
+    def test_save_bool(self):
+        self.cache.set("test_key", True)
+        res = self.cache.get("test_key")
+
+        self.assertIsInstance(res, bool)
+        self.assertEqual(res, True)
+
     def test_version(self):
         self.cache.set("keytest", 2, version=2)
         res = self.cache.get("keytest")
@@ -147,6 +254,1245 @@ class DjangoRedisCacheTests(TestCase):
         keys = self.cache.keys("foo*")
         self.assertEqual(set(keys), set(['foo-bb','foo-bc']))
 
+    def test_iter_keys(self):
+        for key in ['iter-%s' % x for x in xrange(30)]:
+            self.cache.set(key, "foo")
+
+        keys = self.cache.iter_keys("iter-*", itersize=5)
+        self.assertFalse(isinstance(keys, list))
+        self.assertEqual(set(keys), set(['iter-%s' % x for x in xrange(30)]))
+
+        self.cache.delete_pattern("iter-*", itersize=7)
+        self.assertEqual(self.cache.keys("iter-*"), [])
+
     def test_close(self):
         cache = get_cache('default')
         cache.close()
+
+
+class SerializerTests(TestCase):
+    def get_cache(self, serializer):
+        return get_cache('redis_cache.cache.RedisCache', LOCATION='127.0.0.1:6379',
+                            OPTIONS={'DB': 15, 'SERIALIZER': serializer})
+
+    def check_serializer(self, serializer):
+        cache = self.get_cache(serializer)
+        values = [1, -2, 1.5, 'bytes', u'heló', [1, 'a'], {'id': 1, 'name': u'Foo'}]
+
+        for value in values:
+            cache.set("serializer_key", value)
+            self.assertEqual(cache.get("serializer_key"), value)
+
+        cache.set("serializer_key", 1)
+        self.assertEqual(cache.incr("serializer_key"), 2)
+
+    def test_pickle(self):
+        self.check_serializer('redis_cache.serializers.PickleSerializer')
+
+    def test_json(self):
+        self.check_serializer('redis_cache.serializers.JSONSerializer')
+
+    def test_marshal(self):
+        self.check_serializer('redis_cache.serializers.MarshalSerializer')
+
+    def test_msgpack(self):
+        if msgpack is None:
+            return
+        self.check_serializer('redis_cache.serializers.MsgPackSerializer')
+
+    def test_invalid_serializer(self):
+        self.assertRaises(ImproperlyConfigured, self.get_cache,
+                            'redis_cache.serializers.FooSerializer')
+
+
+class CompressorTests(TestCase):
+    def get_cache(self, compressor, **options):
+        options.update({'DB': 15, 'COMPRESSOR': compressor})
+        return get_cache('redis_cache.cache.RedisCache', LOCATION='127.0.0.1:6379',
+                                                            OPTIONS=options)
+
+    def check_compressor(self, compressor):
+        cache = self.get_cache(compressor, COMPRESS_MIN_LENGTH=100)
+        big_values = {'big_bytes': 'x' * 1000, 'big_unicode': u'ý' * 1000,
+                      'big_list': range(1000)}
+        small_values = {'small': 'x' * 10, 'num': 42}
+
+        cache.set_many(dict(big_values, **small_values))
+        self.assertEqual(cache.get_many(big_values.keys() + small_values.keys()),
+                                                dict(big_values, **small_values))
+
+        raw = cache._client.get(cache.make_key('big_bytes'))
+        self.assertTrue(len(raw) < 1000)
+        raw = cache._client.get(cache.make_key('small'))
+        self.assertEqual(raw, '\x00bxxxxxxxxxx')
+
+        # Uncompressed values written before keep being readable.
+        self.get_cache(None).set('big_bytes', 'y' * 1000)
+        self.assertEqual(cache.get('big_bytes'), 'y' * 1000)
+
+        # And compressed ones after disabling or changing the compressor.
+        for other in (None, 'redis_cache.compressors.ZlibCompressor',
+                            'redis_cache.compressors.Bz2Compressor'):
+            self.assertEqual(self.get_cache(other).get('big_list'), range(1000))
+
+    def test_zlib(self):
+        self.check_compressor('redis_cache.compressors.ZlibCompressor')
+
+    def test_bz2(self):
+        self.check_compressor('redis_cache.compressors.Bz2Compressor')
+
+    def test_lzma(self):
+        if lzma is None:
+            return
+        self.check_compressor('redis_cache.compressors.LzmaCompressor')
+
+    def test_invalid_level(self):
+        self.assertRaises(ImproperlyConfigured, self.get_cache,
+                            'redis_cache.compressors.ZlibCompressor', COMPRESS_LEVEL='high')
+
+
+class LocalCacheTests(TestCase):
+    def get_cache(self, **options):
+        options.setdefault('TIMEOUT', 60)
+        return get_cache('redis_cache.cache.RedisCache', LOCATION='127.0.0.1:6379',
+                            OPTIONS={'DB': 15, 'LOCAL_CACHE': options})
+
+    def test_lru(self):
+        local = LocalCache({'MAX_ENTRIES': 2, 'MAX_BYTES': 10})
+        local.set('a', '1')
+        local.set('b', '2')
+        local.get('a')
+        local.set('c', '3')
+
+        self.assertEqual(local.get('b'), None)
+        self.assertEqual(local.get('a'), '1')
+
+        local.set('d', 'x' * 9)
+        self.assertEqual(local.stats()['bytes'], 10)
+        self.assertEqual(local.get('c'), None)
+        self.assertEqual(local.get('a'), '1')
+
+    def test_timeout(self):
+        local = LocalCache({'TIMEOUT': 0.5})
+        local.set('a', '1')
+        self.assertEqual(local.get('a'), '1')
+
+        time.sleep(0.6)
+        self.assertEqual(local.get('a'), None)
+
+    def test_hits(self):
+        cache = self.get_cache()
+        cache.set('local_key', 'value')
+        cache.delete('local_missing')
+
+        for x in xrange(3):
+            self.assertEqual(cache.get('local_key'), 'value')
+        self.assertEqual(cache.get_many(['local_key', 'local_missing']),
+                                                    {'local_key': 'value'})
+
+        stats = cache.local_cache.stats()
+        self.assertEqual(stats['local_hits'], 3)
+        self.assertEqual(stats['remote_hits'], 1)
+        self.assertEqual(stats['remote_misses'], 1)
+
+    def test_invalidation(self):
+        cache1, cache2 = self.get_cache(), self.get_cache()
+        cache1.set('local_key', 'value')
+        self.assertEqual(cache2.get('local_key'), 'value')
+
+        time.sleep(0.1)
+        cache1.set('local_key', 'new value')
+        time.sleep(0.1)
+        self.assertEqual(cache2.get('local_key'), 'new value')
+
+        cache1.delete_many(['local_key'])
+        time.sleep(0.1)
+        self.assertEqual(cache2.get('local_key'), None)
+
+    def test_publish(self):
+        cache = self.get_cache(CHANNEL='test_publish')
+        pubsub = Redis(db=15).pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe('test_publish')
+        pubsub.get_message(timeout=1)
+
+        def messages():
+            time.sleep(0.1)
+            received = []
+            message = pubsub.get_message()
+            while message is not None:
+                received.append(sorted(message['data'].split('\x00')))
+                message = pubsub.get_message()
+            return received
+
+        keys = ['local_%s' % x for x in xrange(5)]
+        made = sorted(str(cache.make_key(key)) for key in keys)
+        cache.set_many(dict((key, 1) for key in keys))
+        self.assertEqual(messages(), [made])
+        self.assertEqual(cache.add_many(dict((key, 1) for key in keys)), [])
+        self.assertEqual(messages(), [made])
+
+        # Single key writes send the message with the command.
+        self.assertTrue(cache.set('local_0', 1))
+        self.assertEqual(cache.incr('local_0'), 2)
+        cache.delete('local_0')
+        self.assertEqual(messages(), [made[:1]] * 3)
+
+        with cache.batch() as batch:
+            for key in keys:
+                batch.incr(key)
+        self.assertEqual(messages(), [made])
+        cache.delete_many(keys)
+        self.assertEqual(messages(), [made])
+        pubsub.close()
+
+    def test_added_node(self):
+        cache = get_cache('redis_cache.cache.ShardedRedisCache',
+                            LOCATION=['127.0.0.1:6379:3', '127.0.0.1:6379:4'],
+                            OPTIONS={'LOCAL_CACHE': {'CHANNEL': 'test_added_node'}})
+        def listeners(client):
+            return [thread for thread in threading.enumerate()
+                        if isinstance(thread, InvalidationListener) and thread.client is client]
+
+        cache.get('local_key')
+        self.assertEqual(len(listeners(cache.connections['127.0.0.1:6379:4'])), 1)
+
+        cache.add_node('127.0.0.1:6379:5')
+        self.assertEqual(len(listeners(cache.connections['127.0.0.1:6379:5'])), 1)
+        cache.get('local_key')
+        self.assertEqual(len(listeners(cache.connections['127.0.0.1:6379:5'])), 1)
+
+
+class ConnectionPoolTests(TestCase):
+    def get_cache(self, **options):
+        options.setdefault('DB', 15)
+        return get_cache('redis_cache.cache.RedisCache', LOCATION='127.0.0.1:6379',
+                            OPTIONS=options)
+
+    def test_options(self):
+        cache = self.get_cache(MAX_CONNECTIONS=3, SOCKET_TIMEOUT=5, POOL_PREWARM=2)
+        pool = cache._client.connection_pool
+        self.assertEqual(pool.max_connections, 3)
+        self.assertEqual(pool.connection_kwargs['socket_timeout'], 5)
+
+        stats = cache.pool_stats()['127.0.0.1:6379']
+        self.assertEqual(stats['created'], 2)
+        self.assertEqual(stats['available'], 2)
+
+        # Same options in any order share the pool.
+        self.assertTrue(self.get_cache(POOL_PREWARM=2, SOCKET_TIMEOUT=5,
+                            MAX_CONNECTIONS=3)._client.connection_pool is pool)
+        self.assertFalse(self.get_cache()._client.connection_pool is pool)
+
+        self.assertRaises(ImproperlyConfigured, self.get_cache, MAX_CONNECTIONS='many')
+
+    def test_boolean_options(self):
+        pool = self.get_cache(BLOCKING_POOL='False', SOCKET_KEEPALIVE='no')._client.connection_pool
+        self.assertFalse(pool.blocking)
+        self.assertFalse(pool.connection_kwargs['socket_keepalive'])
+
+        pool = self.get_cache(BLOCKING_POOL='true', SOCKET_KEEPALIVE=True)._client.connection_pool
+        self.assertTrue(pool.blocking)
+        self.assertTrue(pool.connection_kwargs['socket_keepalive'])
+
+        self.assertRaises(ImproperlyConfigured, self.get_cache, BLOCKING_POOL='maybe')
+        self.assertRaises(ImproperlyConfigured, self.get_cache, SOCKET_KEEPALIVE=2)
+
+    def test_max_connections(self):
+        pool = ConnectionPool(max_connections=1, host='127.0.0.1', port=6379)
+        connection = pool.get_connection('GET')
+        self.assertRaises(ConnectionError, pool.get_connection, 'GET')
+
+        pool = ConnectionPool(max_connections=1, blocking=True, blocking_timeout=0.1,
+                                host='127.0.0.1', port=6379)
+        connection = pool.get_connection('GET')
+        self.assertRaises(ConnectionError, pool.get_connection, 'GET')
+
+        threading.Timer(0.1, pool.release, [connection]).start()
+        pool.blocking_timeout = 5
+        self.assertTrue(pool.get_connection('GET') is connection)
+
+        stats = pool.stats()
+        self.assertEqual(stats['waits'], 2)
+        self.assertTrue(stats['wait_time'] >= 0.2)
+
+    def test_health_check(self):
+        cache = self.get_cache(HEALTH_CHECK_INTERVAL=0)
+        cache._client.ping()
+
+        # Kill the pooled connection from another client.
+        connection = cache._client.connection_pool._available_connections[0]
+        Redis(host='127.0.0.1', port=6379).client_kill("%s:%s" % connection._sock.getsockname())
+
+        self.assertTrue(cache._client.ping())
+        self.assertEqual(cache.pool_stats()['127.0.0.1:6379']['health_check_failures'], 1)
+
+    def test_fork(self):
+        cache = self.get_cache(DB=14)
+        cache.set('fork_key', 'parent')
+        sock = cache._client.connection_pool._available_connections[0]._sock
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                cache.set('fork_key', 'child')
+            finally:
+                os._exit(0)
+
+        os.waitpid(pid, 0)
+        self.assertEqual(cache.get('fork_key'), 'child')
+
+        # The connection of the parent has not been broken by the child.
+        self.assertTrue(cache._client.connection_pool._available_connections[0]._sock is sock)
+
+
+class MetricsTests(TestCase):
+    def get_cache(self):
+        cache = get_cache('redis_cache.cache.RedisCache', LOCATION='127.0.0.1:6379',
+                            OPTIONS={'DB': 15, 'METRICS': 'test_metrics'})
+        cache.metrics.reset()
+        return cache
+
+    def test_disabled(self):
+        cache = get_cache('redis_cache.cache.RedisCache', LOCATION='127.0.0.1:6379',
+                            OPTIONS={'DB': 15})
+        self.assertEqual(cache.metrics, None)
+        self.assertFalse('pickle' in cache.__dict__)
+        self.assertFalse('execute_command' in cache._client.__dict__)
+
+    def test_counters(self):
+        cache = self.get_cache()
+        cache.set('metrics_key', 'x' * 100)
+        cache.get('metrics_key')
+        cache.get('metrics_missing')
+        cache.get_many(['metrics_key', 'metrics_missing'])
+        cache.delete_many(['metrics_key'])
+
+        snapshot = cache.metrics.snapshot()
+        shard = snapshot['shards']['127.0.0.1:6379']
+        self.assertEqual((shard['hits'], shard['misses']), (2, 2))
+        self.assertEqual((shard['sets'], shard['deletes']), (1, 1))
+        self.assertEqual(shard['hit_ratio'], 0.5)
+        self.assertEqual(shard['commands']['GET']['count'], 2)
+        self.assertEqual(shard['commands']['MGET']['count'], 1)
+
+        self.assertEqual(snapshot['serialization']['encode']['count'], 1)
+        self.assertEqual(snapshot['sizes']['decode']['count'], 2)
+        self.assertEqual(snapshot['sizes']['decode']['buckets'][1], (256, 2))
+
+    def test_prometheus(self):
+        cache = self.get_cache()
+        cache.get('metrics_missing')
+
+        text = render_prometheus([cache.metrics])
+        self.assertTrue('redis_cache_misses_total{cache="test_metrics",shard="127.0.0.1:6379"} 1\n'
+                            in text)
+        self.assertTrue('redis_cache_command_duration_seconds_bucket{cache="test_metrics",'
+                            'command="GET",le="+Inf",shard="127.0.0.1:6379"} 1\n' in text)
+
+        response = metrics_view(None)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('cache="test_metrics"' in response.content)
+
+
+class StatsViewTests(TestCase):
+    def test_info(self):
+        view = RedisStatsView()
+        info = view.collect_info()['default']
+
+        self.assertEqual(len(info['nodes']), len(cache.get_servers()))
+        for node_info in info['nodes'].values():
+            self.assertTrue('get' in node_info['commandstats'] or
+                            'mget' in node_info['commandstats'])
+
+        self.assertEqual(info['aggregate']['unreachable'], 0)
+        self.assertEqual(info['aggregate']['keys'],
+                            sum(node['keys'] for node in info['nodes'].values()))
+
+    def test_aggregate(self):
+        nodes = {
+            'a:1': {'run_id': 'a', 'keys': 30, 'used_memory': 100, 'keyspace_hits': 3,
+                    'keyspace_misses': 1},
+            'a:2': {'run_id': 'a', 'keys': 10, 'used_memory': 100, 'keyspace_hits': 3,
+                    'keyspace_misses': 1},
+            'b:1': {'error': 'Connection refused'},
+        }
+        total = RedisStatsView().aggregate(nodes)
+        self.assertEqual(total['servers'], 1)
+        self.assertEqual(total['unreachable'], 1)
+        self.assertEqual(total['used_memory'], 100)
+        self.assertEqual(total['hit_rate'], 0.75)
+        self.assertEqual(total['key_skew'], 1.5)
+
+    def test_snapshot(self):
+        view = RedisStatsView()
+        info = view.get_info()
+        self.assertTrue(view.get_info() is info)
+
+        response = RedisStatsJSONView().get(None)
+        self.assertEqual(json.loads(response.content).keys(), ['default'])
+
+        with open(os.path.join(os.path.dirname(stats_app.__file__),
+                    'templates', 'redis_cache', 'stats_include.html')) as template:
+            html = Template(template.read()).render(Context({'info': info}))
+        self.assertTrue('Default' in html)
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        cache.set('batch_int', 1)
+        cache.set('batch_str', 'value')
+        cache.delete_many(['batch_missing', 'batch_new', 'batch_big'])
+
+    def test_batch(self):
+        with cache.batch() as batch:
+            value = batch.get('batch_str')
+            missing = batch.get('batch_missing', 'default')
+            many = batch.get_many(['batch_int', 'batch_str', 'batch_missing'])
+            added = batch.add('batch_str', 'other')
+            batch.set('batch_new', {'a': 1})
+            incr = batch.incr('batch_int', 2)
+            exists = batch.has_key('batch_str')
+            batch.delete('batch_str')
+
+            self.assertFalse(value.ready)
+            self.assertRaises(ValueError, lambda: value.value)
+
+        self.assertEqual(value.value, 'value')
+        self.assertEqual(missing.value, 'default')
+        self.assertEqual(many.value, {'batch_int': 1, 'batch_str': 'value'})
+        self.assertEqual(added.value, False)
+        self.assertEqual(incr.value, 3)
+        self.assertEqual(exists.value, True)
+
+        self.assertEqual(cache.get('batch_new'), {'a': 1})
+        self.assertEqual(cache.get('batch_str'), None)
+
+    def test_errors(self):
+        cache.set('batch_big', 2 ** 64)
+        with cache.batch() as batch:
+            missing = batch.incr('batch_missing')
+            big = batch.incr('batch_big')
+            value = batch.get('batch_int')
+
+        self.assertRaises(ValueError, lambda: missing.value)
+        self.assertEqual(big.value, 2 ** 64 + 1)
+        self.assertEqual(value.value, 1)
+
+        try:
+            with cache.batch() as batch:
+                batch.set('batch_new', 'value')
+                raise ZeroDivisionError
+        except ZeroDivisionError:
+            pass
+        self.assertEqual(cache.get('batch_new'), None)
+
+    def test_unreachable(self):
+        _cache = get_cache('redis_cache.cache.RedisCache', LOCATION='127.0.0.1:1')
+        with _cache.batch() as batch:
+            value = batch.get('batch_str')
+            batch.set('batch_new', 'value')
+            incr = batch.incr('batch_int')
+
+        self.assertRaises(ConnectionError, lambda: value.value)
+        self.assertRaises(ConnectionError, lambda: incr.value)
+
+    def test_round_trips(self):
+        _cache = get_cache('default', OPTIONS={'DB': 15, 'METRICS': 'test_batch'})
+        _cache.metrics.reset()
+
+        with _cache.batch() as batch:
+            batch.set_many(dict(('batch_key%s' % x, x) for x in xrange(20)))
+            values = batch.get_many(['batch_key%s' % x for x in xrange(20)])
+
+        self.assertEqual(values.value, dict(('batch_key%s' % x, x) for x in xrange(20)))
+        for shard in _cache.metrics.snapshot()['shards'].values():
+            self.assertEqual(shard['commands'].keys(), ['PIPELINE'])
+            self.assertEqual(shard['commands']['PIPELINE']['count'], 1)
+
+
+class GetOrSetTests(TestCase):
+    def setUp(self):
+        self.keys = ['getorset%s' % x for x in xrange(4)]
+        cache.delete_many(self.keys)
+        self.release()
+        self.calls = []
+
+    def tearDown(self):
+        self.release()
+
+    def compute(self, value):
+        def default():
+            self.calls.append(value)
+            return value
+        return default
+
+    def hold(self, key):
+        lock_key = cache._lock_key(cache.make_key(key))
+        cache.get_server(lock_key).set(lock_key, 'other')
+
+    def release(self):
+        for key in self.keys:
+            lock_key = cache._lock_key(cache.make_key(key))
+            cache.get_server(lock_key).delete(lock_key)
+
+    def set_xfetch(self, key, value, delta, expires_in):
+        key = cache.make_key(key)
+        raw = _XFETCH_PREFIX + _xfetch_header.pack(delta, time.time() + expires_in) \
+                                                    + str(cache.pickle(value))
+        cache._set(key, raw, 60, cache.get_server(key))
+
+    def test_get_or_set(self):
+        self.assertEqual(cache.get_or_set('getorset0', self.compute(1)), 1)
+        self.assertEqual(cache.get_or_set('getorset0', self.compute(2)), 1)
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(cache.get('getorset0'), 1)
+
+        self.assertEqual(cache.get_or_set('getorset1', 'value'), 'value')
+        self.assertEqual(cache.get('getorset1'), 'value')
+
+        cache.set('getorset2', 'plain')
+        self.assertEqual(cache.get_or_set('getorset2', self.compute(3)), 'plain')
+        self.assertEqual(self.calls, [1])
+
+    def test_locked(self):
+        # Another process computing: the stale value is served.
+        self.set_xfetch('getorset0', 'stale', 0, -1)
+        self.hold('getorset0')
+        self.assertEqual(cache.get_or_set('getorset0', self.compute(1)), 'stale')
+        self.assertEqual(self.calls, [])
+
+        # Without a value, wait for it.
+        self.hold('getorset1')
+        setter = threading.Timer(0.2, lambda: cache.set('getorset1', 'computed'))
+        setter.start()
+        self.assertEqual(cache.get_or_set('getorset1', self.compute(1), lock_timeout=5),
+                                                                            'computed')
+        setter.join()
+        self.assertEqual(self.calls, [])
+
+        # Or compute it when the wait times out.
+        self.hold('getorset2')
+        self.assertEqual(cache.get_or_set('getorset2', self.compute(2), lock_timeout=0.1), 2)
+        self.assertEqual(self.calls, [2])
+
+    def test_xfetch(self):
+        self.set_xfetch('getorset0', 'old', 1, 2)
+        self.assertEqual(cache.get_or_set('getorset0', self.compute('new'), beta=0), 'old')
+        self.assertEqual(cache.get_or_set('getorset0', self.compute('new'), beta=1000), 'new')
+        self.assertEqual(cache.get_or_set('getorset0', self.compute('newer'), beta=1000), 'new')
+        self.assertEqual(self.calls, ['new'])
+
+    def test_stale_reads(self):
+        # Values past their expiration are only served by get_or_set.
+        self.set_xfetch('getorset0', 'stale', 0, -1)
+        self.set_xfetch('getorset1', 'fresh', 0, 60)
+        self.assertEqual(cache.get('getorset0', 'default'), 'default')
+        self.assertFalse(cache.has_key('getorset0'))
+        self.assertEqual(cache.get('getorset1'), 'fresh')
+        self.assertTrue(cache.has_key('getorset1'))
+        self.assertEqual(cache.get_many(['getorset0', 'getorset1']), {'getorset1': 'fresh'})
+
+        with cache.batch() as batch:
+            stale, fresh = batch.get('getorset0'), batch.get('getorset1')
+            exists = batch.has_key('getorset0'), batch.has_key('getorset1')
+        self.assertEqual((stale.value, fresh.value), (None, 'fresh'))
+        self.assertEqual([result.value for result in exists], [False, True])
+
+    def test_get_or_set_many(self):
+        def default(keys):
+            self.calls.append(sorted(keys))
+            return dict((key, key.upper()) for key in keys if key != 'getorset3')
+
+        cache.set('getorset0', 'cached')
+        self.set_xfetch('getorset1', 'stale', 0, -1)
+        self.hold('getorset1')
+
+        values = cache.get_or_set_many(self.keys, default)
+        self.assertEqual(values, {'getorset0': 'cached', 'getorset1': 'stale',
+                                    'getorset2': 'GETORSET2'})
+        self.assertEqual(self.calls, [['getorset2', 'getorset3']])
+        # Plain reads do not serve stale values.
+        self.assertEqual(cache.get_many(self.keys), {'getorset0': 'cached',
+                                                        'getorset2': 'GETORSET2'})
+
+        # Locks are released.
+        lock_key = cache._lock_key(cache.make_key('getorset2'))
+        self.assertFalse(cache.get_server(lock_key).exists(lock_key))
+
+
+class IncrVersionTests(TestCase):
+    def setUp(self):
+        self.keys = ['version%s' % x for x in xrange(20)]
+        for version in (1, 2, 3):
+            cache.delete_many(self.keys + ['version_missing'], version=version)
+
+    def test_incr_version(self):
+        value = {'data': 'x' * 10000}
+        cache.set('version0', value, timeout=100)
+        self.assertEqual(cache.incr_version('version0'), 2)
+        self.assertEqual(cache.get('version0'), None)
+        self.assertEqual(cache.get('version0', version=2), value)
+
+        key = cache.make_key('version0', version=2)
+        self.assertTrue(90 < cache.get_server(key).ttl(key) <= 100)
+
+        self.assertRaises(ValueError, cache.incr_version, 'version_missing')
+
+    def test_incr_version_many(self):
+        data = dict((key, index) for index, key in enumerate(self.keys))
+        cache.set_many(data)
+
+        moved = cache.incr_version_many(self.keys + ['version_missing'], delta=2)
+        self.assertEqual(moved, self.keys)
+        self.assertEqual(cache.get_many(self.keys), {})
+        self.assertEqual(cache.get_many(self.keys, version=3), data)
+
+    def test_server_side(self):
+        _cache = get_cache('default', OPTIONS={'DB': 15, 'METRICS': 'test_incr_version'})
+        _cache.set_many(dict((key, key) for key in self.keys))
+        _cache.metrics.reset()
+
+        _cache.incr_version_many(self.keys)
+        self.assertEqual(_cache.metrics.snapshot()['serialization'], {})
+        for shard in _cache.metrics.snapshot()['shards'].values():
+            self.assertEqual(shard['commands'].keys(), ['PIPELINE'])
+            self.assertTrue(shard['commands']['PIPELINE']['count'] <= 3)
+        _cache.delete_many(self.keys, version=2)
+
+
+class ReplicaTests(TestCase):
+    def get_cache(self, replicas, **options):
+        options.update({'DB': 15, 'REPLICAS': replicas})
+        return get_cache('redis_cache.cache.RedisCache', LOCATION='127.0.0.1:6379',
+                                                            OPTIONS=options)
+
+    def test_read_routing(self):
+        # The same server with another name, to tell reads apart.
+        _cache = self.get_cache(['localhost:6379'], METRICS='test_replicas')
+        _cache.metrics.reset()
+
+        _cache.set('replica_key', 'value')
+        self.assertEqual(_cache.get('replica_key'), 'value')
+        self.assertEqual(_cache.get_many(['replica_key']), {'replica_key': 'value'})
+        self.assertTrue(_cache.has_key('replica_key'))
+        self.assertEqual(_cache.keys('replica_*'), ['replica_key'])
+        _cache.delete('replica_key')
+        _cache.get_read_server('replica_key')._check_thread.join()
+
+        shards = _cache.metrics.snapshot()['shards']
+        self.assertEqual(sorted(shards['127.0.0.1:6379']['commands']), ['DEL', 'SET'])
+        self.assertEqual(sorted(shards['localhost:6379']['commands']),
+                                ['GET', 'GETRANGE', 'INFO', 'MGET', 'SCAN'])
+
+    def test_fallback(self):
+        _cache = self.get_cache(['127.0.0.1:1'])
+        _cache.set('replica_key', 'value')
+        self.assertEqual(_cache.get('replica_key'), 'value')
+
+        replica, = _cache.get_read_server('replica_key').replicas
+        self.assertTrue(replica.down_until > time.time())
+        self.assertEqual(_cache.get_read_server('replica_key').choose(), None)
+        _cache.delete('replica_key')
+
+    def test_lagging(self):
+        info = {'role': 'slave', 'master_link_status': 'up',
+                'master_sync_in_progress': 0, 'master_last_io_seconds_ago': 1}
+        self.assertFalse(is_lagging(info, 10))
+        self.assertFalse(is_lagging({'role': 'master'}, 10))
+        self.assertTrue(is_lagging(dict(info, master_last_io_seconds_ago=11), 10))
+        self.assertTrue(is_lagging(dict(info, master_link_status='down'), 10))
+        self.assertTrue(is_lagging(dict(info, master_sync_in_progress=1), 10))
+
+    def test_background_check(self):
+        client = self.get_cache(['localhost:6379']).get_read_server('replica_key')
+        replica, = client.replicas
+        checked = threading.Event()
+        def check():
+            checked.wait(5)
+            replica.lagging = True
+        client.check = check
+
+        start = time.time()
+        self.assertEqual(client.choose(), replica)
+        self.assertTrue(time.time() - start < 1)
+
+        checked.set()
+        client._check_thread.join()
+        self.assertEqual(client.choose(), None)
+
+    def test_policies(self):
+        local = Replica('local', Redis(host='localhost'))
+        remote = Replica('remote', Redis(host='10.255.255.1'))
+        replicas = [remote, local]
+
+        policy = RoundRobinPolicy()
+        self.assertEqual([policy.choose(replicas) for x in xrange(4)],
+                            [remote, local, remote, local])
+        policy = LocalFirstPolicy()
+        self.assertEqual([policy.choose(replicas) for x in xrange(2)], [local, local])
+        self.assertEqual(policy.choose([remote]), remote)
+
+        socket_replica = Replica('socket', Redis(unix_socket_path='/tmp/redis.sock'))
+        self.assertTrue(socket_replica.local)
+        self.assertFalse(remote.local)
+
+        connection = remote.client.connection_pool.get_connection('GET')
+        try:
+            self.assertEqual(LeastOutstandingPolicy().choose(replicas), local)
+        finally:
+            remote.client.connection_pool.release(connection)
+
+    def test_sharded(self):
+        _cache = get_cache('redis_cache.cache.ShardedRedisCache',
+                            LOCATION=['127.0.0.1:6379:1', '127.0.0.1:6379:2'],
+                            OPTIONS={'REPLICAS': {'127.0.0.1:6379:1': ['localhost:6379:1']}})
+        _cache.set_many({'replica_a': 1, 'replica_b': 2, 'replica_c': 3})
+        self.assertEqual(_cache.get_many(['replica_a', 'replica_b', 'replica_c']),
+                            {'replica_a': 1, 'replica_b': 2, 'replica_c': 3})
+        self.assertTrue(_cache.has_key('replica_a'))
+        self.assertEqual(sorted(_cache.keys('replica_*')), ['replica_a', 'replica_b', 'replica_c'])
+        self.assertTrue(isinstance(_cache.read_connections['127.0.0.1:6379:1'], ReplicaRedis))
+        _cache.delete_many(['replica_a', 'replica_b', 'replica_c'])
+
+        self.assertRaises(ImproperlyConfigured, get_cache, 'redis_cache.cache.ShardedRedisCache',
+                            LOCATION=['127.0.0.1:6379:1'], OPTIONS={'REPLICAS': ['127.0.0.1:6380']})
+
+
+class CircuitBreakerTests(TestCase):
+    def test_breaker(self):
+        breaker = CircuitBreaker('test', min_calls=4, failure_rate=0.5, cooldown=0.1,
+                                    slow_call=1)
+        for failed in (False, True, False):
+            self.assertTrue(breaker.allow())
+            breaker.record(0.001, failed)
+        self.assertEqual(breaker.state, 'closed')
+
+        breaker.record(2, False)
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow())
+
+        # Half-open: a single probe, failing.
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record(0.001, True)
+        self.assertEqual(breaker.state, 'open')
+
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow())
+        breaker.record(0.001, False)
+        self.assertEqual(breaker.state, 'closed')
+        self.assertTrue(breaker.allow())
+
+        snapshot = breaker.snapshot()
+        self.assertEqual((snapshot['opened'], snapshot['rejected'], snapshot['calls']),
+                            (2, 2, 0))
+
+    def test_fail_open(self):
+        _cache = get_cache('redis_cache.cache.RedisCache', LOCATION='127.0.0.1:2',
+                            OPTIONS={'CIRCUIT_BREAKER': True, 'CIRCUIT_BREAKER_MIN_CALLS': 3})
+        self.assertEqual(_cache.get('key', 'default'), 'default')
+        self.assertFalse(_cache.set('key', 'value'))
+        self.assertEqual(_cache.get_many(['key', 'other']), {})
+        _cache.set_many({'key': 'value'})
+        _cache.delete('key')
+        self.assertFalse(_cache.has_key('key'))
+        self.assertRaises(ValueError, _cache.incr, 'key')
+        self.assertEqual(_cache.get_or_set('key', 'value', lock_timeout=5), 'value')
+
+        breaker = _cache.get_server('key').breaker
+        self.assertEqual(breaker.state, 'open')
+        self.assertTrue(breaker.rejected > 0)
+        self.assertRaises(CircuitOpenError, _cache.get_server('key').info)
+
+    def test_sharded(self):
+        nodes = ['127.0.0.1:6379:1', '127.0.0.1:2:1']
+        _cache = get_cache('redis_cache.cache.ShardedRedisCache', LOCATION=nodes,
+                                OPTIONS={'CIRCUIT_BREAKER': True,
+                                            'CIRCUIT_BREAKER_MIN_CALLS': 2})
+        data = dict(('breaker%s' % x, x) for x in xrange(20))
+        _cache.set_many(data)
+
+        up = set(key for key in data
+                    if _cache.get_server_name(_cache.make_key(key)) == nodes[0])
+        self.assertTrue(up and up != set(data))
+        self.assertEqual(_cache.get_many(data.keys()), dict((key, data[key]) for key in up))
+        _cache.delete_many(data.keys())
+
+        info = RedisStatsView().get_node_info(_cache.connections[nodes[1]])
+        self.assertTrue('error' in info)
+        self.assertEqual(info['circuit']['state'], 'open')
+        nodes_info = {nodes[0]: {'run_id': 'a', 'keys': 0}, nodes[1]: info}
+        self.assertEqual(RedisStatsView().aggregate(nodes_info)['bypassed'], 1)
+
+
+class HotKeysTests(TestCase):
+    def test_space_saving(self):
+        counters = SpaceSaving(10)
+        stream = ['hot'] * 100 + ['warm'] * 50 + ['cold%s' % x for x in xrange(200)]
+        random.Random(0).shuffle(stream)
+        for item in stream:
+            counters.add(item)
+
+        self.assertEqual(len(counters.counters), 10)
+        (hot, hot_count, hot_error), (warm, warm_count, warm_error) = counters.top(2)
+        self.assertEqual((hot, warm), ('hot', 'warm'))
+        self.assertTrue(hot_count - hot_error <= 100 <= hot_count)
+        self.assertTrue(warm_count - warm_error <= 50 <= warm_count)
+
+    def test_hot_keys(self):
+        _cache = get_cache('default', OPTIONS={'DB': 15, 'HOT_KEYS': 'test_hot_keys',
+                                                'HOT_KEYS_SAMPLE_RATE': 1})
+        _cache.hot_keys.reset()
+        for x in xrange(20):
+            _cache.get('hot_key')
+        _cache.get_many(['hot_key', 'warm_key'])
+        _cache.set('warm_key', 1)
+
+        hot, warm = _cache.hot_keys.top(2)
+        key = _cache.make_key('hot_key')
+        self.assertEqual(hot['key'], str(key))
+        self.assertEqual(hot['node'], _cache.get_server_name(key))
+        self.assertEqual((hot['accesses'], warm['accesses']), (21, 2))
+        self.assertTrue(hot['rate'] > 0)
+        self.assertEqual(_cache.hot_keys.top(node='unknown'), [])
+        self.assertTrue(get_cache('default', OPTIONS={'HOT_KEYS': 'test_hot_keys'})
+                            .hot_keys is _cache.hot_keys)
+
+        view = RedisStatsView()
+        view.caches = SortedDict([('hot', _cache)])
+        info = view.collect_info()['hot']
+        self.assertEqual(info['hot_keys'][0]['key'], str(key))
+        _cache.delete('warm_key')
+
+    def test_window(self):
+        hot_keys = HotKeys('test', sample_rate=0.5, window=0.1)
+        hot_keys.record([('node', 'a')] * 3)
+        time.sleep(0.1)
+        hot_keys.record([('node', 'b')])
+        self.assertEqual([(hot['key'], hot['accesses']) for hot in hot_keys.top()],
+                            [('a', 6), ('b', 2)])
+
+        time.sleep(0.1)
+        hot_keys.record([('node', 'b')])
+        self.assertEqual([(hot['key'], hot['accesses']) for hot in hot_keys.top()],
+                            [('b', 4)])
+
+
+class HotKeyReplicationTests(TestCase):
+    nodes = ['127.0.0.1:6379:7', '127.0.0.1:6379:8', '127.0.0.1:6379:9']
+
+    def get_cache(self, **options):
+        _cache = get_cache('redis_cache.cache.ShardedRedisCache', LOCATION=self.nodes,
+                                OPTIONS=options)
+        _cache.clear()
+        return _cache
+
+    def copies(self, _cache, key):
+        # The node of the key holds the marker of the copies.
+        key = _cache.make_key(key)
+        return [name for name in self.nodes if name != _cache.get_server_name(key)
+                    and _cache.connections[name].exists(_cache._copy_key(key))]
+
+    def test_patterns(self):
+        _cache = self.get_cache(HOT_KEY_PATTERNS=['hot:*'], HOT_KEY_COPIES=3)
+        _cache.set('hot:a', 'value')
+        _cache.set('cold', 'value')
+        key = _cache.make_key('hot:a')
+        nodes = _cache._hot_nodes(key)
+        self.assertEqual(len(nodes), 3)
+        self.assertEqual(nodes[0], _cache.get_server_name(key))
+        self.assertEqual(self.copies(_cache, 'hot:a'), sorted(nodes[1:]))
+        self.assertEqual(self.copies(_cache, 'cold'), [])
+        self.assertEqual(sorted(_cache.keys('*')), ['cold', 'hot:a'])
+
+        # Reads are spread over the copies.
+        reads = dict((name, 0) for name in self.nodes)
+        mget = dict((name, _cache.connections[name].mget) for name in self.nodes)
+        for name in self.nodes:
+            def counted(keys, name=name):
+                reads[name] += 1
+                return mget[name](keys)
+            _cache.read_connections[name] = Redis(connection_pool=
+                                            _cache.connections[name].connection_pool)
+            _cache.read_connections[name].mget = counted
+        for x in xrange(60):
+            self.assertEqual(_cache.get('hot:a'), 'value')
+        self.assertTrue(all(reads[name] > 0 for name in nodes))
+        self.assertEqual(_cache.get_many(['hot:a', 'cold', 'missing']),
+                            {'hot:a': 'value', 'cold': 'value'})
+
+        _cache.set('hot:a', 'new')
+        self.assertEqual(set(_cache.get('hot:a') for x in xrange(20)), set(['new']))
+        _cache.delete('hot:a')
+        self.assertEqual(self.copies(_cache, 'hot:a'), [])
+        self.assertEqual(_cache.get('hot:a', 'default'), 'default')
+
+    def test_consistency(self):
+        _cache = self.get_cache(HOT_KEY_PATTERNS='counter', HOT_KEY_COPIES=2)
+        _cache.set('counter', 1)
+        self.assertEqual(len(self.copies(_cache, 'counter')), 1)
+        _cache.incr('counter')
+        self.assertEqual(self.copies(_cache, 'counter'), [])
+        self.assertEqual(set(_cache.get('counter') for x in xrange(20)), set([2]))
+
+        # Missing copies are made again on reads.
+        self.assertEqual(len(self.copies(_cache, 'counter')), 1)
+        with _cache.batch() as batch:
+            batch.delete('counter')
+        self.assertEqual(self.copies(_cache, 'counter'), [])
+
+        self.assertTrue(_cache.add('counter', 5))
+        self.assertEqual(self.copies(_cache, 'counter'), [])
+        _cache.set('counter', 6)
+        _cache.incr_version('counter')
+        self.assertEqual(self.copies(_cache, 'counter'), [])
+        self.assertEqual(_cache.get('counter', version=2), 6)
+
+        _cache.set('counter', 7)
+        _cache.delete_pattern('count*')
+        self.assertEqual(self.copies(_cache, 'counter'), [])
+
+    def test_measured(self):
+        _cache = self.get_cache(HOT_KEYS='test_hot_copies', HOT_KEYS_SAMPLE_RATE=1,
+                                    HOT_KEY_MIN_RATE=10, HOT_KEY_COPIES=2)
+        _cache.hot_keys.reset()
+        _cache.hot_keys_refresh = 0
+        _cache.set('measured', 1)
+        _cache.set('other', 1)
+        self.assertEqual(self.copies(_cache, 'measured'), [])
+        for x in xrange(20):
+            _cache.get('measured')
+        _cache.set('measured', 2)
+        _cache.set('other', 2)
+        self.assertEqual(len(self.copies(_cache, 'measured')), 1)
+        self.assertEqual(self.copies(_cache, 'other'), [])
+
+    def test_measured_processes(self):
+        # Independent counters, as in two processes.
+        caches = [self.get_cache(HOT_KEYS=name, HOT_KEYS_SAMPLE_RATE=1, HOT_KEY_MIN_RATE=10,
+                                    HOT_KEY_COPIES=3) for name in ('test_hot_a', 'test_hot_b')]
+        for _cache in caches:
+            _cache.hot_keys.reset()
+            _cache.hot_keys_refresh = 0
+        a, b = caches
+
+        for x in xrange(30):
+            a.get('k')
+        a.set('k', 'v1')
+        self.assertEqual(len(self.copies(a, 'k')), 2)
+        self.assertEqual(b._hot_nodes(b.make_key('k')), None)
+
+        b.set('k', 'v2')
+        self.assertEqual(self.copies(a, 'k'), [])
+        self.assertEqual(set(a.get('k') for x in xrange(30)), set(['v2']))
+        b.delete('k')
+        self.assertEqual(self.copies(a, 'k'), [])
+        self.assertEqual(set(a.get('k') for x in xrange(30)), set([None]))
+
+        # Dropped as well once the key is no longer hot in this process.
+        a.set('k', 'v3')
+        self.assertEqual(len(self.copies(a, 'k')), 2)
+        a.hot_keys.reset()
+        a.delete('k')
+        self.assertEqual(self.copies(a, 'k'), [])
+
+    def test_round_trips(self):
+        def commands(_cache):
+            counts = dict((name, sum(command['count'] for command in shard['commands'].values()))
+                            for name, shard in _cache.metrics.snapshot()['shards'].items())
+            _cache.metrics.reset()
+            return counts
+
+        # Copies are written with a pipeline per node, after the ones of the keys.
+        _cache = self.get_cache(HOT_KEY_PATTERNS=['hot:*'], METRICS='test_hot_patterns')
+        _cache.metrics.reset()
+        _cache.set_many(dict(('hot:%s' % x, x) for x in xrange(30)))
+        self.assertEqual(commands(_cache), dict((name, 2) for name in self.nodes))
+        self.assertEqual(len(self.copies(_cache, 'hot:1')), 2)
+        _cache.metrics.reset()
+        _cache.delete_many(['hot:%s' % x for x in xrange(30)])
+        self.assertEqual(commands(_cache), dict((name, 2) for name in self.nodes))
+        self.assertEqual(self.copies(_cache, 'hot:1'), [])
+
+        # Writes of keys without copies stay in their node.
+        _cache = self.get_cache(HOT_KEYS='test_hot_trips', HOT_KEYS_SAMPLE_RATE=1,
+                                    HOT_KEY_MIN_RATE=10, METRICS='test_hot_trips')
+        _cache.metrics.reset()
+        _cache.set('key', 1)
+        _cache.incr('key')
+        _cache.delete('key')
+        self.assertEqual(commands(_cache), {_cache.get_server_name(_cache.make_key('key')): 3})
+
+    def test_options(self):
+        self.assertRaises(ImproperlyConfigured, get_cache, 'redis_cache.cache.ShardedRedisCache',
+                            LOCATION=self.nodes, OPTIONS={'HOT_KEY_MIN_RATE': 10})
+        self.assertRaises(ImproperlyConfigured, get_cache, 'redis_cache.cache.ShardedRedisCache',
+                            LOCATION=self.nodes, OPTIONS={'HOT_KEY_PATTERNS': ['a'],
+                                                            'HOT_KEY_COPIES': 'many'})
+
+
+class SessionTests(TestCase):
+    def test_save_and_load(self):
+        session = SessionStore()
+        session['user'] = 1
+        session['cart'] = [1, 2]
+        session.save()
+        session_key = session.session_key
+        self.assertTrue(session.exists(session_key))
+
+        key = session.cache_key
+        client = cache.get_server(key)
+        self.assertEqual(len(client.hgetall(key)), 3)
+        self.assertTrue(0 < client.ttl(key) <= session.get_expiry_age())
+
+        session = SessionStore(session_key)
+        self.assertEqual(session['user'], 1)
+        self.assertEqual(session['cart'], [1, 2])
+
+        # Only changed fields are written.
+        session['cart'].append(3)
+        session.modified = True
+        client.hset(key, 'user', cache.pickle(2))
+        session.save()
+        session = SessionStore(session_key)
+        self.assertEqual(session['cart'], [1, 2, 3])
+        self.assertEqual(session['user'], 2)
+
+        del session['user']
+        session.save()
+        self.assertEqual(SessionStore(session_key).items(), [('cart', [1, 2, 3])])
+
+        session.delete()
+        self.assertFalse(session.exists(session_key))
+        self.assertEqual(SessionStore(session_key).load(), {})
+
+    def test_create(self):
+        session = SessionStore()
+        session.create()
+        session_key = session.session_key
+        self.assertTrue(session.exists(session_key))
+        self.assertEqual(SessionStore(session_key).load(), {})
+
+        session['user'] = 1
+        session.cycle_key()
+        self.assertNotEqual(session.session_key, session_key)
+        self.assertFalse(session.exists(session_key))
+        session.save()
+        self.assertEqual(SessionStore(session.session_key)['user'], 1)
+
+        session.set_expiry(-1)
+        session.save()
+        self.assertFalse(session.exists(session.session_key))
+
+    def test_expired(self):
+        session = SessionStore()
+        session['user'] = 1
+        session['cart'] = [1]
+        session.save()
+        loaded = SessionStore(session.session_key)
+        loaded['cart']
+        session.delete()
+
+        # Saved after it expired: not a valid session anymore.
+        loaded['cart'] = [2]
+        loaded.save()
+        self.assertEqual(SessionStore(session.session_key).load(), {})
+
+
+class ParallelMapTests(TestCase):
+    def test_results(self):
+        self.assertEqual(parallel_map(lambda x, y: x * y, [(x, 2) for x in xrange(10)]),
+                            [x * 2 for x in xrange(10)])
+        self.assertEqual(parallel_map(lambda x: x, []), [])
+
+    def test_nested(self):
+        # More concurrent calls than workers run in the calling threads.
+        pool, util._pool = util._pool, util._WorkerPool(max_workers=2)
+        try:
+            inner = lambda x: parallel_map(lambda y: x + y, [(y,) for y in xrange(3)])
+            self.assertEqual(parallel_map(inner, [(x,) for x in xrange(4)]),
+                                [[x, x + 1, x + 2] for x in xrange(4)])
+        finally:
+            util._pool = pool
+
+    def test_errors(self):
+        def fail(x):
+            if x == 2:
+                raise ValueError(x)
+            return x
+
+        try:
+            parallel_map(fail, [(x,) for x in xrange(4)])
+        except ValueError:
+            frames = traceback.extract_tb(sys.exc_info()[2])
+            self.assertEqual(frames[-1][2], 'fail')
+        else:
+            self.fail("ValueError not raised")
+
+    def test_base_exceptions(self):
+        def interrupt(x):
+            if x == 2:
+                raise KeyboardInterrupt
+            return x
+
+        outcome = []
+        def run():
+            try:
+                parallel_map(interrupt, [(x,) for x in xrange(4)])
+            except KeyboardInterrupt:
+                outcome.append('raised')
+        caller = threading.Thread(target=run)
+        caller.daemon = True
+        caller.start()
+        caller.join(5)
+        self.assertEqual(outcome, ['raised'])
+        self.assertEqual(parallel_map(interrupt, [(0,), (1,)]), [0, 1])
+
+    def test_fork(self):
+        parallel_map(lambda x: x, [(1,), (2,)])
+        pid = os.fork()
+        if not pid:
+            ok = False
+            try:
+                ok = parallel_map(lambda x: x, [(1,), (2,)]) == [1, 2]
+            finally:
+                os._exit(int(not ok))
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+
+
+class ShardMigrationTests(TestCase):
+    def get_cache(self, dbs):
+        return get_cache('redis_cache.cache.ShardedRedisCache',
+                            LOCATION=['127.0.0.1:6379:%s' % db for db in dbs])
+
+    def setUp(self):
+        self.cache = self.get_cache([3, 4])
+        self.cache.clear()
+        self.get_cache([5]).clear()
+
+        self.data = dict(('migrate%s' % x, x) for x in xrange(200))
+        self.cache.set_many(self.data, timeout=60)
+
+    def test_add_remove_node(self):
+        self.cache.add_node('127.0.0.1:6379:5')
+        self.assertEqual(len(self.cache.ring.nodes), 3)
+
+        res = self.cache.get_many(self.data.keys())
+        self.assertTrue(0 < len(res) < len(self.data))
+
+        self.cache.remove_node('127.0.0.1:6379:5')
+        self.assertEqual(self.cache.get_many(self.data.keys()), self.data)
+
+    def test_concurrent_remove_node(self):
+        self.cache.add_node('127.0.0.1:6379:5')
+        keys = self.data.keys()[:20]
+        errors = []
+        stop = threading.Event()
+
+        def lookup():
+            while not stop.is_set():
+                try:
+                    for key in keys:
+                        self.cache.get_server(self.cache.make_key(key))
+                    self.cache.get_many(keys)
+                except Exception as e:
+                    errors.append(e)
+                    return
+
+        threads = [threading.Thread(target=lookup) for x in xrange(2)]
+        for thread in threads:
+            thread.start()
+        for x in xrange(50):
+            self.cache.remove_node('127.0.0.1:6379:5')
+            self.cache.add_node('127.0.0.1:6379:5')
+        stop.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.cache.get_servers()), 3)
+
+    def test_migrate_keys(self):
+        new_cache = self.get_cache([3, 4, 5])
+        moved = migrate_keys(self.cache, new_cache, itersize=50)
+
+        self.assertTrue(0 < moved < len(self.data))
+        self.assertEqual(new_cache.get_many(self.data.keys()), self.data)
+
+        for name, client in new_cache.connections.items():
+            for key in client.keys():
+                self.assertEqual(new_cache.get_server_name(key), name)
+                self.assertTrue(0 < client.ttl(key) <= 60)
+
+    def test_failed_restore(self):
+        new_cache = self.get_cache([3, 4, 5])
+        target = new_cache.connections['127.0.0.1:6379:5']
+        pipeline = target.pipeline
+
+        def corrupt_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            restore = pipe.restore
+            pipe.restore = lambda key, ttl, data: restore(key, ttl, 'corrupt')
+            return pipe
+        target.pipeline = corrupt_pipeline
+
+        failed = []
+        moved = migrate_keys(self.cache, new_cache, itersize=50, failed=failed)
+        self.assertEqual(target.dbsize(), 0)
+        self.assertTrue(failed)
+        self.assertEqual(moved, 0)
+
+        # Left in the old node.
+        self.assertEqual(self.cache.get_many(self.data.keys()), self.data)
+
+    def test_sharding_strategy(self):
+        for strategy in ('JumpHash', 'RendezvousHash'):
+            cache = get_cache('redis_cache.cache.ShardedRedisCache',
+                        LOCATION=[('127.0.0.1:6379:3', 2), '127.0.0.1:6379:4'],
+                        OPTIONS={'SHARDING_STRATEGY': 'redis_cache.sharding.' + strategy})
+            self.assertEqual(cache.ring.weights, {'127.0.0.1:6379:3': 2})
+
+            cache.set_many(self.data)
+            self.assertEqual(cache.get_many(self.data.keys()), self.data)
+
+    def test_weights(self):
+        self.assertRaises(ImproperlyConfigured, get_cache, 'redis_cache.cache.ShardedRedisCache',
+                            LOCATION=[('127.0.0.1:6379:3', 0.5), '127.0.0.1:6379:4'])
+        self.assertRaises(ValueError, self.cache.add_node, '127.0.0.1:6379:5', 1.5)
+        self.assertFalse('127.0.0.1:6379:5' in self.cache.connections)
+
+        command = MigrateCommand()
+        self.assertEqual(command._parse_locations(['127.0.0.1:6379:3=2', '127.0.0.1:6379:4']),
+                            [('127.0.0.1:6379:3', 2), '127.0.0.1:6379:4'])
+        self.assertRaises(CommandError, command._parse_locations, ['127.0.0.1:6379:3=heavy'])
+
+    def test_remove_node_migration(self):
+        new_cache = self.get_cache([4])
+        migrate_keys(self.cache, new_cache, itersize=50)
+
+        self.assertEqual(new_cache.get_many(self.data.keys()), self.data)
+        self.assertEqual(self.cache.connections['127.0.0.1:6379:3'].dbsize(), 0)
+
+
+class ClusterTests(TestCase):
+    def test_key_slot(self):
+        self.assertEqual(key_slot('123456789'), 12739)
+        self.assertEqual(key_slot('foo{bar}'), key_slot('bar'))
+        self.assertEqual(key_slot('foo{}{bar}'), key_slot('foo{}{bar}'))
+        self.assertNotEqual(key_slot('foo{}{bar}'), key_slot('bar'))
+
+    def test_redirection(self):
+        if not isinstance(cache, ClusterRedisCache):
+            return
+
+        keys = ['moved%s' % x for x in xrange(20)]
+        cache.set_many(dict((key, key) for key in keys))
+        self.assertEqual(cache.get('moved1'), 'moved1')
+
+        # Point every slot to the same node, as in a stale slots map.
+        cache._slots = [cache.nodes[0]] * len(cache._slots)
+        cache._last_refresh = 0
+
+        self.assertEqual(cache.get('moved2'), 'moved2')
+        self.assertEqual(cache.get_many(keys), dict((key, key) for key in keys))
+        self.assertTrue(len(set(cache._slots)) > 1)